@@ -11,18 +11,21 @@ from .core import detector, generator, executor, validator
 
 # Re-export commonly used functions and classes
 from .core.detector import get_os, get_shell, get_system_directory
+from .core.command import Command
 from .core.generator import CommandGenerator
 from .core.executor import CommandExecutor
-from .core.validator import is_command_safe, validate_command_type
+from .core.validator import is_command_safe, validate_command, validate_command_type
 
 # Export public API
 __all__ = [
     'get_os',
     'get_shell',
     'get_system_directory',
+    'Command',
     'CommandGenerator',
     'CommandExecutor',
     'is_command_safe',
+    'validate_command',
     'validate_command_type',
     'detector',
     'generator',
@@ -9,11 +9,13 @@ import sys
 from typing import List, Optional
 
 from . import __version__
-from .constants import CommandType, OS
+from .constants import OS
 from .core.detector import get_os, get_shell
+from .core.command import MODE_EVAL
 from .core.executor import CommandExecutor
-from .core.generator import CommandGenerator
-from .core.validator import is_command_safe, validate_command_type
+from .core.fanout import parse_fan_out, plan_fan_out, run_fan_out
+from .core.generator import DEFAULT_CANDIDATES, MIN_CONFIDENCE, CommandGenerator
+from .core.undo import UndoJournal
 
 # ANSI color codes for terminal output
 class Colors:
@@ -62,12 +64,227 @@ def print_help():
     print(f"  {Colors.OKCYAN}hcmd list files in current directory{Colors.ENDC}")
     print(f"  {Colors.OKCYAN}hcmd create a file named test.txt{Colors.ENDC}")
     print(f"  {Colors.OKCYAN}hcmd 'delete file.txt' --dry-run{Colors.ENDC}")
+    print(f"  {Colors.OKCYAN}hcmd transpile runbook.txt --target linux{Colors.ENDC}")
+    print(f"  {Colors.OKCYAN}hcmd list files in each of api, web and worker{Colors.ENDC}")
+    print(f"  {Colors.OKCYAN}hcmd undo{Colors.ENDC}       Reverse the last delete, move, copy or create")
     print("\nOptions:")
     print(f"  {Colors.OKGREEN}--dry-run{Colors.ENDC}    Show the command without executing it")
-    print(f"  {Colors.OKGREEN}--json{Colors.ENDC}       Output in JSON format")
+    print(f"  {Colors.OKGREEN}--json{Colors.ENDC}       Output in JSON format, with alternative interpretations")
+    print(f"  {Colors.OKGREEN}--min-confidence N{Colors.ENDC}  Refuse interpretations scored below N (default {MIN_CONFIDENCE})")
+    print(f"  {Colors.OKGREEN}--preview-server{Colors.ENDC}  Serve as-you-type translations for shell integration")
+    print(f"  {Colors.OKGREEN}--target T{Colors.ENDC}   With 'transpile FILE': linux, darwin, windows or all")
+    print(f"  {Colors.OKGREEN}--output PATH{Colors.ENDC}  With 'transpile FILE': script to write (stdout by default)")
     print(f"  {Colors.OKGREEN}--version{Colors.ENDC}    Show version and exit")
     print(f"  {Colors.OKGREEN}--help{Colors.ENDC}       Show this help message and exit")
 
+def print_progress(event: dict) -> None:
+    """Render an event from a native engine: matches on stdout, progress on one stderr line."""
+    if event.get('event') == 'match':
+        if 'line' in event:
+            print(f"{Colors.OKBLUE}{event['path']}{Colors.ENDC}:{event['line']}:{event['text']}", flush=True)
+        else:
+            print(event['path'], flush=True)
+        return
+    if event.get('event') == 'line':
+        if 'line' in event:
+            print(f"{Colors.OKBLUE}{event['line']}{Colors.ENDC}:{event['text']}", flush=True)
+        else:
+            print(event['text'], flush=True)
+        return
+    if event.get('event') == 'entry':
+        print(f"{format_size(event['bytes']):>10}  {event['path']}{os.sep if event.get('type') == 'd' else ''}")
+        return
+    if event.get('event') == 'process':
+        print(f"{event['pid']:>7}  {event['user'] or '?':<10} {event['cpu_percent']:>5.1f}% "
+              f"{format_size(event['rss']):>10}  {format_command_line(event)}")
+        return
+    if event.get('event') == 'socket':
+        owner = f"{event['name']} ({event['pid']})" if event['pid'] is not None else '? (not permitted)'
+        print(f"{event['proto']:<5} {event['address']}:{event['port']:<6} {event['state'] or '':<12} {owner}")
+        return
+    if event.get('event') == 'group':
+        print(f"{Colors.OKBLUE}{len(event['paths'])} x {format_size(event['size'])}{Colors.ENDC} "
+              f"({format_size(event['wasted'])} reclaimable)")
+        for path in event['paths']:
+            print(f"  {path}")
+        return
+    if not sys.stderr.isatty():
+        return
+    if event.get('event') == 'scan':
+        line = f"Scanning: {event['files_total']} files, {event['bytes_total']} bytes"
+    else:
+        total = event.get('bytes_total') or 0
+        percent = (100 * event.get('bytes_done', 0) // total) if total else 100
+        line = (f"{event.get('event', 'progress').capitalize()}: "
+                f"{event.get('files_done', 0)}/{event.get('files_total', 0)} files ({percent}%)")
+    end = '\n' if event.get('event') == 'done' else ''
+    print(f"\r{Colors.OKCYAN}{line}{Colors.ENDC}\033[K", end=end, file=sys.stderr, flush=True)
+
+def format_size(num_bytes: int) -> str:
+    """Format a byte count for humans (e.g. 1.5 GB)."""
+    size = float(num_bytes)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{num_bytes} B"
+
+def format_command_line(process: dict, width: int = 100) -> str:
+    """A process's command line on one line, shortened to ``width`` characters."""
+    line = ' '.join((process['cmdline'] or process['name']).split())
+    return line if len(line) <= width else line[:width - 3] + '...'
+
+def print_preview(preview: dict) -> None:
+    """Print the impact preview of a native command."""
+    if preview.get('error'):
+        print(f"{Colors.WARNING}Preview unavailable: {preview['error']}{Colors.ENDC}")
+        return
+    if 'processes' in preview:
+        print(f"{Colors.WARNING}Impact: SIG{preview['signal']} to "
+              f"{sum(not p['protected'] for p in preview['processes'])} process(es){Colors.ENDC}")
+        for process in preview['processes']:
+            refused = '  (protected, skipped)' if process['protected'] else ''
+            print(f"  {process['pid']:>7}  {format_command_line(process)}{refused}")
+        return
+    bound = '' if preview.get('complete', True) else 'at least '
+    print(f"{Colors.WARNING}Impact: {bound}{preview['files']} file(s), "
+          f"{preview['directories']} director{'y' if preview['directories'] == 1 else 'ies'}, "
+          f"{format_size(preview['bytes'])}{Colors.ENDC}")
+    for item in preview.get('largest', []):
+        print(f"  {format_size(item['bytes']):>10}  {item['path']}")
+
+def transpile_file(path: str, target: Optional[str], output: Optional[str], as_json: bool) -> int:
+    """
+    Translate a runbook into scripts, reporting untranslated steps on stderr.
+    
+    A single target is written to ``output`` or stdout. ``all`` writes one
+    script per platform next to ``output`` (or the runbook), named
+    ``<stem>.<platform>.sh`` or ``<stem>.windows.ps1``.
+    """
+    from .core.transpile import SCRIPT_SUFFIXES, TARGET_OS, TARGETS, transpile
+    
+    if target is None:
+        target = next((key for key, os_type in TARGET_OS.items() if os_type == get_os()), 'linux')
+    targets = TARGETS if target == 'all' else (target,)
+    if target == 'all':
+        stem = output or os.path.splitext(path)[0]
+        paths = {t: f"{stem}.{t}{SCRIPT_SUFFIXES[t]}" for t in targets}
+    else:
+        paths = {target: output} if output else {}
+    
+    def report(step) -> None:
+        print(f"{Colors.WARNING}{path}:{step.line}: not translated ({step.error}): "
+              f"{step.text}{Colors.ENDC}", file=sys.stderr)
+    
+    outputs = {}
+    try:
+        for t in targets:
+            outputs[t] = open(paths[t], 'w', newline='\n') if t in paths else sys.stdout
+        with open(path, encoding='utf-8', errors='replace') as runbook:
+            stats = transpile(runbook, outputs, report)
+    finally:
+        for out in outputs.values():
+            if out is not sys.stdout:
+                out.close()
+    for t, script in paths.items():
+        if t != 'windows':
+            os.chmod(script, 0o755)
+    
+    summary = dict(stats, input=path, outputs=paths)
+    if as_json:
+        print(json.dumps(summary, indent=2), file=sys.stderr if not paths else sys.stdout)
+    elif paths:
+        for script in paths.values():
+            print(f"{Colors.OKGREEN}Wrote {script}{Colors.ENDC}")
+    if not as_json:
+        print(f"{stats['translated']}/{stats['steps']} step(s) translated", file=sys.stderr)
+    return 0 if not stats['untranslated'] else 1
+
+def undo_last(dry_run: bool, as_json: bool) -> int:
+    """Reverse the most recent journaled operation (only report it with dry_run)."""
+    result = UndoJournal().undo(dry_run=dry_run)
+    if as_json:
+        print(json.dumps(result, indent=2))
+    elif result['transaction'] is None:
+        print(f"{Colors.WARNING}Nothing to undo{Colors.ENDC}")
+    else:
+        verb = 'Would undo' if dry_run else 'Undid'
+        print(f"{Colors.OKGREEN}{verb}: {result['description']}{Colors.ENDC}")
+        labels = {'D': 'restore', 'O': 'restore', 'M': 'move back', 'C': 'remove'}
+        for op in result['operations']:
+            print(f"  {labels[op[0]]} {op[1] if op[0] != 'M' else op[2] + ' -> ' + op[1]}")
+        for error in result['errors']:
+            print(f"{Colors.FAIL}  {error}{Colors.ENDC}", file=sys.stderr)
+    return 1 if result['errors'] else 0
+
+def fan_out_command(fan_out, generator: CommandGenerator, executor: CommandExecutor,
+                    min_confidence: float, dry_run: bool, as_json: bool) -> int:
+    """
+    Run one translated command in many directories.
+    
+    Results are printed in target order, each under a ``==> target <==``
+    header; engine output is buffered per target so concurrent runs never
+    interleave.
+    """
+    plan = plan_fan_out(generator, fan_out)
+    best = plan.best
+    result = {
+        'input': fan_out.text,
+        'type': best.command_type.name if best is not None else None,
+        'confidence': best.score if best is not None else 0.0,
+        'dry_run': dry_run,
+        'success': False,
+        'error': None,
+        'targets': [{'target': target,
+                     'command': command.display if command is not None else None,
+                     'safe': command is not None and command.is_safe,
+                     'executed': False, 'success': False, 'output': None,
+                     'error': None, 'details': None}
+                    for target, command in plan.commands],
+    }
+    if plan.error:
+        result['error'] = f"ERROR: {plan.error}"
+    elif best.score < min_confidence:
+        result['error'] = (f"ERROR: Ambiguous command: best guess has confidence {best.score:.2f}, "
+                           f"below {min_confidence:.2f}")
+    
+    if result['error'] is None and not dry_run:
+        buffered: List[List[dict]] = [[] for _ in plan.commands]
+        
+        def progress(index: int, event: dict) -> None:
+            if event.get('event') in ('match', 'line', 'entry', 'process', 'socket', 'group'):
+                buffered[index].append(event)
+        
+        outcomes = run_fan_out(plan.commands, executor, progress=None if as_json else progress)
+        for index, (target, (success, output, details)) in enumerate(outcomes):
+            entry = result['targets'][index]
+            entry.update(executed=True, success=success, details=details or None)
+            entry['output' if success else 'error'] = output
+            if as_json:
+                continue
+            print(f"{Colors.HEADER}==> {target} <=={Colors.ENDC}")
+            print(f"{Colors.OKGREEN}{entry['command'] or ''}{Colors.ENDC}")
+            for event in buffered[index]:
+                print_progress(event)
+            buffered[index] = []
+            if success and output:
+                print(output)
+            elif not success:
+                print(f"{Colors.FAIL}{output}{Colors.ENDC}", file=sys.stderr)
+        result['success'] = all(entry['success'] for entry in result['targets'])
+    
+    if as_json:
+        print(json.dumps(result, indent=2))
+    elif result['error']:
+        print(f"{Colors.FAIL}{result['error']}{Colors.ENDC}", file=sys.stderr)
+        return 1
+    elif dry_run:
+        for entry in result['targets']:
+            print(f"{Colors.OKGREEN}{entry['command']}{Colors.ENDC}" if entry['safe'] else
+                  f"{Colors.FAIL}{entry['target']}: no safe command{Colors.ENDC}")
+        print(f"{Colors.WARNING}Dry run: {len(result['targets'])} command(s) not executed{Colors.ENDC}")
+    return 0 if (result['success'] or (dry_run and not result['error'])) else 1
+
 def parse_args(args: List[str] = None) -> argparse.Namespace:
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -93,6 +310,26 @@ def parse_args(args: List[str] = None) -> argparse.Namespace:
         action='store_true',
         help='Output in JSON format'
     )
+    parser.add_argument(
+        '--min-confidence',
+        type=float,
+        default=MIN_CONFIDENCE,
+        help='Refuse to run interpretations scored below this confidence'
+    )
+    parser.add_argument(
+        '--preview-server',
+        action='store_true',
+        help='Serve as-you-type translations on stdin/stdout for shell integration'
+    )
+    parser.add_argument(
+        '--target',
+        choices=['linux', 'darwin', 'windows', 'all'],
+        help='Platform to transpile a runbook for (defaults to the current one)'
+    )
+    parser.add_argument(
+        '--output',
+        help='Script to write when transpiling (stdout by default; a path prefix with --target all)'
+    )
     parser.add_argument(
         '--version',
         action='store_true',
@@ -111,6 +348,10 @@ def main(args: Optional[List[str]] = None) -> int:
     # Parse command line arguments
     parsed_args = parse_args(args)
     
+    if parsed_args.preview_server:
+        from .core.incremental import serve
+        return serve()
+    
     # Handle help and version flags
     if parsed_args.help or not parsed_args.command:
         print_help()
@@ -120,52 +361,85 @@ def main(args: Optional[List[str]] = None) -> int:
         print(f"hcmd {__version__}")
         return 0
     
+    if (len(parsed_args.command) == 2 and parsed_args.command[0] == 'transpile'
+            and os.path.isfile(parsed_args.command[1])):
+        return transpile_file(parsed_args.command[1], parsed_args.target, parsed_args.output,
+                              parsed_args.json)
+    
+    if parsed_args.command == ['undo']:
+        return undo_last(parsed_args.dry_run, parsed_args.json)
+    
     # Join the command parts
     command_text = ' '.join(parsed_args.command)
     
     # Initialize components
     generator = CommandGenerator()
-    executor = CommandExecutor(dry_run=parsed_args.dry_run)
+    executor = CommandExecutor(dry_run=parsed_args.dry_run, journal=UndoJournal())
     
-    # Interpret the natural language command
-    command_type, command_args = generator.interpret_natural_language(command_text)
+    # "... in each of a, b and c", "... in every service folder"
+    fan_out = parse_fan_out(command_text)
+    if fan_out is not None:
+        return fan_out_command(fan_out, generator, executor, parsed_args.min_confidence,
+                               parsed_args.dry_run, parsed_args.json)
     
-    # Generate the command
-    if command_type == CommandType.UNKNOWN:
-        # If we couldn't determine the command type, try to generate a command directly
-        # This handles cases where the input is already a command
-        generated_command = command_text
-        command_type = None
-    else:
-        # Generate the command based on the interpreted type and arguments
-        generated_command = generator.generate_command(command_type, command_args)
+    # Interpret the natural language command: the best interpretations,
+    # each built and validated, best first
+    candidates = generator.candidates(command_text, DEFAULT_CANDIDATES)
+    best = candidates[0] if candidates else None
+    command = best.command if best is not None else None
+    confident = best is not None and best.score >= parsed_args.min_confidence
     
-    # Validate the generated command
-    is_safe, safety_reason = is_command_safe(generated_command)
+    generated_command = command.display if command is not None else ""
+    is_native = command is not None and command.is_native
     
     # Prepare the result
     result = {
         'input': command_text,
         'command': generated_command,
-        'safe': is_safe,
+        'safe': command is not None and command.is_safe,
         'dry_run': parsed_args.dry_run,
         'executed': False,
         'success': False,
         'output': None,
-        'error': None
+        'error': None,
+        'preview': None,
+        'details': None,
+        'cached': False,
+        'confidence': best.score if best is not None else 0.0,
+        'alternatives': [
+            {'type': candidate.command_type.name, 'command': candidate.command.display,
+             'safe': candidate.command.is_safe, 'confidence': candidate.score}
+            for candidate in candidates[1:]
+        ]
     }
     
     # Check if the command is safe to execute
-    if not is_safe:
-        result['error'] = f"ERROR: Unsafe command: {safety_reason}"
-    elif not generated_command:
-        result['error'] = "ERROR: Could not generate a command for the input"
+    if command is None:
+        result['error'] = "ERROR: Ambiguous command: could not understand the input"
+    elif not confident:
+        result['error'] = (f"ERROR: Ambiguous command: best guess has confidence {best.score:.2f}, "
+                           f"below {parsed_args.min_confidence:.2f}")
+    elif not command.is_safe:
+        result['error'] = f"ERROR: Unsafe command: {command.verdict[1]}"
     else:
+        if is_native:
+            result['preview'] = executor.preview_native(command.command_type, list(command.args))
+        
         # Execute the command if it's safe and not a dry run
         if not parsed_args.dry_run:
-            success, output = executor.execute(generated_command)
+            if is_native and not parsed_args.json:
+                # Announce the command first, engines may stream their output
+                print(f"{Colors.OKGREEN}{generated_command}{Colors.ENDC}")
+                if result['preview']:
+                    print_preview(result['preview'])
+            success, output, details = executor.run(
+                command,
+                progress=None if parsed_args.json else print_progress
+            )
             result['executed'] = True
             result['success'] = success
+            result['details'] = details or None
+            result['cached'] = bool(details and details.get('cached'))
             
             if success:
                 result['output'] = output
@@ -180,11 +454,16 @@ def main(args: Optional[List[str]] = None) -> int:
         # Output as human-readable text
         if 'error' in result and result['error']:
             print(f"{Colors.FAIL}{result['error']}{Colors.ENDC}", file=sys.stderr)
+            if command is not None and not confident:
+                print("Did you mean:", file=sys.stderr)
+                for candidate in candidates:
+                    print(f"  {Colors.OKCYAN}{candidate.command.display}{Colors.ENDC}"
+                          f"  ({candidate.score:.2f})", file=sys.stderr)
             return 1
         
         if generated_command:
             # Check if it's a cd command
-            is_cd_command = generated_command.lower().strip().startswith('cd ')
+            is_cd_command = command.mode == MODE_EVAL
             
             if is_cd_command:
                 # For cd commands, just print the command once (no color)
@@ -194,8 +473,13 @@ def main(args: Optional[List[str]] = None) -> int:
                 else:
                     print(generated_command)
             else:
-                # For non-cd commands, print with color
-                print(f"{Colors.OKGREEN}{generated_command}{Colors.ENDC}")
+                # For non-cd commands, print with color (native commands were
+                # already announced before they ran)
+                if not (is_native and result.get('executed')):
+                    print(f"{Colors.OKGREEN}{generated_command}{Colors.ENDC}")
+                    
+                    if result.get('preview'):
+                        print_preview(result['preview'])
                 
                 if parsed_args.dry_run:
                     print(f"{Colors.WARNING}Dry run: Command not executed{Colors.ENDC}")
@@ -15,6 +15,16 @@ class CommandType(Enum):
     MOVE = auto()
     COPY = auto()
     DOCKER = auto()
+    FIND = auto()
+    CONTENT_SEARCH = auto()
+    DISK_USAGE = auto()
+    ARCHIVE = auto()
+    EXTRACT = auto()
+    DEDUPE = auto()
+    SYNC = auto()
+    PROCESS = auto()
+    KILL = auto()
+    LOG = auto()
     UNKNOWN = auto()
 
 # Common system directories with platform-agnostic placeholders
@@ -56,6 +66,306 @@ SYSTEM_DIRECTORIES = {
     }
 }
 
+# Command templates by intent and platform; {placeholders} are filled in
+# by CommandGenerator
+COMMAND_TEMPLATES = {
+    'navigation': {
+        'windows': 'cd {path}',
+        'darwin': 'cd {path}',
+        'linux': 'cd {path}'
+    },
+    'list_files': {
+        'windows': 'Get-ChildItem -Force "{path}"',
+        'darwin': 'ls -la {path}',
+        'linux': 'ls -la {path}'
+    },
+    'create_file': {
+        'windows': 'New-Item -ItemType File -Path "{path}"',
+        'darwin': 'touch "{path}"',
+        'linux': 'touch "{path}"'
+    },
+    'create_dir': {
+        'windows': 'New-Item -ItemType Directory -Path "{path}"',
+        'darwin': 'mkdir -p "{path}"',
+        'linux': 'mkdir -p "{path}"'
+    },
+    'open': {
+        'windows': 'Start-Process "{path}"',
+        'darwin': 'open "{path}"',
+        'linux': 'xdg-open "{path}"'
+    },
+    'delete_file': {
+        'windows': 'Remove-Item -Path "{path}" -Force',
+        'darwin': 'rm -f "{path}"',
+        'linux': 'rm -f "{path}"'
+    },
+    'delete_dir': {
+        'windows': 'Remove-Item -Path "{path}" -Recurse -Force',
+        'darwin': 'rm -rf "{path}"',
+        'linux': 'rm -rf "{path}"'
+    },
+    'move': {
+        'windows': 'Move-Item -Path "{src}" -Destination "{dest}" -Force',
+        'darwin': 'mv "{src}" "{dest}"',
+        'linux': 'mv "{src}" "{dest}"'
+    },
+    'copy': {
+        'windows': 'Copy-Item -Path "{src}" -Destination "{dest}" -Recurse -Force',
+        'darwin': 'cp -r "{src}" "{dest}"',
+        'linux': 'cp -r "{src}" "{dest}"'
+    },
+    'print_working_dir': {
+        'windows': 'Get-Location',
+        'darwin': 'pwd',
+        'linux': 'pwd'
+    },
+    'docker_list_containers': {
+        'windows': 'docker ps -a',
+        'darwin': 'docker ps -a',
+        'linux': 'docker ps -a'
+    },
+    'docker_list_images': {
+        'windows': 'docker images',
+        'darwin': 'docker images',
+        'linux': 'docker images'
+    },
+    'docker_run': {
+        'windows': 'docker run -d {image}',
+        'darwin': 'docker run -d {image}',
+        'linux': 'docker run -d {image}'
+    },
+    'docker_stop': {
+        'windows': 'docker stop {container}',
+        'darwin': 'docker stop {container}',
+        'linux': 'docker stop {container}'
+    },
+    'docker_rm': {
+        'windows': 'docker rm {container}',
+        'darwin': 'docker rm {container}',
+        'linux': 'docker rm {container}'
+    },
+    'docker_rmi': {
+        'windows': 'docker rmi {image}',
+        'darwin': 'docker rmi {image}',
+        'linux': 'docker rmi {image}'
+    },
+    'docker_logs': {
+        'windows': 'docker logs {container}',
+        'darwin': 'docker logs {container}',
+        'linux': 'docker logs {container}'
+    },
+    'content_search': {
+        'windows': 'Get-ChildItem -Path "{path}" -Recurse -File{filters} | Select-String {options}-Pattern "{pattern}"',
+        'darwin': 'grep -rn{options} "{pattern}" "{path}"{filters}',
+        'linux': 'grep -rn{options} "{pattern}" "{path}"{filters}'
+    },
+    'disk_usage': {
+        'windows': 'Get-ChildItem -Path "{path}" | Sort-Object Length -Descending | Select-Object -First {top}',
+        'darwin': 'du -sk "{path}"/* | sort -rn | head -n {top}',
+        'linux': 'du -sh "{path}"/* | sort -rh | head -n {top}'
+    },
+    'disk_usage_files': {
+        'windows': 'Get-ChildItem -Path "{path}" -Recurse -File | Sort-Object Length -Descending | Select-Object -First {top}',
+        'darwin': 'find "{path}" -type f -exec du -k {{}} + | sort -rn | head -n {top}',
+        'linux': 'find "{path}" -type f -exec du -h {{}} + | sort -rh | head -n {top}'
+    },
+    'archive_zip': {
+        'windows': 'Compress-Archive -Path "{src}" -DestinationPath "{dest}" -Force',
+        'darwin': 'zip -qr "{dest}" "{src}"',
+        'linux': 'zip -qr "{dest}" "{src}"'
+    },
+    'archive_tar': {
+        'windows': 'tar -c{flags}f "{dest}" "{src}"',
+        'darwin': 'tar -c{flags}f "{dest}" "{src}"',
+        'linux': 'tar -c{flags}f "{dest}" "{src}"'
+    },
+    'extract_zip': {
+        'windows': 'Expand-Archive -Path "{src}" -DestinationPath "{dest}" -Force',
+        'darwin': 'unzip -oq "{src}" -d "{dest}"',
+        'linux': 'unzip -oq "{src}" -d "{dest}"'
+    },
+    'extract_tar': {
+        'windows': 'tar -xf "{src}" -C "{dest}"',
+        'darwin': 'tar -xf "{src}" -C "{dest}"',
+        'linux': 'tar -xf "{src}" -C "{dest}"'
+    },
+    'process_top_memory': {
+        'windows': 'Get-Process | Sort-Object WorkingSet64 -Descending | Select-Object -First {count}',
+        'darwin': 'ps -Ao pid,user,%cpu,%mem,rss,comm -m | head -n {lines}',
+        'linux': 'ps -eo pid,user,%cpu,%mem,rss,comm --sort=-rss | head -n {lines}'
+    },
+    'process_top_cpu': {
+        'windows': 'Get-Process | Sort-Object CPU -Descending | Select-Object -First {count}',
+        'darwin': 'ps -Ao pid,user,%cpu,%mem,rss,comm -r | head -n {lines}',
+        'linux': 'ps -eo pid,user,%cpu,%mem,rss,comm --sort=-%cpu | head -n {lines}'
+    },
+    'process_name': {
+        'windows': 'Get-Process -Name "*{name}*"',
+        'darwin': 'pgrep -il "{name}"',
+        'linux': 'pgrep -ail "{name}"'
+    },
+    'process_port': {
+        'windows': 'Get-NetTCPConnection -LocalPort {port} | Select-Object LocalAddress,LocalPort,State,OwningProcess',
+        'darwin': 'lsof -nP -i :{port}',
+        'linux': 'ss -tulpn "sport = :{port}"'
+    },
+    'kill_pid': {
+        'windows': 'Stop-Process -Id {pid}{force}',
+        'darwin': 'kill -{signal} {pid}',
+        'linux': 'kill -{signal} {pid}'
+    },
+    'kill_name': {
+        'windows': 'Stop-Process -Name "{name}"{force}',
+        'darwin': 'pkill -{signal} -x "{name}"',
+        'linux': 'pkill -{signal} -x "{name}"'
+    },
+    'kill_port': {
+        'windows': 'Stop-Process -Id (Get-NetTCPConnection -LocalPort {port}).OwningProcess{force}',
+        'darwin': 'kill -{signal} $(lsof -t -i :{port})',
+        'linux': 'fuser -k -{signal} {port}/tcp'
+    },
+    'sync': {
+        'windows': 'robocopy "{src}" "{dest}\\{name}" /E',
+        'darwin': 'rsync -a "{src}" "{dest}"',
+        'linux': 'rsync -a "{src}" "{dest}"'
+    },
+    'sync_delete': {
+        'windows': 'robocopy "{src}" "{dest}\\{name}" /MIR',
+        'darwin': 'rsync -a --delete "{src}" "{dest}"',
+        'linux': 'rsync -a --delete "{src}" "{dest}"'
+    },
+    'dedupe': {
+        'windows': 'Get-ChildItem -Path "{path}" -Recurse -File | Get-FileHash | Group-Object Hash | Where-Object {{ $_.Count -gt 1 }}',
+        'darwin': 'find "{path}" -type f -size +0 -exec shasum {{}} + | sort | awk \'$1 == h {{ if (p) print p; print; p = ""; next }} {{ h = $1; p = $0 }}\'',
+        'linux': 'find "{path}" -type f -size +0 -exec sha1sum {{}} + | sort | uniq -w40 -D'
+    },
+    'log_tail': {
+        'windows': 'Get-Content -Path "{path}" -Tail {count}',
+        'darwin': 'tail -n {count} "{path}"',
+        'linux': 'tail -n {count} "{path}"'
+    },
+    'log_head': {
+        'windows': 'Get-Content -Path "{path}" -TotalCount {count}',
+        'darwin': 'head -n {count} "{path}"',
+        'linux': 'head -n {count} "{path}"'
+    },
+    'log_follow': {
+        'windows': 'Get-Content -Path "{path}" -Tail {count} -Wait{filter}',
+        'darwin': 'tail -n {count} -F "{path}"{filter}',
+        'linux': 'tail -n {count} -F "{path}"{filter}'
+    },
+    'log_search': {
+        'windows': 'Select-String -Path "{path}" {options}-Pattern "{pattern}"{limit}',
+        'darwin': 'grep -n{options} "{pattern}" "{path}"{limit}',
+        'linux': 'grep -n{options} "{pattern}" "{path}"{limit}'
+    },
+    'find': {
+        'windows': 'Get-ChildItem -Path "{path}" -Recurse{filters}',
+        'darwin': 'find "{path}"{filters}',
+        'linux': 'find "{path}"{filters}'
+    }
+}
+
+# Aliases and the system directories they stand for
+DIRECTORY_ALIASES = {
+    'home': 'home',
+    '~': 'home',
+    'desktop': 'desktop',
+    'documents': 'documents',
+    'downloads': 'downloads',
+    'pictures': 'pictures',
+    'music': 'music',
+    'videos': 'videos',
+    'movies': 'videos',
+    'pics': 'pictures',
+    'docs': 'documents',
+    'dl': 'downloads'
+}
+
+# Trigger phrases by intent, matched against the lower-cased input
+INTENT_PHRASES = {
+    'navigation': [
+        'go to', 'navigate to', 'change to', 'cd to', 'open directory',
+        'show me', 'take me to', 'browse to'
+    ],
+    'list_files': [
+        'list files', 'show files', 'list directory', 'ls', 'dir',
+        'what\'s in', 'what is in', 'show contents of'
+    ],
+    'create': [
+        'create file', 'make file', 'new file', 'touch',
+        'create directory', 'make directory', 'new directory', 'mkdir'
+    ],
+    'delete': [
+        'delete', 'remove', 'rm', 'del', 'erase', 'trash'
+    ],
+    'move': [
+        'move', 'mv', 'relocate', 'transfer'
+    ],
+    'copy': [
+        'copy', 'cp', 'duplicate', 'clone'
+    ],
+    'open': [
+        'open', 'launch', 'start', 'run', 'execute'
+    ],
+    'content_search': [
+        'containing', 'that contain', 'which contain', 'that mention',
+        'mentioning', 'with the text', 'with the word', 'with text'
+    ],
+    'disk_usage': [
+        'taking up space', 'using space', 'using the most space', 'disk usage',
+        'space used', 'disk space', 'biggest', 'largest', 'how big', 'du'
+    ],
+    'kill': [
+        'kill', 'killall', 'pkill', 'terminate', 'force quit', 'end process', 'stop process'
+    ],
+    'process': [
+        'process', 'processes', 'using port', 'on port', 'listening on', 'memory hogs',
+        'using the most memory', 'using the most cpu', 'running programs', 'pid'
+    ],
+    'log': [
+        'tail', 'follow', 'lines of', 'lines from', 'lines in', 'errors in', 'errors from',
+        'warnings in', 'exceptions in', 'entries in', 'entries from'
+    ],
+    'sync': [
+        'sync', 'synchronize', 'synchronise', 'mirror', 'keep in sync'
+    ],
+    'dedupe': [
+        'duplicates', 'duplicated', 'duplicate files', 'duplicate photos', 'dupes',
+        'dedupe', 'deduplicate', 'identical files'
+    ],
+    'extract': [
+        'extract', 'unzip', 'untar', 'unpack', 'decompress', 'uncompress'
+    ],
+    'archive': [
+        'zip', 'compress', 'archive', 'tar', 'tarball', 'pack up', 'bundle up'
+    ],
+    'find': [
+        'find', 'search for', 'locate', 'look for', 'where are'
+    ]
+}
+
+# File extensions recognised without a leading dot (e.g. "find pdf files")
+COMMON_EXTENSIONS = {
+    'log', 'txt', 'md', 'csv', 'json', 'xml', 'yaml', 'yml', 'pdf', 'doc', 'docx',
+    'xls', 'xlsx', 'ppt', 'pptx', 'py', 'js', 'ts', 'java', 'c', 'cpp', 'h', 'go',
+    'rs', 'rb', 'sh', 'sql', 'html', 'css', 'jpg', 'jpeg', 'png', 'gif', 'svg',
+    'mp3', 'wav', 'flac', 'mp4', 'mov', 'avi', 'mkv', 'zip', 'tar', 'gz', 'iso'
+}
+
+# Archive formats by file name suffix
+ARCHIVE_FORMATS = {
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.tar.gz': 'tar.gz',
+    '.tgz': 'tar.gz',
+    '.tar.xz': 'tar.xz',
+    '.txz': 'tar.xz',
+    '.tar.bz2': 'tar.bz2',
+    '.tbz2': 'tar.bz2',
+    '.tbz': 'tar.bz2'
+}
+
 # Known dangerous commands and patterns
 DANGEROUS_PATTERNS = [
     r'rm\s+-[^\s]*(r|f|rf|fr)',
@@ -69,3 +379,27 @@ DANGEROUS_PATTERNS = [
     r'chown\s+-[^\s]*R',
     r'\|\s*\b(rm|shutdown|halt|poweroff|reboot|dd|mkfs|:(){:|:&};:|wget\s+http|curl\s+http|bash\s+<\s*\()'  # noqa: E501
 ]
+
+# Processes a KILL never signals, by lower-cased name
+PROTECTED_PROCESSES = {
+    'init', 'systemd', 'kthreadd', 'launchd', 'kernel_task', 'sshd', 'login',
+    'loginwindow', 'windowserver', 'dbus-daemon', 'system', 'smss.exe', 'csrss.exe',
+    'wininit.exe', 'winlogon.exe', 'services.exe', 'lsass.exe'
+}
+
+# Paths that in-process engines must never delete or overwrite wholesale
+PROTECTED_PATHS = [
+    '/', '/bin', '/boot', '/dev', '/etc', '/lib', '/lib64', '/opt', '/proc',
+    '/root', '/sbin', '/sys', '/usr', '/var', '/System', '/Library',
+    '/Applications', '/Users', '/home',
+    'C:\\', 'C:\\Windows', 'C:\\Program Files', 'C:\\Program Files (x86)', 'C:\\Users'
+]
+
+# System directories nothing below may be deleted or written into by the
+# in-process engines (the user's own home is exempt when it lies below one)
+PROTECTED_PREFIXES = [
+    '/bin', '/boot', '/dev', '/etc', '/lib', '/lib32', '/lib64', '/libx32', '/opt',
+    '/proc', '/run', '/sbin', '/sys', '/usr', '/var', '/System', '/Library',
+    '/private/etc', '/private/var/db', '/system',
+    'C:\\Windows', 'C:\\Program Files', 'C:\\Program Files (x86)', 'C:\\ProgramData'
+]
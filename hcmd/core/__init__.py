@@ -6,20 +6,27 @@ including command generation, execution, and validation.
 """
 
 # Import core modules to make them available when importing from hcmd.core
+from .command import Command
 from .detector import get_os, get_shell, get_system_directory
 from .generator import CommandGenerator
 from .executor import CommandExecutor
-from .validator import is_command_safe, validate_command_type, extract_paths, sanitize_input
+from .resultcache import ResultCache
+from .validator import is_command_safe, validate_command_type, extract_paths, sanitize_input, is_path_protected, is_system_destination, validate_command
 
 # Define __all__ to specify the public API
 __all__ = [
+    'Command',
     'get_os',
     'get_shell',
     'get_system_directory',
     'CommandGenerator',
     'CommandExecutor',
+    'ResultCache',
     'is_command_safe',
     'validate_command_type',
     'extract_paths',
-    'sanitize_input'
+    'sanitize_input',
+    'is_path_protected',
+    'is_system_destination',
+    'validate_command'
 ]
@@ -0,0 +1,351 @@
+"""
+Statistical intent classifier for the hcmd tool.
+
+A linear model over hashed character n-grams and words, used when none of
+the phrase rules in CommandGenerator match. The model is trained on the
+corpus in ``hcmd/data/intents.tsv`` and shipped as a compact sparse binary
+file, ``hcmd/data/intents.bin``, which is loaded lazily on first use.
+
+To retrain after editing the corpus::
+
+    python -m hcmd.core.classifier
+"""
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..constants import CommandType
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+CORPUS_PATH = os.path.join(DATA_DIR, 'intents.tsv')
+MODEL_PATH = os.path.join(DATA_DIR, 'intents.bin')
+
+MODEL_MAGIC = b'HCIC'
+MODEL_VERSION = 1
+
+# Size of the hashed feature space
+HASH_BITS = 20
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# Character n-gram lengths
+NGRAM_RANGE = (2, 4)
+
+# Words whose score contributions each model remembers
+WORD_CACHE_SIZE = 4096
+
+_WORD_RE = re.compile(r"[a-z0-9_.~/'-]+")
+
+def featurize(text: str) -> List[int]:
+    """
+    Hash an utterance into feature indices.
+
+    Features are the words of the utterance plus the character n-grams of
+    each word padded with spaces, so a typo only disturbs a few of them.
+
+    Args:
+        text: The utterance
+
+    Returns:
+        List[int]: Hashed feature indices (may contain duplicates)
+    """
+    features = []
+    for word in words_of(text):
+        features.extend(featurize_word(word))
+    return features
+
+def words_of(text: str) -> List[str]:
+    """The words featurize() sees in an utterance."""
+    return _WORD_RE.findall(text.lower())
+
+def featurize_word(word: str) -> List[int]:
+    """Hash one (lower-case) word into its feature indices; see featurize()."""
+    low, high = NGRAM_RANGE
+    features = [zlib.crc32(b'w:' + word.encode('utf-8')) & HASH_MASK]
+    padded = f' {word} '.encode('utf-8')
+    for n in range(low, high + 1):
+        for i in range(len(padded) - n + 1):
+            features.append(zlib.crc32(padded[i:i + n]) & HASH_MASK)
+    return features
+
+class IntentModel:
+    """
+    Sparse linear model scoring every label in one pass.
+
+    Weights are stored row-wise: each hashed feature that carries weight
+    owns one row of ``len(labels)`` floats in a flat array, so scoring an
+    utterance adds one row per feature into a single score vector.
+    """
+
+    def __init__(self, labels: List[str], rows: Dict[int, int], weights: array, bias: array):
+        self.labels = labels
+        self.types = [CommandType[label] for label in labels]
+        self.rows = rows
+        self.weights = weights
+        self.bias = bias
+        self._word_cache: Dict[str, Tuple[Tuple[float, ...], int]] = {}
+        self._word_cache_lock = threading.Lock()
+
+    def scores(self, text: str) -> List[float]:
+        """Raw linear scores for every label."""
+        n = len(self.labels)
+        scores = list(self.bias)
+        features = featurize(text)
+        if not features:
+            return scores
+        scale = 1.0 / math.sqrt(len(features))
+        rows, weights = self.rows, self.weights
+        for feature in features:
+            start = rows.get(feature)
+            if start is not None:
+                row = weights[start:start + n]
+                for j in range(n):
+                    scores[j] += row[j] * scale
+        return scores
+
+    def word_scores(self, word: str) -> Tuple[List[float], int]:
+        """
+        Unscaled score contribution of one word, and its feature count.
+
+        Utterance scores are ``bias + sum(contributions) / sqrt(count)``, so
+        callers that see text change a word at a time can cache these per
+        word and combine them with scores_from_words().
+        """
+        n = len(self.labels)
+        totals = [0.0] * n
+        features = featurize_word(word)
+        rows, weights = self.rows, self.weights
+        for feature in features:
+            start = rows.get(feature)
+            if start is not None:
+                row = weights[start:start + n]
+                for j in range(n):
+                    totals[j] += row[j]
+        return totals, len(features)
+
+    def scores_from_words(self, parts: Sequence[Tuple[Sequence[float], int]]) -> List[float]:
+        """Combine word_scores() results into the scores of the whole utterance."""
+        scores = list(self.bias)
+        count = sum(c for _, c in parts)
+        if not count:
+            return scores
+        scale = 1.0 / math.sqrt(count)
+        for totals, _ in parts:
+            for j, value in enumerate(totals):
+                scores[j] += value * scale
+        return scores
+
+    def rank(self, scores: List[float]) -> List[Tuple[CommandType, float]]:
+        """Turn raw scores into (type, probability) pairs, most likely first."""
+        return _softmax_ranked(self.types, scores)
+
+    def predict(self, text: str) -> List[Tuple[CommandType, float]]:
+        """
+        Score an utterance against every CommandType.
+
+        Args:
+            text: The utterance
+
+        Returns:
+            List[Tuple[CommandType, float]]: (type, probability) pairs,
+            most likely first
+        """
+        return _softmax_ranked(self.types, self.scores(text))
+
+    def predict_cached(self, text: str) -> List[Tuple[CommandType, float]]:
+        """
+        predict(), built from per-word contributions kept in a bounded cache.
+
+        Inputs are short and reuse a small vocabulary, so after warm-up
+        scoring an utterance is one dict lookup per word plus the softmax.
+        """
+        cache = self._word_cache
+        parts = []
+        for word in words_of(text):
+            part = cache.get(word)
+            if part is None:
+                totals, count = self.word_scores(word)
+                part = (tuple(totals), count)
+                with self._word_cache_lock:
+                    if len(cache) >= WORD_CACHE_SIZE:
+                        cache.clear()
+                    cache[word] = part
+            parts.append(part)
+        return self.rank(self.scores_from_words(parts))
+
+    def predict_batch(self, texts: Sequence[str]) -> List[List[Tuple[CommandType, float]]]:
+        """Score several utterances; see predict()."""
+        return [self.predict(text) for text in texts]
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'IntentModel':
+        """Load a model written by save()."""
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if data[:4] != MODEL_MAGIC:
+            raise ValueError(f"Not an hcmd intent model: {path}")
+        version, n_labels, n_rows, labels_len = struct.unpack_from('<HHII', data, 4)
+        if version != MODEL_VERSION:
+            raise ValueError(f"Unsupported intent model version {version}")
+        offset = 4 + struct.calcsize('<HHII')
+        labels = data[offset:offset + labels_len].decode('utf-8').split('\n')
+        offset += labels_len
+
+        features = array('I')
+        features.frombytes(data[offset:offset + 4 * n_rows])
+        offset += 4 * n_rows
+        weights = array('f')
+        weights.frombytes(data[offset:offset + 4 * n_rows * n_labels])
+        offset += 4 * n_rows * n_labels
+        bias = array('f')
+        bias.frombytes(data[offset:offset + 4 * n_labels])
+        if sys.byteorder == 'big':
+            features.byteswap()
+            weights.byteswap()
+            bias.byteswap()
+
+        rows = {feature: i * n_labels for i, feature in enumerate(features)}
+        return cls(labels, rows, weights, bias)
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        """Write the model as a little-endian sparse binary file."""
+        n = len(self.labels)
+        ordered = sorted(self.rows.items(), key=lambda item: item[1])
+        features = array('I', [feature for feature, _ in ordered])
+        weights = array('f')
+        for _, start in ordered:
+            weights.extend(self.weights[start:start + n])
+        bias = array('f', self.bias)
+        if sys.byteorder == 'big':
+            features.byteswap()
+            weights.byteswap()
+            bias.byteswap()
+        labels = '\n'.join(self.labels).encode('utf-8')
+        with open(path, 'wb') as fh:
+            fh.write(MODEL_MAGIC)
+            fh.write(struct.pack('<HHII', MODEL_VERSION, n, len(features), len(labels)))
+            fh.write(labels)
+            fh.write(features.tobytes())
+            fh.write(weights.tobytes())
+            fh.write(bias.tobytes())
+
+def _softmax_ranked(types: List[CommandType], scores: List[float]) -> List[Tuple[CommandType, float]]:
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return sorted([(t, e / total) for t, e in zip(types, exps)], key=itemgetter(1), reverse=True)
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Tuple[str, str]]:
+    """Read ``label<TAB>utterance`` lines, skipping comments."""
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            label, _, text = line.partition('\t')
+            corpus.append((label, text))
+    return corpus
+
+def train(corpus: List[Tuple[str, str]], epochs: int = 40, learning_rate: float = 0.5,
+          l2: float = 1e-4, seed: int = 0) -> IntentModel:
+    """
+    Fit a softmax regression model with plain SGD.
+
+    Args:
+        corpus: (label, utterance) pairs; labels are CommandType names
+        epochs: Passes over the corpus
+        learning_rate: SGD step size
+        l2: L2 penalty applied to the rows touched by each example
+        seed: Seed for the shuffling order
+
+    Returns:
+        IntentModel: The trained model
+    """
+    labels = [t.name for t in CommandType if any(label == t.name for label, _ in corpus)]
+    index = {label: i for i, label in enumerate(labels)}
+    n = len(labels)
+    examples = []
+    for label, text in corpus:
+        features = featurize(text)
+        if features:
+            examples.append((index[label], features, 1.0 / math.sqrt(len(features))))
+
+    table: Dict[int, List[float]] = {}
+    bias = [0.0] * n
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(examples)
+        rate = learning_rate / (1 + epoch * 0.1)
+        for target, features, scale in examples:
+            scores = list(bias)
+            for feature in features:
+                row = table.get(feature)
+                if row is not None:
+                    for j in range(n):
+                        scores[j] += row[j] * scale
+            top = max(scores)
+            exps = [math.exp(s - top) for s in scores]
+            total = sum(exps)
+            grads = [e / total for e in exps]
+            grads[target] -= 1.0
+            for j in range(n):
+                bias[j] -= rate * grads[j]
+            for feature in features:
+                row = table.setdefault(feature, [0.0] * n)
+                for j in range(n):
+                    row[j] -= rate * (grads[j] * scale + l2 * row[j])
+
+    rows: Dict[int, int] = {}
+    weights = array('f')
+    for feature, row in table.items():
+        if max(abs(w) for w in row) > 1e-3:
+            rows[feature] = len(weights)
+            weights.extend(row)
+    return IntentModel(labels, rows, weights, array('f', bias))
+
+_model: Optional[IntentModel] = None
+_model_lock = threading.Lock()
+
+def get_model() -> Optional[IntentModel]:
+    """Load the shipped model on first use. Returns None if it is unavailable."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    _model = IntentModel.load()
+                except (OSError, ValueError, KeyError, struct.error):
+                    return None
+    return _model
+
+def classify(text: str) -> List[Tuple[CommandType, float]]:
+    """
+    Rank every CommandType for an utterance.
+
+    Args:
+        text: The utterance
+
+    Returns:
+        List[Tuple[CommandType, float]]: (type, probability) pairs, most
+        likely first; empty if no model is available
+    """
+    model = get_model()
+    return model.predict_cached(text) if model is not None else []
+
+def classify_batch(texts: Sequence[str]) -> List[List[Tuple[CommandType, float]]]:
+    """Rank every CommandType for several utterances; see classify()."""
+    model = get_model()
+    return model.predict_batch(texts) if model is not None else [[] for _ in texts]
+
+if __name__ == '__main__':
+    model = train(load_corpus())
+    model.save()
+    print(f"Wrote {MODEL_PATH}: {len(model.rows)} feature rows, {len(model.labels)} labels")
@@ -0,0 +1,116 @@
+"""Typed intermediate representation of a generated command."""
+from typing import Any, Optional, Tuple
+
+from ..constants import CommandType
+
+# Command types that are carried out in-process instead of through a shell
+NATIVE_COMMAND_TYPES = frozenset({
+    CommandType.COPY,
+    CommandType.MOVE,
+    CommandType.DELETE,
+    CommandType.FIND,
+    CommandType.CONTENT_SEARCH,
+    CommandType.DISK_USAGE,
+    CommandType.ARCHIVE,
+    CommandType.EXTRACT,
+    CommandType.DEDUPE,
+    CommandType.SYNC,
+    CommandType.PROCESS,
+    CommandType.KILL,
+    CommandType.LOG,
+})
+
+# How a Command is carried out
+MODE_NATIVE = 'native'  # by an in-process engine, from ``args``
+MODE_ARGV = 'argv'      # by executing ``argv`` directly, without a shell
+MODE_SHELL = 'shell'    # by the platform shell, from ``display``
+MODE_EVAL = 'eval'      # by the parent shell (``cd``), from ``display``
+
+# How the result of a read-only command may be reused
+CACHE_WATCH = 'watch'    # until one of ``watch_paths`` changes
+CACHE_TTL = 'ttl'        # for a short time (external state, e.g. Docker)
+CACHE_STATIC = 'static'  # for as long as it stays in the cache
+
+class Command:
+    """
+    An immutable, validated-once description of what to run.
+
+    The generator builds it, the validator stamps it with a verdict and the
+    executor runs it according to its ``mode``. ``display`` is only ever
+    shown to the user (or handed to a shell in the shell and eval modes);
+    it is never parsed back.
+    """
+
+    __slots__ = ('command_type', 'mode', 'argv', 'args', 'platform_key', 'display', 'verdict',
+                 'cache_policy', 'watch_paths')
+
+    def __init__(self, command_type: CommandType, mode: str, display: str,
+                 platform_key: str, argv: Tuple[str, ...] = (), args: Tuple[str, ...] = (),
+                 verdict: Optional[Tuple[bool, str]] = None,
+                 cache_policy: Optional[str] = None, watch_paths: Tuple[str, ...] = ()):
+        """
+        Initialize the command.
+
+        Args:
+            command_type: The interpreted intent
+            mode: One of MODE_NATIVE, MODE_ARGV, MODE_SHELL, MODE_EVAL
+            display: The equivalent command line, for display
+            platform_key: Template platform key ('linux', 'darwin', 'windows')
+            argv: Argument vector for MODE_ARGV
+            args: Resolved engine arguments for MODE_NATIVE
+            verdict: (is_safe, reason) once validated, None before
+            cache_policy: CACHE_WATCH, CACHE_TTL or CACHE_STATIC for
+                read-only commands whose result may be reused, else None
+            watch_paths: Directories whose changes invalidate a CACHE_WATCH result
+        """
+        object.__setattr__(self, 'command_type', command_type)
+        object.__setattr__(self, 'mode', mode)
+        object.__setattr__(self, 'display', display)
+        object.__setattr__(self, 'platform_key', platform_key)
+        object.__setattr__(self, 'argv', tuple(argv))
+        object.__setattr__(self, 'args', tuple(args))
+        object.__setattr__(self, 'verdict', verdict)
+        object.__setattr__(self, 'cache_policy', cache_policy)
+        object.__setattr__(self, 'watch_paths', tuple(watch_paths))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self) -> str:
+        return (f"Command({self.command_type.name}, mode={self.mode!r}, "
+                f"display={self.display!r}, verdict={self.verdict!r})")
+
+    def __str__(self) -> str:
+        return self.display
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Command):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    @property
+    def is_native(self) -> bool:
+        """True if the command runs in-process."""
+        return self.mode == MODE_NATIVE
+
+    @property
+    def is_safe(self) -> bool:
+        """True if the command was validated and found safe."""
+        return self.verdict is not None and self.verdict[0]
+
+    @property
+    def is_cacheable(self) -> bool:
+        """True if the command is read-only and its result may be reused."""
+        return self.cache_policy is not None and self.mode in (MODE_ARGV, MODE_SHELL)
+
+    def with_verdict(self, is_safe: bool, reason: str = "") -> 'Command':
+        """Return a copy of the command stamped with a validation verdict."""
+        return Command(self.command_type, self.mode, self.display, self.platform_key,
+                       self.argv, self.args, (is_safe, reason),
+                       self.cache_policy, self.watch_paths)
@@ -0,0 +1,320 @@
+"""Duplicate file finder with a persistent hash index."""
+import gc
+import hashlib
+import marshal
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .detector import get_data_dir
+from .search import FindQuery
+from .walker import DEFAULT_WORKERS, scan_tree
+
+INDEX_VERSION = 1
+
+# Bytes hashed at each end of a file by the partial hash; files of up to
+# twice this size are hashed whole at that stage
+PARTIAL_BLOCK = 16 * 1024
+
+# Bytes fed to the hash per update() call while hashing a mapped file
+HASH_WINDOW = 8 << 20
+
+# Digest size of the BLAKE2b hashes, in bytes
+DIGEST_SIZE = 20
+
+# Minimum delay between two 'progress' events
+PROGRESS_INTERVAL = 0.1
+
+# Index key: (device, inode, size, mtime_ns); value: (partial hash, full hash or None)
+IndexKey = Tuple[int, int, int, int]
+IndexRecord = Tuple[bytes, Optional[bytes]]
+
+class HashIndex:
+    """
+    File hashes for one root, persisted between runs.
+
+    Hashes are keyed by (device, inode, size, mtime_ns), so a file that was
+    modified, replaced or truncated gets a new key and is hashed again,
+    while renamed files keep theirs. Only keys seen by the latest run are
+    saved, which keeps the index from growing without bound.
+    """
+
+    def __init__(self, root: str, index_dir: Optional[str] = None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        name = hashlib.sha1(self.root.encode('utf-8', 'surrogateescape')).hexdigest() + '.idx'
+        self.path = os.path.join(index_dir or get_data_dir('hashes'), name)
+        self.records: Dict[IndexKey, IndexRecord] = {}
+
+    def load(self) -> None:
+        """Load the index from disk, ignoring missing or incompatible files."""
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.path, 'rb') as fh:
+                version, root, records = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if version == INDEX_VERSION and root == self.root:
+            self.records = records
+
+    def save(self) -> None:
+        """Write the index atomically."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as fh:
+            fh.write(marshal.dumps((INDEX_VERSION, self.root, self.records)))
+        os.replace(tmp, self.path)
+
+def partial_hash(path: str, size: int) -> bytes:
+    """
+    Hash the first and last PARTIAL_BLOCK bytes of a file (all of it if small).
+
+    Args:
+        path: File to hash
+        size: Its size, as seen by the scan
+
+    Returns:
+        bytes: The digest
+    """
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if size <= 2 * PARTIAL_BLOCK:
+            digest.update(os.pread(fd, size, 0))
+        else:
+            digest.update(os.pread(fd, PARTIAL_BLOCK, 0))
+            digest.update(os.pread(fd, PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+    finally:
+        os.close(fd)
+    return digest.digest()
+
+def full_hash(path: str, size: int) -> bytes:
+    """
+    Hash a whole file through a read-only memory map.
+
+    hashlib releases the GIL while it hashes large buffers, so several files
+    are hashed concurrently by a thread pool.
+
+    Args:
+        path: File to hash
+        size: Its size, as seen by the scan
+
+    Returns:
+        bytes: The digest
+
+    Raises:
+        OSError: If the file changed size since it was scanned
+    """
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size != size:
+            raise OSError(f"{path} changed while being hashed")
+        if size == 0:
+            # Empty files cannot be mapped
+            return digest.digest()
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                for start in range(0, size, HASH_WINDOW):
+                    digest.update(view[start:start + HASH_WINDOW])
+            finally:
+                view.release()
+    return digest.digest()
+
+class DuplicateFinder:
+    """
+    Finds files with identical contents below a root, in three stages.
+
+    1. A parallel scandir walk buckets files by size; sizes seen once are
+       discarded without reading anything.
+    2. Files in the remaining buckets get a partial hash of their first and
+       last block.
+    3. Files that still collide on (size, partial hash) are hashed in full
+       through mmap.
+
+    Both hashing stages run on a thread pool and consult the persistent
+    hash index first, so a repeat run only hashes files that changed.
+    Hard links to the same inode are counted once.
+    """
+
+    def __init__(self, root: str, predicates: Optional[List[str]] = None,
+                 workers: Optional[int] = None,
+                 progress: Optional[Callable[[Dict], None]] = None,
+                 index_dir: Optional[str] = None):
+        """
+        Initialize the finder.
+
+        Args:
+            root: Directory to search
+            predicates: ``key=value`` file selection predicates, as in
+                FindQuery; empty files are skipped unless ``min_size=0``
+            workers: Number of scanner and hashing threads
+            progress: Optional callback receiving progress event dicts
+            index_dir: Directory holding the hash indexes (defaults to ~/.hcmd/hashes)
+        """
+        predicates = list(predicates or [])
+        if not any(p.startswith('min_size=') for p in predicates):
+            predicates.append('min_size=1')
+        self.query = FindQuery(root, predicates + ['type=f'])
+        self.workers = workers or DEFAULT_WORKERS
+        self.progress = progress
+        self.index = HashIndex(self.query.root, index_dir)
+        self._last_emit = 0.0
+        self.stats = {
+            'root': self.query.root,
+            'files_total': 0,
+            'files_done': 0,
+            'bytes_total': 0,
+            'bytes_done': 0,
+            'partial_hashed': 0,
+            'full_hashed': 0,
+            'reused': 0,
+            'errors': [],
+            'elapsed': 0.0,
+        }
+
+    def _emit(self, event: str, force: bool = False) -> None:
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_emit < PROGRESS_INTERVAL:
+            return
+        self._last_emit = now
+        self.progress(dict(self.stats, event=event, errors=len(self.stats['errors'])))
+
+    def _bucket(self) -> Dict[int, List[Tuple[str, IndexKey]]]:
+        """Stage 1: group the selected files by size, one path per inode."""
+        by_size: Dict[int, List[Tuple[str, IndexKey]]] = {}
+        inodes = set()
+        now = time.time()
+        for scanned in scan_tree(self.query.root, workers=self.workers, prune=self.query.prune,
+                                 with_stat=True, select=lambda entry: self.query.matches(entry, now)):
+            if scanned.error is not None:
+                self.stats['errors'].append(f"{scanned.path}: {scanned.error.strerror}")
+            for entry in scanned.files:
+                st = entry.stat(follow_symlinks=False)
+                if entry.is_symlink() or (st.st_dev, st.st_ino) in inodes:
+                    continue
+                inodes.add((st.st_dev, st.st_ino))
+                self.stats['files_total'] += 1
+                self.stats['bytes_total'] += st.st_size
+                key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+                by_size.setdefault(st.st_size, []).append((entry.path, key))
+            self._emit('scan')
+        return {size: files for size, files in by_size.items() if len(files) > 1}
+
+    def _hash_stage(self, pool: ThreadPoolExecutor, files: List[Tuple[str, IndexKey]],
+                    known: Dict[IndexKey, IndexRecord], full: bool) -> Dict[IndexKey, bytes]:
+        """Hash files (partially or fully), reusing indexed hashes; returns key -> digest."""
+        digests: Dict[IndexKey, bytes] = {}
+        todo = []
+        for path, key in files:
+            record = known.get(key)
+            cached = record and (record[1] if full else record[0])
+            if cached:
+                digests[key] = cached
+                self.stats['reused'] += 1
+            else:
+                todo.append((path, key))
+
+        hash_file = full_hash if full else partial_hash
+        self.stats['files_done'] = 0
+        self.stats['files_total'] = len(todo)
+        self.stats['bytes_done'] = 0
+        self.stats['bytes_total'] = sum(key[2] if full else min(key[2], 2 * PARTIAL_BLOCK)
+                                        for _, key in todo)
+        futures = [(path, key, pool.submit(hash_file, path, key[2])) for path, key in todo]
+        for path, key, future in futures:
+            try:
+                digests[key] = future.result()
+            except OSError as e:
+                self.stats['errors'].append(f"{path}: {e.strerror or e}")
+                continue
+            finally:
+                self.stats['files_done'] += 1
+                self.stats['bytes_done'] += key[2] if full else min(key[2], 2 * PARTIAL_BLOCK)
+                self._emit('progress')
+        self.stats['full_hashed' if full else 'partial_hashed'] += len(todo)
+        return digests
+
+    def run(self) -> Dict:
+        """
+        Find the duplicate groups.
+
+        Returns:
+            Dict: ``groups`` (each ``{'size', 'paths', 'wasted'}``, most
+            wasted bytes first), the total ``wasted`` bytes and statistics
+        """
+        started = time.monotonic()
+        if not os.path.isdir(self.query.root):
+            raise NotADirectoryError(f"Not a directory: {self.query.root}")
+        self.index.load()
+        known = self.index.records
+
+        buckets = self._bucket()
+        self._emit('scan', force=True)
+        candidates = [item for files in buckets.values() for item in files]
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hcmd-hash') as pool:
+            partial = self._hash_stage(pool, candidates, known, full=False)
+            by_partial: Dict[Tuple[int, bytes], List[Tuple[str, IndexKey]]] = {}
+            for path, key in candidates:
+                if key in partial:
+                    by_partial.setdefault((key[2], partial[key]), []).append((path, key))
+
+            # Small files were hashed whole by the partial stage
+            colliding = [item for files in by_partial.values() if len(files) > 1 for item in files]
+            large = [(path, key) for path, key in colliding if key[2] > 2 * PARTIAL_BLOCK]
+            full = self._hash_stage(pool, large, known, full=True)
+            for path, key in colliding:
+                if key[2] <= 2 * PARTIAL_BLOCK:
+                    full[key] = partial[key]
+
+        by_content: Dict[Tuple[int, bytes], List[str]] = {}
+        for path, key in colliding:
+            if key in full:
+                by_content.setdefault((key[2], full[key]), []).append(path)
+        groups = [{'size': size, 'paths': sorted(paths), 'wasted': size * (len(paths) - 1)}
+                  for (size, _), paths in by_content.items() if len(paths) > 1]
+        groups.sort(key=lambda group: (-group['wasted'], group['paths'][0]))
+
+        records = {}
+        for key, digest in partial.items():
+            if key[2] <= 2 * PARTIAL_BLOCK:
+                records[key] = (digest, digest)
+            else:
+                records[key] = (digest, full.get(key) or (known.get(key) or (None, None))[1])
+        if records != known:
+            self.index.records = records
+            self.index.save()
+
+        self.stats['files_total'] = len(candidates)
+        self.stats['files_done'] = len(candidates)
+        self.stats['elapsed'] = round(time.monotonic() - started, 3)
+        self._emit('done', force=True)
+        return dict(self.stats, groups=groups, wasted=sum(group['wasted'] for group in groups))
+
+def find_duplicates(root: str, predicates: Optional[List[str]] = None,
+                    progress: Optional[Callable[[Dict], None]] = None,
+                    workers: Optional[int] = None, index_dir: Optional[str] = None) -> Dict:
+    """
+    Find files with identical contents below a directory.
+
+    Args:
+        root: Directory to search
+        predicates: ``key=value`` file selection predicates (see FindQuery)
+        progress: Optional callback receiving progress event dicts
+        workers: Number of scanner and hashing threads
+        index_dir: Directory holding the hash indexes
+
+    Returns:
+        Dict: The duplicate groups and statistics (see DuplicateFinder.run)
+    """
+    return DuplicateFinder(root, predicates, workers=workers, progress=progress,
+                           index_dir=index_dir).run()
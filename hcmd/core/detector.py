@@ -1,4 +1,5 @@
 """OS detection module for the hcmd tool."""
+import functools
 import platform
 import os
 import sys
@@ -50,27 +51,41 @@ def get_system_directory(directory_name: str, os_type: OS = None) -> str:
         str: The path to the requested system directory
     """
     if os_type is None:
-        os_type, _ = detect_os()
+        os_type = get_os()
     
     directory_name = directory_name.lower()
     if directory_name in SYSTEM_DIRECTORIES:
         return SYSTEM_DIRECTORIES[directory_name].get(os_type.value, '')
     return ''
 
-# Cache for OS detection
-_os_cache = None
-_shell_cache = None
+@functools.lru_cache(maxsize=1)
+def _detected() -> Tuple[OS, str]:
+    """detect_os(), computed once; lru_cache is safe to share between threads."""
+    return detect_os()
 
 def get_os() -> OS:
     """Get the current OS (cached)."""
-    global _os_cache
-    if _os_cache is None:
-        _os_cache, _ = detect_os()
-    return _os_cache
+    return _detected()[0]
 
 def get_shell() -> str:
     """Get the current shell (cached)."""
-    global _shell_cache
-    if _shell_cache is None:
-        _, _shell_cache = detect_os()
-    return _shell_cache
\ No newline at end of file
+    return _detected()[1]
+
+
+def get_data_dir(*parts: str) -> str:
+    """
+    Get (and create) a directory for hcmd's persistent state.
+    
+    The base directory is ``~/.hcmd`` unless overridden by the ``HCMD_HOME``
+    environment variable.
+    
+    Args:
+        *parts: Optional sub-directory components below the base directory
+        
+    Returns:
+        str: The absolute path to the directory
+    """
+    base = os.environ.get('HCMD_HOME') or os.path.join(os.path.expanduser('~'), '.hcmd')
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,192 @@
+"""Disk usage aggregator with a persistent per-directory size index."""
+import gc
+import hashlib
+import heapq
+import marshal
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .detector import get_data_dir
+from .walker import DEFAULT_WORKERS
+
+INDEX_VERSION = 1
+
+# Largest files remembered per directory, for "biggest files" queries
+BIG_FILES_PER_DIR = 16
+
+# Index record: (inode, mtime_ns, own_bytes, own_files, subdir_names, big_files)
+# where big_files is a tuple of (bytes, name) pairs.
+IndexRecord = Tuple[int, int, int, int, Tuple[str, ...], Tuple[Tuple[int, str], ...]]
+
+def _allocated(st: os.stat_result) -> int:
+    """Bytes actually allocated on disk, falling back to the apparent size."""
+    blocks = getattr(st, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+class SizeIndex:
+    """
+    Per-directory size index for one root, persisted between runs.
+
+    Each directory is recorded with its inode and mtime. A directory whose
+    inode and mtime are unchanged is not rescanned; its recorded totals and
+    sub-directories are reused. Adding, removing or renaming an entry
+    changes a directory's mtime, but growing a file in place does not, so
+    in-place growth is only picked up once its directory changes.
+    """
+
+    def __init__(self, root: str, index_dir: Optional[str] = None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        name = hashlib.sha1(self.root.encode('utf-8', 'surrogateescape')).hexdigest() + '.idx'
+        self.path = os.path.join(index_dir or get_data_dir('du'), name)
+        self.records: Dict[str, IndexRecord] = {}
+
+    def load(self) -> None:
+        """Load the index from disk, ignoring missing or incompatible files."""
+        # One read plus loads() is far faster than marshal.load() on a file,
+        # and the cyclic GC has nothing to find in freshly built tuples.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.path, 'rb') as fh:
+                version, root, records = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if version == INDEX_VERSION and root == self.root:
+            self.records = records
+
+    def save(self) -> None:
+        """Write the index atomically."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as fh:
+            fh.write(marshal.dumps((INDEX_VERSION, self.root, self.records)))
+        os.replace(tmp, self.path)
+
+def _scan_dir(path: str, st: os.stat_result) -> IndexRecord:
+    own_bytes = own_files = 0
+    subdirs: List[str] = []
+    big: List[Tuple[int, str]] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    size = _allocated(entry.stat(follow_symlinks=False))
+                except OSError:
+                    continue
+                own_bytes += size
+                own_files += 1
+                if len(big) < BIG_FILES_PER_DIR:
+                    heapq.heappush(big, (size, entry.name))
+                elif size > big[0][0]:
+                    heapq.heapreplace(big, (size, entry.name))
+    except OSError:
+        pass
+    return (st.st_ino, st.st_mtime_ns, own_bytes, own_files, tuple(subdirs), tuple(big))
+
+def _refresh(index: SizeIndex, workers: int) -> Tuple[Dict[str, IndexRecord], int]:
+    """
+    Validate the index against the filesystem, rescanning changed directories.
+
+    Validation is a cheap ``lstat`` per directory and runs inline; only the
+    directories that changed are rescanned, in parallel, one wave at a time
+    (a rescan may discover new sub-directories for the next wave).
+    """
+    fresh: Dict[str, IndexRecord] = {}
+    old = index.records
+    rescanned = 0
+    stack = [index.root]
+    sep = os.sep
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hcmd-du') as pool:
+        while stack:
+            changed: List[Tuple[str, os.stat_result]] = []
+            while stack:
+                path = stack.pop()
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                record = old.get(path)
+                if record is None or record[0] != st.st_ino or record[1] != st.st_mtime_ns:
+                    changed.append((path, st))
+                    continue
+                fresh[path] = record
+                prefix = path.rstrip(sep) + sep
+                stack.extend([prefix + name for name in record[4]])
+
+            if changed:
+                rescanned += len(changed)
+                for (path, _), record in zip(changed, pool.map(lambda item: _scan_dir(*item), changed)):
+                    fresh[path] = record
+                    prefix = path.rstrip(sep) + sep
+                    stack.extend([prefix + name for name in record[4]])
+    # Every directory is inserted after its parent
+    return fresh, rescanned
+
+def disk_usage(root: str, top: int = 10, kind: Optional[str] = None,
+               workers: Optional[int] = None, index_dir: Optional[str] = None) -> Dict:
+    """
+    Answer a "what is taking up space" query.
+
+    Args:
+        root: Directory to measure
+        top: Number of entries to return
+        kind: 'd' for the biggest immediate sub-directories, 'f' for the
+            biggest files anywhere below root, None for the biggest
+            immediate children of either kind
+        workers: Number of scanner threads
+        index_dir: Directory holding the size indexes (defaults to ~/.hcmd/du)
+
+    Returns:
+        Dict: Totals, the ``top`` entries (largest first) and index statistics
+    """
+    started = time.monotonic()
+    index = SizeIndex(root, index_dir)
+    if not os.path.isdir(index.root):
+        raise NotADirectoryError(f"Not a directory: {index.root}")
+    index.load()
+    records, rescanned = _refresh(index, workers or DEFAULT_WORKERS)
+    if rescanned or len(records) != len(index.records):
+        index.records = records
+        index.save()
+
+    # Roll directory totals up to their parents; children come after their
+    # parent in the refreshed index, so walking it backwards is bottom-up.
+    totals = {path: record[2] for path, record in records.items()}
+    for path in reversed(list(records)):
+        if path != index.root:
+            parent = path[:path.rindex(os.sep)] or os.sep
+            if parent in totals:
+                totals[parent] += totals[path]
+
+    root_record = records[index.root]
+    candidates: List[Tuple[int, str, str]] = []
+    if kind == 'f':
+        for path, record in records.items():
+            candidates.extend((size, os.path.join(path, name), 'f') for size, name in record[5])
+    else:
+        candidates.extend((totals.get(os.path.join(index.root, name), 0),
+                           os.path.join(index.root, name), 'd') for name in root_record[4])
+        if kind is None:
+            candidates.extend((size, os.path.join(index.root, name), 'f')
+                              for size, name in root_record[5])
+
+    largest = heapq.nlargest(top, candidates)
+    return {
+        'root': index.root,
+        'bytes': totals[index.root],
+        'files': sum(record[3] for record in records.values()),
+        'directories': len(records),
+        'top': [{'path': path, 'bytes': size, 'type': entry_type}
+                for size, path, entry_type in largest],
+        'rescanned': rescanned,
+        'reused': len(records) - rescanned,
+        'elapsed': round(time.monotonic() - started, 3),
+    }
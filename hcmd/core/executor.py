@@ -4,32 +4,54 @@ import platform
 import shlex
 import subprocess
 import sys
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
-from ..constants import OS
+from ..constants import CommandType, OS
+from .command import Command, MODE_ARGV, MODE_EVAL, MODE_NATIVE, NATIVE_COMMAND_TYPES
 from .detector import get_os, get_shell
-from .validator import is_command_safe
+from .metrics import CACHE_LOOKUPS, EXIT_CODES, STAGE_SECONDS
+from .resultcache import ResultCache
+from .validator import (is_command_safe, is_path_protected, is_process_protected, is_system_destination,
+                        validate_command)
+
+if TYPE_CHECKING:
+    from .launcher import Limits  # imported lazily at run time
+    from .undo import UndoJournal
 
 class CommandExecutor:
     """Handles execution of terminal commands with safety checks."""
     
-    def __init__(self, dry_run: bool = False, os_type: Optional[OS] = None):
+    def __init__(self, dry_run: bool = False, os_type: Optional[OS] = None,
+                 use_zygote: bool = False, cache: Optional[ResultCache] = None,
+                 journal: Optional['UndoJournal'] = None):
         """
         Initialize the command executor.
         
         Args:
             dry_run: If True, only print commands without executing them
             os_type: The operating system type. If not provided, it will be detected.
+            use_zygote: If True, shell-mode commands are launched by a small
+                pre-started helper process instead of forking this one
+            cache: Optional result cache for read-only commands, worth
+                sharing across calls in long-running sessions
+            journal: Optional undo journal; deletes and overwrites are then
+                staged instead of removed, and moves and created paths are
+                recorded, so ``hcmd undo`` can reverse them
         """
         self.os_type = os_type if os_type is not None else get_os()
-        print(f"DEBUG: Executor initialized with OS type: {self.os_type}", file=sys.stderr)  # Print to stderr
         self.dry_run = dry_run
+        self.use_zygote = use_zygote
+        self.cache = cache
+        self.journal = journal
         self.platform = platform.system().lower()
     
     def _get_shell_command(self, command: str) -> Tuple[str, list]:
         """
         Get the appropriate shell command and arguments for the current platform.
         
+        The command is passed to the shell as is; rewriting free text is
+        left to the legacy string entry points (see _rewrite_legacy).
+        
         Args:
             command: The command to execute
             
@@ -44,26 +66,34 @@ class CommandExecutor:
                 return shell, ['/c', command]
         else:
             shell = os.environ.get('SHELL', '/bin/zsh' if self.os_type == OS.MACOS else '/bin/bash')
-            
-            # Handle specific commands
-            command_lower = command.lower().strip()
-            
-            # Handle list files command
-            if 'list' in command_lower and ('file' in command_lower or 'directory' in command_lower):
-                path = '.'
-                if ' in ' in command_lower:
-                    dir_part = command.split(' in ')[-1].strip()
-                    if dir_part:
-                        path = dir_part
-                return shell, ['-c', f'ls -la {path}']
-                
-            # Handle cd command
-            if command_lower.startswith('cd '):
-                return shell, ['-c', command]
-                
-            # Default case - pass the command as is
             return shell, ['-c', command]
     
+    def _rewrite_legacy(self, command: str) -> str:
+        """
+        Turn a "list files [in DIR]" string into ``ls -la DIR``.
+        
+        Only for the string entry points, execute and execute_interactive;
+        typed commands from the generator are never re-parsed.
+        
+        Args:
+            command: The stripped command string
+            
+        Returns:
+            The command to run
+        """
+        command_lower = command.lower()
+        if not ('list' in command_lower and ('file' in command_lower or 'directory' in command_lower)):
+            return command
+        # If the command is just 'list files', use current directory
+        if command_lower in ['list files', 'list file', 'list directory', 'list files in .', 'list file in .', 'list directory in .']:
+            return 'ls -la .'
+        # If the command has a specific directory
+        if ' in ' in command_lower:
+            dir_part = command.split(' in ')[-1].strip()
+            if dir_part and dir_part.lower() not in ['here', 'current directory']:
+                return f'ls -la {dir_part}'
+        return 'ls -la .'
+    
     def execute(self, command: str, cwd: Optional[str] = None) -> Tuple[bool, str]:
         """
         Execute a shell command with safety checks.
@@ -75,25 +105,9 @@ class CommandExecutor:
         if not command or not command.strip():
             return False, "ERROR: Empty command"
 
-        command = command.strip()
-        command_lower = command.lower()
-
-        # Handle list files command
-        if 'list' in command_lower and ('file' in command_lower or 'directory' in command_lower):
-            # If the command is just 'list files', use current directory
-            if command_lower.strip() in ['list files', 'list file', 'list directory', 'list files in .', 'list file in .', 'list directory in .']:
-                command = 'ls -la .'
-            # If the command has a specific directory
-            elif ' in ' in command_lower:
-                dir_part = command.split(' in ')[-1].strip()
-                if dir_part and dir_part.lower() not in ['here', 'current directory']:
-                    command = f'ls -la {dir_part}'
-                else:
-                    command = 'ls -la .'
-            else:
-                command = 'ls -la .'
+        command = self._rewrite_legacy(command.strip())
         # Handle cd commands specially - return them for the parent shell to execute
-        elif command_lower.startswith('cd '):
+        if command.lower().startswith('cd '):
             # Safety check still applies
             is_safe, reason = is_command_safe(command)
             if not is_safe:
@@ -132,6 +146,365 @@ class CommandExecutor:
         except Exception as e:
             return False, f"Error executing command: {str(e)}"
     
+    def run(self, command: Command, cwd: Optional[str] = None,
+            progress: Optional[Callable[[Dict], None]] = None,
+            limits: Optional['Limits'] = None) -> Tuple[bool, str, Dict]:
+        """
+        Run a typed command according to its mode.
+        
+        The command is validated only if it has not been stamped with a
+        verdict yet, and its display string is never re-parsed: native
+        commands go to their engine, argv commands are executed directly,
+        and only shell-mode commands (e.g. PowerShell) go through a shell.
+        Processes are started with posix_spawn where available. Read-only
+        commands are served from the result cache when one is configured;
+        ``details['cached']`` tells whether they were.
+        
+        Args:
+            command: The command built by CommandGenerator.build_command
+            cwd: Working directory for the command
+            progress: Optional callback receiving engine events
+            
+        Returns:
+            Tuple of (success, output, details)
+        """
+        if command.verdict is None:
+            command = validate_command(command)
+        if not command.is_safe:
+            return False, f"ERROR: Unsafe command: {command.verdict[1]}", {}
+        
+        if command.mode == MODE_EVAL:
+            # Returned as-is so the parent shell can eval it
+            return True, command.display, {}
+        
+        if command.mode == MODE_NATIVE:
+            with STAGE_SECONDS.time('native'):
+                success, output, details = self.execute_native(
+                    command.command_type, list(command.args), progress=progress)
+            if not self.dry_run:
+                EXIT_CODES.inc(command.mode, '0' if success else '1')
+            return success, output, details
+        
+        if self.dry_run:
+            return True, f"[DRY RUN] {command.display}", {}
+        
+        try:
+            cached = None
+            if self.cache is not None and command.is_cacheable:
+                cached = self.cache.get(command, cwd)
+                CACHE_LOOKUPS.inc('miss' if cached is None else 'hit')
+            if cached is not None:
+                returncode, stdout, stderr = cached
+            else:
+                from .launcher import launch
+                missing: List[str] = []
+                if (self.journal is not None and command.command_type == CommandType.CREATE
+                        and command.mode == MODE_ARGV):
+                    # Every missing ancestor too: mkdir -p creates them all
+                    path = os.path.normpath(os.path.join(cwd or os.getcwd(),
+                                                         os.path.expanduser(command.argv[-1])))
+                    while not os.path.lexists(path) and os.path.dirname(path) != path:
+                        missing.insert(0, path)
+                        path = os.path.dirname(path)
+                with STAGE_SECONDS.time('subprocess'):
+                    if command.mode == MODE_ARGV:
+                        returncode, stdout, stderr = launch(command.argv, cwd, limits=limits)
+                    else:
+                        shell, shell_args = self._get_shell_command(command.display)
+                        returncode, stdout, stderr = launch([shell] + shell_args, cwd,
+                                                            use_zygote=self.use_zygote, limits=limits)
+                EXIT_CODES.inc(command.mode, str(returncode))
+                created = [path for path in missing if os.path.lexists(path)]
+                if created and returncode == 0:
+                    # Outermost first, so undo removes the innermost first
+                    txid = self.journal.begin(f"create {created[-1]}")
+                    for path in created:
+                        self.journal.record_create(txid, path)
+                    self.journal.end(txid)
+                if self.cache is not None:
+                    self.cache.put(command, (returncode, stdout, stderr), cwd)
+            
+            stdout = stdout.strip()
+            stderr = stderr.strip()
+            details = {'returncode': returncode, 'cached': cached is not None}
+            if returncode != 0:
+                return False, stderr or stdout, details
+            return True, stdout, details
+        except Exception as e:
+            return False, f"Error executing command: {str(e)}", {}
+    
+    def preview_native(self, command_type: CommandType, args: List[str]) -> Optional[Dict]:
+        """
+        Describe the impact of a native command before it runs.
+        
+        DELETE previews the files to be removed; the walk behind it is cached
+        so a following execute_native call for the same path reuses it. KILL
+        previews the processes that would be signalled.
+        
+        Args:
+            command_type: Type of the command
+            args: Resolved command arguments
+            
+        Returns:
+            The preview dict, or None if the command type has no preview
+        """
+        if command_type == CommandType.KILL and len(args) >= 2:
+            try:
+                from .procs import resolve_targets
+                options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+                return {'signal': options.get('signal', 'TERM'),
+                        'processes': [dict(p, protected=is_process_protected(p))
+                                      for p in resolve_targets(args[0], args[1])]}
+            except (OSError, ValueError) as e:
+                return {'error': getattr(e, 'strerror', None) or str(e)}
+        
+        if command_type != CommandType.DELETE or not args:
+            return None
+        
+        try:
+            from .remover import plan_delete
+            return plan_delete(args[0]).preview()
+        except OSError as e:
+            return {'path': args[0], 'error': e.strerror or str(e)}
+    
+    def execute_native(self, command_type: CommandType, args: List[str],
+                       progress: Optional[Callable[[Dict], None]] = None) -> Tuple[bool, str, Dict]:
+        """
+        Execute a command with one of the in-process engines.
+        
+        Args:
+            command_type: Type of the command, one of NATIVE_COMMAND_TYPES
+            args: Resolved command arguments (absolute or user-relative paths)
+            progress: Optional callback receiving progress event dicts
+            
+        Returns:
+            Tuple of (success, output, details) where details holds the
+            engine's structured result
+        """
+        if command_type not in NATIVE_COMMAND_TYPES:
+            return False, f"ERROR: No native engine for {command_type.name}", {}
+
+        if self.dry_run:
+            return True, f"[DRY RUN] {command_type.name} {' '.join(args)}", {}
+
+        try:
+            if command_type in (CommandType.COPY, CommandType.MOVE):
+                from .transfer import transfer_tree
+                if len(args) < 2:
+                    return False, f"ERROR: {command_type.name} requires source and destination", {}
+                move = command_type == CommandType.MOVE
+                if move and is_path_protected(args[0]):
+                    return False, "ERROR: Refusing to move a root or system directory", {}
+                undo = self.journal.begin_transfer(args[0], args[1], move) if self.journal is not None else None
+                try:
+                    stats = transfer_tree(args[0], args[1], move=move, progress=progress)
+                except BaseException:
+                    # Put back what the transfer had started to replace
+                    if undo is not None:
+                        self.journal.abort_transfer(undo[0], undo[1])
+                    raise
+                if undo is not None:
+                    self.journal.end_transfer(undo[0], args[0], undo[1], move)
+                if stats['errors']:
+                    return False, f"{len(stats['errors'])} file(s) failed: {stats['errors'][0]}", stats
+                verb = 'Moved' if command_type == CommandType.MOVE else 'Copied'
+                skipped = stats.get('special_skipped')
+                return True, (f"{verb} {stats['files_done']} file(s), "
+                              f"{stats['bytes_done']} bytes to {stats['target']}"
+                              + (f"; skipped {len(skipped)} device(s) or socket(s)" if skipped else '')), stats
+            
+            if command_type == CommandType.DELETE:
+                from .remover import delete_tree
+                if not args or is_path_protected(args[0]):
+                    return False, "ERROR: Refusing to delete a root or system directory", {}
+                if self.journal is not None:
+                    # Staged with a single rename; falls back to deleting when
+                    # the path's filesystem has no usable staging directory
+                    txid = self.journal.begin(f"delete {args[0]}")
+                    staged = self.journal.stage(txid, args[0])
+                    self.journal.end(txid)
+                    if staged is not None:
+                        self.journal.maybe_collect()
+                        return True, f"Deleted {args[0]} (undo with 'hcmd undo')", {
+                            'path': args[0], 'staged': staged, 'transaction': txid}
+                stats = delete_tree(args[0])
+                if stats['errors']:
+                    return False, f"{len(stats['errors'])} path(s) failed: {stats['errors'][0]}", stats
+                return True, (f"Deleted {stats['files']} file(s) and {stats['directories']} "
+                              f"director{'y' if stats['directories'] == 1 else 'ies'} "
+                              f"({stats['bytes']} bytes)"
+                              + ("; this delete is permanent, it could not be staged for undo"
+                                 if self.journal is not None else '')), stats
+            
+            if command_type == CommandType.ARCHIVE:
+                from .archive import create_archive
+                if len(args) < 2:
+                    return False, "ERROR: ARCHIVE requires a source and an archive name", {}
+                options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+                stats = create_archive(args[0], args[1], level=int(options['level']) if 'level' in options else None,
+                                       progress=progress)
+                if stats['errors']:
+                    return False, f"{len(stats['errors'])} path(s) failed: {stats['errors'][0]}", stats
+                return True, (f"Archived {stats['files_done']} file(s), {stats['bytes_done']} bytes "
+                              f"into {stats['target']} ({stats['bytes_written']} bytes)"), stats
+            
+            if command_type == CommandType.EXTRACT:
+                from .archive import extract_archive
+                if not args or not os.path.isfile(args[0]):
+                    return False, f"ERROR: No such archive: {args[0] if args else ''}", {}
+                if is_system_destination(args[1] if len(args) > 1 else '.'):
+                    return False, "ERROR: Refusing to extract into the root or a system directory", {}
+                stats = extract_archive(args[0], args[1] if len(args) > 1 else '.', progress=progress)
+                if stats['errors']:
+                    return False, f"{len(stats['errors'])} member(s) failed: {stats['errors'][0]}", stats
+                return True, f"Extracted {stats['files_done']} file(s) into {stats['target']}", stats
+            
+            if command_type == CommandType.FIND:
+                from .search import FindQuery, find
+                query = FindQuery(args[0] if args else '.', args[1:])
+                if not os.path.isdir(query.root):
+                    return False, f"ERROR: Not a directory: {query.root}", {}
+                matches = []
+                count = 0
+                for match in find(query):
+                    count += 1
+                    if progress is not None:
+                        progress(dict(match, event='match'))
+                    else:
+                        matches.append(match)
+                details = {'root': query.root, 'count': count}
+                if progress is None:
+                    details['matches'] = matches
+                return True, f"{count} match(es)", details
+            
+            if command_type == CommandType.CONTENT_SEARCH:
+                from .grep import GrepQuery, grep
+                if len(args) < 2:
+                    return False, "ERROR: Content search requires a search text", {}
+                query = GrepQuery(args[0], args[1], args[2:])
+                if not os.path.exists(query.files.root):
+                    return False, f"ERROR: No such file or directory: {query.files.root}", {}
+                matches = []
+                count = 0
+                binary = 0
+                for match in grep(query):
+                    if match.get('binary'):
+                        binary += 1
+                        continue
+                    count += 1
+                    if progress is not None:
+                        progress(dict(match, event='match'))
+                    else:
+                        matches.append(match)
+                details = {'root': query.files.root, 'pattern': query.pattern,
+                           'count': count, 'binary_skipped': binary}
+                if progress is None:
+                    details['matches'] = matches
+                return True, f"{count} matching line(s)", details
+            
+            if command_type == CommandType.DISK_USAGE:
+                from .diskusage import disk_usage
+                options = dict(arg.split('=', 1) for arg in args[1:] if '=' in arg)
+                usage = disk_usage(args[0] if args else '.', top=int(options.get('top', 10)),
+                                   kind=options.get('type'))
+                if progress is not None:
+                    for entry in usage['top']:
+                        progress(dict(entry, event='entry'))
+                return True, (f"{usage['bytes']} bytes in {usage['files']} file(s) and "
+                              f"{usage['directories']} director{'y' if usage['directories'] == 1 else 'ies'}"), usage
+            
+            if command_type == CommandType.PROCESS:
+                from .procs import find_processes, port_users, top_processes
+                options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+                if args and args[0] == 'port':
+                    sockets = port_users(int(args[1]))
+                    if progress is not None:
+                        for sock in sockets:
+                            progress(dict(sock, event='socket'))
+                    return True, f"{len(sockets)} socket(s) on port {args[1]}", {'port': int(args[1]),
+                                                                                  'sockets': sockets}
+                if args and args[0] == 'name':
+                    processes = find_processes(args[1])
+                else:
+                    processes = top_processes(args[1] if len(args) > 1 else 'memory',
+                                              int(options.get('count', 10)))
+                if progress is not None:
+                    for process in processes:
+                        progress(dict(process, event='process'))
+                return True, f"{len(processes)} process(es)", {'processes': processes}
+            
+            if command_type == CommandType.KILL:
+                from .procs import resolve_targets, send_signal
+                if len(args) < 2:
+                    return False, "ERROR: KILL requires a process name, pid or port", {}
+                options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+                signame = options.get('signal', 'TERM')
+                targets = resolve_targets(args[0], args[1])
+                if not targets:
+                    return False, f"ERROR: No process matches {args[0]} {args[1]}", {}
+                # Every resolved process passes the safety gate, not just the request
+                allowed = [p for p in targets if not is_process_protected(p)]
+                refused = [p for p in targets if is_process_protected(p)]
+                if not allowed:
+                    names = ', '.join(f"{p['name']} ({p['pid']})" for p in refused)
+                    return False, f"ERROR: Refusing to signal protected process(es): {names}", {}
+                signalled, errors = send_signal(allowed, signame)
+                stats = {'signal': signame, 'signalled': signalled, 'errors': errors,
+                         'refused': [p['pid'] for p in refused], 'processes': allowed}
+                if errors:
+                    return False, f"{len(errors)} process(es) failed: {errors[0]}", stats
+                skipped = f", skipped {len(refused)} protected" if refused else ''
+                return True, (f"Sent SIG{signame} to {len(signalled)} process(es): "
+                              f"{', '.join(map(str, signalled))}{skipped}"), stats
+            
+            if command_type == CommandType.SYNC:
+                from .sync import sync_tree
+                if len(args) < 2:
+                    return False, "ERROR: SYNC requires source and destination", {}
+                options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+                stats = sync_tree(args[0], args[1], delete=options.get('delete') == '1', progress=progress)
+                if stats['errors']:
+                    return False, f"{len(stats['errors'])} path(s) failed: {stats['errors'][0]}", stats
+                return True, (f"Synced {stats['files_done']} file(s), {stats['bytes_done']} bytes to "
+                              f"{stats['target']} ({stats['files_unchanged']} unchanged, "
+                              f"{stats['files_deleted']} deleted)"), stats
+            
+            if command_type == CommandType.DEDUPE:
+                from .dedupe import find_duplicates
+                root = args[0] if args else '.'
+                if not os.path.isdir(root):
+                    return False, f"ERROR: Not a directory: {root}", {}
+                result = find_duplicates(root, args[1:], progress=progress)
+                if progress is not None:
+                    for group in result['groups']:
+                        progress(dict(group, event='group'))
+                return True, (f"{len(result['groups'])} group(s) of duplicates, "
+                              f"{result['wasted']} bytes reclaimable"), result
+
+            if command_type == CommandType.LOG:
+                from .logs import LogQuery, read_log
+                if len(args) < 2:
+                    return False, "ERROR: LOG requires a file and a mode", {}
+                query = LogQuery(args[0], args[1], args[2:])
+                if not os.path.isfile(query.path):
+                    return False, f"ERROR: No such file: {query.path}", {}
+                lines = []
+                count = 0
+                for line in read_log(query):
+                    count += 1
+                    if progress is not None:
+                        progress(dict(line, event='line'))
+                    else:
+                        lines.append(line)
+                details = {'path': query.path, 'mode': query.mode, 'count': count}
+                if progress is None:
+                    details['lines'] = lines
+                return True, f"{count} line(s)", details
+        except Exception as e:
+            return False, f"Error executing command: {str(e)}", {}
+
+        return False, f"ERROR: No native engine for {command_type.name}", {}
+    
     def execute_interactive(self, command: str, cwd: Optional[str] = None) -> int:
         """
         Execute a command in interactive mode (with user input and output).
@@ -147,25 +520,9 @@ class CommandExecutor:
             print("ERROR: Empty command", file=sys.stderr)
             return 1
 
-        command = command.strip()
-        command_lower = command.lower()
-
-        # Handle list files command
-        if 'list' in command_lower and ('file' in command_lower or 'directory' in command_lower):
-            # If the command is just 'list files', use current directory
-            if command_lower.strip() in ['list files', 'list file', 'list directory', 'list files in .', 'list file in .', 'list directory in .']:
-                command = 'ls -la .'
-            # If the command has a specific directory
-            elif ' in ' in command_lower:
-                dir_part = command.split(' in ')[-1].strip()
-                if dir_part and dir_part.lower() not in ['here', 'current directory']:
-                    command = f'ls -la {dir_part}'
-                else:
-                    command = 'ls -la .'
-            else:
-                command = 'ls -la .'
+        command = self._rewrite_legacy(command.strip())
         # Handle cd commands specially - print them ONCE for the parent shell to execute
-        elif command_lower.startswith('cd '):
+        if command.lower().startswith('cd '):
             # Safety check still applies
             is_safe, reason = is_command_safe(command)
             if not is_safe:
@@ -0,0 +1,217 @@
+"""
+Fan-out: one translated command run across many directories.
+
+A modifier naming several directories ("in each of api, web and worker",
+"in every service folder", "for every folder in ~/code") is split off the
+input and the rest is interpreted once. The command is then rendered from
+the templates table once per directory, with its path arguments taken
+relative to that directory, and the commands run concurrently on a
+Scheduler, whose per-type caps still apply (deletes and transfers run one
+at a time). Results come back in target order.
+"""
+import os
+import re
+import shlex
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from ..constants import CommandType
+from .command import Command
+from .executor import CommandExecutor
+from .generator import Candidate, CommandGenerator
+from .validator import validate_command
+
+# Commands run at the same time
+FAN_OUT_WORKERS = 8
+
+# Most directories one input may expand to
+MAX_TARGETS = 1000
+
+# Argument positions holding paths, by command type; each is taken relative
+# to the target directory. Types not listed cannot be fanned out.
+FAN_OUT_PATH_ARGS = {
+    CommandType.LIST_FILES: (0,),
+    CommandType.CREATE: (0,),
+    CommandType.DELETE: (0,),
+    CommandType.OPEN: (0,),
+    CommandType.MOVE: (0, 1),
+    CommandType.COPY: (0, 1),
+    CommandType.FIND: (0,),
+    CommandType.CONTENT_SEARCH: (0,),
+    CommandType.DISK_USAGE: (0,),
+    CommandType.DEDUPE: (0,),
+    CommandType.LOG: (0,),
+    CommandType.ARCHIVE: (0, 1),
+    CommandType.EXTRACT: (0, 1),
+    CommandType.SYNC: (0, 1),
+}
+
+# Path arguments that default to the current directory when omitted
+_OPTIONAL_PATHS = frozenset({
+    (CommandType.LIST_FILES, 0),
+    (CommandType.FIND, 0),
+    (CommandType.DISK_USAGE, 0),
+    (CommandType.DEDUPE, 0),
+    (CommandType.EXTRACT, 1),
+})
+
+_DIR_NOUN = r'(?:sub)?(?:folders?|director(?:y|ies)|dirs?|projects?|repos?|repositories)'
+
+# "in each of api, web and worker", "for each of these projects: a b c"
+_FAN_OUT_LIST = re.compile(
+    r'\s*\b(?:in|for|across|inside|on)\s+(?:each|every\s+one|all)\s+of\s+'
+    r'(?:(?:these|those|the\s+following|the|my)\s+(?:[\w-]+\s+)?' + _DIR_NOUN + r'\s*:\s*|:\s*)?'
+    r'(?P<list>(?!(?:the|these|those|my|your|all)\b).+?)\s*[.!?]?$', re.IGNORECASE)
+
+# "in every service folder", "for every folder in ~/code", "in each project under src"
+_FAN_OUT_DIRS = re.compile(
+    r'\s*\b(?:in|for|across|inside|under|on)\s+(?:each|every|all)\s+(?:of\s+)?'
+    r'(?:(?:the|my|these|those)\s+)?(?:(?P<name>[\w.-]+)\s+)?' + _DIR_NOUN + r'\b'
+    r'(?:\s+(?:in|under|of|inside|within|below)\s+(?P<root>"[^"]+"|\'[^\']+\'|\S+))?',
+    re.IGNORECASE)
+
+class FanOut(NamedTuple):
+    """A fan-out modifier split off an input."""
+    text: str                     # The input without the modifier
+    paths: Optional[List[str]]    # Directories listed explicitly, in input order
+    root: str                     # Otherwise: the directory whose sub-directories are targets
+    name: Optional[str]           # ... keeping only those whose name contains this
+
+class FanOutPlan(NamedTuple):
+    """A command interpreted once and built for every target."""
+    fan_out: FanOut
+    best: Optional[Candidate]                       # The interpretation of ``fan_out.text``
+    commands: List[Tuple[str, Optional[Command]]]   # (target, validated command or None)
+    error: Optional[str]
+
+def parse_fan_out(text: str) -> Optional[FanOut]:
+    """
+    Split a fan-out modifier off an input.
+
+    Returns:
+        FanOut, or None if the input names a single place
+    """
+    match = _FAN_OUT_LIST.search(text)
+    if match:
+        items = re.sub(r',|\band\b', ' ', match.group('list'))
+        try:
+            paths = shlex.split(items)
+        except ValueError:
+            paths = items.split()
+        rest = text[:match.start()].strip()
+        if paths and rest:
+            return FanOut(rest, paths, '.', None)
+    match = _FAN_OUT_DIRS.search(text)
+    if match:
+        rest = ' '.join((text[:match.start()] + ' ' + text[match.end():]).split())
+        root = (match.group('root') or '.').strip('"\'')
+        if rest:
+            return FanOut(rest, None, root, match.group('name'))
+    return None
+
+def expand_targets(fan_out: FanOut, generator: CommandGenerator) -> List[str]:
+    """
+    The target directories of a fan-out.
+
+    Listed paths keep their order and are resolved like any path argument
+    (aliases, ``~``). Otherwise the non-hidden sub-directories of the root
+    are taken in name order.
+
+    Raises:
+        OSError: If the root cannot be listed
+        ValueError: If there are more than MAX_TARGETS targets
+    """
+    if fan_out.paths is not None:
+        targets = [generator.resolve_path(path) for path in fan_out.paths]
+    else:
+        root = generator.resolve_path(fan_out.root) or '.'
+        name = fan_out.name.lower() if fan_out.name else None
+        with os.scandir(root) as entries:
+            names = sorted(entry.name for entry in entries
+                           if entry.is_dir() and not entry.name.startswith('.')
+                           and (name is None or name in entry.name.lower()))
+        targets = [os.path.join(root, entry) if root != '.' else entry for entry in names]
+    if len(targets) > MAX_TARGETS:
+        raise ValueError(f"{len(targets)} targets, more than the limit of {MAX_TARGETS}")
+    return targets
+
+def target_args(generator: CommandGenerator, command_type: CommandType,
+                args: List[str], target: str) -> List[str]:
+    """The arguments of a command, with its path arguments taken relative to ``target``."""
+    args = list(args)
+    for position in FAN_OUT_PATH_ARGS.get(command_type, ()):
+        if position < len(args):
+            # Absolute paths, aliases and ~ stay where they point
+            path = generator.resolve_path(args[position])
+            args[position] = target if path in ('', '.') else os.path.join(target, path)
+        elif position == len(args) and (command_type, position) in _OPTIONAL_PATHS:
+            args.append(target)
+    return args
+
+def plan_fan_out(generator: CommandGenerator, fan_out: FanOut) -> FanOutPlan:
+    """Interpret the input once and build its command for every target."""
+    candidates = generator.candidates(fan_out.text, 1)
+    best = candidates[0] if candidates else None
+    if best is None:
+        return FanOutPlan(fan_out, None, [], "could not understand the input")
+    if best.command_type not in FAN_OUT_PATH_ARGS:
+        return FanOutPlan(fan_out, best, [],
+                          f"{best.command_type.name} commands cannot run once per directory")
+    try:
+        targets = expand_targets(fan_out, generator)
+    except (OSError, ValueError) as e:
+        return FanOutPlan(fan_out, best, [], getattr(e, 'strerror', None) or str(e))
+    if not targets:
+        return FanOutPlan(fan_out, best, [], "no matching directories")
+    commands = []
+    for target in targets:
+        command = generator.build_command(best.command_type,
+                                          target_args(generator, best.command_type, best.args, target))
+        commands.append((target, validate_command(command) if command is not None else None))
+    return FanOutPlan(fan_out, best, commands, None)
+
+def run_fan_out(commands: List[Tuple[str, Optional[Command]]], executor: CommandExecutor,
+                workers: int = FAN_OUT_WORKERS,
+                progress: Optional[Callable[[int, Dict], None]] = None
+                ) -> Iterator[Tuple[str, Tuple[bool, str, Dict]]]:
+    """
+    Run one command per target on a bounded worker pool.
+
+    Args:
+        commands: (target, command) pairs from plan_fan_out; targets
+            without a safe command are reported as failed, not run
+        executor: Executor the commands run on
+        workers: Number of commands run at the same time
+        progress: Optional callback receiving (target index, engine event),
+            called from the worker threads
+
+    Yields:
+        (target, (success, output, details)) in target order, each as soon
+        as it and every target before it have finished
+    """
+    from .launcher import Limits
+    from .scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Scheduler
+
+    # Each command is one interactive hcmd call: no batch-only workers and
+    # no limits beyond those of a direct run
+    scheduler = Scheduler(executor, workers=max(1, min(workers, len(commands))), reserved=0,
+                          limits={PRIORITY_INTERACTIVE: Limits(), PRIORITY_BATCH: Limits()})
+    pending = []
+    try:
+        for index, (target, command) in enumerate(commands):
+            if command is None or not command.is_safe:
+                reason = command.verdict[1] if command is not None else "no command for this target"
+                pending.append((target, None, reason))
+                continue
+            callback = None if progress is None else (lambda event, index=index: progress(index, event))
+            pending.append((target, scheduler.submit(command, progress=callback), None))
+        for target, future, reason in pending:
+            if future is None:
+                yield target, (False, f"ERROR: Unsafe command: {reason}", {})
+            else:
+                yield target, future.result()
+    finally:
+        # Stopping the iteration early drops the commands not started yet
+        for _, future, _ in pending:
+            if future is not None:
+                future.cancel()
+        scheduler.shutdown(wait=False)
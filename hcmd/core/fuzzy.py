@@ -0,0 +1,166 @@
+"""Typo-tolerant word lookup for the hcmd tool (symmetric delete / SymSpell)."""
+import hashlib
+import marshal
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .detector import get_data_dir
+
+INDEX_VERSION = 1
+
+# Largest edit distance the indexes are built for
+MAX_DISTANCE = 2
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """All strings obtained by deleting up to ``distance`` characters from ``word``."""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+def edit_distance(a: str, b: str, limit: int = MAX_DISTANCE) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus transpositions).
+
+    Returns ``limit + 1`` as soon as the distance is known to exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+class SymSpellIndex:
+    """
+    Maps misspelt words to dictionary words within a small edit distance.
+
+    Every dictionary word is expanded into its deletion neighbourhood once;
+    a lookup expands the query the same way and only verifies the few
+    candidates that share a deletion, so it costs microseconds regardless
+    of dictionary size. Built indexes are cached on disk, keyed by the
+    vocabulary, and loaded with a single read.
+    """
+
+    def __init__(self, words: Iterable[str], max_distance: int = MAX_DISTANCE,
+                 cache_dir: Optional[str] = None):
+        """
+        Build or load an index.
+
+        Args:
+            words: Dictionary words; earlier words win ties
+            max_distance: Largest edit distance supported by lookups
+            cache_dir: Directory for cached indexes (defaults to ~/.hcmd/cache);
+                pass an empty string to disable caching
+        """
+        self.words = list(dict.fromkeys(w.lower() for w in words if w))
+        self.rank = {w: i for i, w in enumerate(self.words)}
+        self.max_distance = max_distance
+        self.deletes: Dict[str, Tuple[str, ...]] = {}
+
+        key = hashlib.sha1('\n'.join(self.words + [str(max_distance)]).encode('utf-8')).hexdigest()
+        path = None
+        if cache_dir != '':
+            try:
+                path = os.path.join(cache_dir or get_data_dir('cache'), f'symspell-{key}.idx')
+            except OSError:
+                path = None
+        if path and self._load(path):
+            return
+        self._build()
+        if path:
+            self._save(path)
+
+    def _build(self) -> None:
+        table: Dict[str, List[str]] = {}
+        for word in self.words:
+            for deleted in _deletes(word, self.max_distance):
+                table.setdefault(deleted, []).append(word)
+        self.deletes = {k: tuple(v) for k, v in table.items()}
+
+    def _load(self, path: str) -> bool:
+        try:
+            with open(path, 'rb') as fh:
+                version, deletes = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if version != INDEX_VERSION:
+            return False
+        self.deletes = deletes
+        return True
+
+    def _save(self, path: str) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as fh:
+                fh.write(marshal.dumps((INDEX_VERSION, self.deletes)))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest dictionary word.
+
+        Args:
+            word: The possibly misspelt word
+            max_distance: Largest accepted distance (defaults to the index's)
+
+        Returns:
+            (word, distance) for the best match, or None if nothing is close
+            enough. Ties go to the word listed first in the dictionary.
+        """
+        word = word.lower()
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if word in self.rank:
+            return word, 0
+        best: Optional[Tuple[str, int]] = None
+        seen: Set[str] = set()
+        for deleted in _deletes(word, limit):
+            for candidate in self.deletes.get(deleted, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, limit)
+                if distance > limit:
+                    continue
+                if (best is None or distance < best[1] or
+                        (distance == best[1] and self.rank[candidate] < self.rank[best[0]])):
+                    best = (candidate, distance)
+        return best
+
+def allowed_distance(word: str) -> int:
+    """Edit distance tolerated for a word of this length (short words are risky)."""
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 7 else 2
+
+_indexes: Dict[Tuple[str, ...], SymSpellIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(words: Iterable[str]) -> SymSpellIndex:
+    """Get the process-wide index for a vocabulary, building it on first use."""
+    key = tuple(words)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = SymSpellIndex(key)
+                _indexes[key] = index
+    return index
@@ -2,126 +2,200 @@
 import os
 import platform
 import re
+import heapq
+import shlex
 import sys
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, NamedTuple, Optional, Pattern, Tuple
 
-from ..constants import CommandType, SYSTEM_DIRECTORIES, OS
+from ..constants import CommandType, COMMON_EXTENSIONS, SYSTEM_DIRECTORIES, OS
+from .archive import archive_format
+from .classifier import classify
+from .command import (CACHE_STATIC, CACHE_TTL, CACHE_WATCH, Command, MODE_ARGV, MODE_EVAL,
+                      MODE_NATIVE, MODE_SHELL, NATIVE_COMMAND_TYPES)
 from .detector import get_os, get_shell, get_system_directory
-from .validator import sanitize_input, extract_paths
+from .fuzzy import allowed_distance, get_index
+from .language import to_english
+from .metrics import INTENTS, STAGE_SECONDS
+from .rules import load_rules
+from .search import parse_size
+from .validator import sanitize_input, extract_paths, validate_command
+
+# Command types rendered from a single entry of the templates table
+TEMPLATE_COMMAND_TYPES = (
+    CommandType.NAVIGATION,
+    CommandType.LIST_FILES,
+    CommandType.CREATE,
+    CommandType.OPEN,
+    CommandType.DOCKER,
+)
+
+# Read-only templates whose results may be reused, and how
+IDEMPOTENT_TEMPLATES = {
+    'list_files': CACHE_WATCH,
+    'print_working_dir': CACHE_STATIC,
+    'docker_list_containers': CACHE_TTL,
+    'docker_list_images': CACHE_TTL,
+}
+
+# tar compression flag by archive format
+TAR_FLAGS = {'tar': '', 'tar.gz': 'z', 'tar.xz': 'J', 'tar.bz2': 'j'}
+
+# File name suffix given to new archives by format
+ARCHIVE_SUFFIXES = {'zip': '.zip', 'tar': '.tar', 'tar.gz': '.tar.gz', 'tar.xz': '.tar.xz',
+                    'tar.bz2': '.tar.bz2'}
+
+# Words that make "zip" a noun ("find all zip files", "delete the zip"),
+# unless it is followed by what to put in it ("make a tarball of src")
+_ARCHIVE_NOUN_BEFORE = re.compile(r'\b(?:the|a|an|this|that|my|all|every|each|some|old|new)\s+$')
+_ARCHIVE_NOUN_AFTER = re.compile(r'\s+(?:files?|archives?|folders?)\b')
+_ARCHIVE_CONTENTS = re.compile(r'\s+(?:of|from|with)\b')
+
+# Tokens that look like file names ("backup.zip"), ignored when looking for archive verbs
+_FILE_NAME_TOKEN = re.compile(r'\S+\.\S+')
+
+# "duplicate" as an adjective before a plural ("find duplicate jpg files"), unless
+# it is the verb of a transfer ("duplicate photos to usb", a COPY)
+_DUPLICATE_NOUN = re.compile(r'\bduplicate\s+(?:\w+\s+)?\w+s\b')
+_DUPLICATE_TRANSFER = re.compile(r'^duplicate\b.*\b(?:to|into)\s+\S+')
+
+# A local port ("port 8080", "listening on 3000", ":5432")
+_PORT_NUMBER = re.compile(r'\bport\s*:?\s*(\d{1,5})\b|\b(?:listening|bound|running)\s+on\s+:?(\d{1,5})\b'
+                          r'|(?:^|\s):(\d{1,5})\b')
+
+# "is nginx running", a PROCESS lookup rather than an OPEN
+_PROCESS_RUNNING = re.compile(r'^is\s+[\w.-]+\s+running\b')
+
+# File system nouns; "process" next to them is part of a file name ("the processes folder")
+_FILE_NOUN = re.compile(r'\b(?:files?|folders?|director(?:y|ies))\b')
+
+# Words around "process" that do not name one ("top memory processes")
+_NOT_PROCESS_NAMES = frozenset({
+    'a', 'all', 'any', 'active', 'background', 'biggest', 'cpu', 'current', 'every', 'heaviest',
+    'hungry', 'it', 'kill', 'largest', 'list', 'memory', 'my', 'of', 'ram', 'running', 'show',
+    'stop', 'system', 'that', 'the', 'these', 'this', 'those', 'top', 'user', 'what', 'which',
+})
+
+# A request to propagate deletions, trailing a SYNC ("sync docs to usb and delete removed files").
+# Only a whole word after the destination: "Deleted_Items" or "removals/" are paths.
+_SYNC_DELETE = re.compile(r'[\s,]+(?:(?:and|with|while|then)\s+)?(?:delet|remov|prun|purg)[a-z]*(?=\s|$)'
+                          r'(?!.*\s(?:to|into|onto|with)\s).*$', re.IGNORECASE)
+
+# Line-oriented requests on one file ("last 50 lines of app.log", "first 10 errors")
+_LOG_LINES = re.compile(r'\b(?:last|first|top|bottom|latest)\s+(?:\d+\s+)?'
+                        r'(?:lines?|entries|errors|warnings|exceptions)\b|\b(?:head|tail)\s+-[nf]\b')
+
+# Files that are logs by their name ("app.log", "error.log.1", "/var/log/syslog")
+_LOG_FILE = re.compile(r'(?:\.(?:log|out|err)(?:\.\d+)?|^/var/log/.+|\bsyslog|\bmessages)$')
+
+# Words that make a request about a log file a LOG ("grep app.log for timeouts")
+_LOG_VERBS = re.compile(r'\b(?:search|grep|watch|monitor|containing|mentioning|matching)\b')
+
+# Severities searched for by name ("errors in app.log"), and the text looked for
+_LOG_LEVEL = re.compile(r'\b(error|warning|exception|failure|fatal|critical)s?\b')
+LOG_LEVEL_PATTERNS = {'error': 'error', 'warning': 'warn', 'exception': 'exception',
+                      'failure': 'fail', 'fatal': 'fatal', 'critical': 'critical'}
+
+# Minimum probability for the statistical classifier's answer to be used
+CLASSIFIER_THRESHOLD = 0.6
+
+# Candidate scoring: a matching rule contributes RULE_WEIGHT (scaled down
+# for rules that only matched after a higher-priority one), the classifier's
+# probability for the same intent makes up the rest. Without any rule match
+# the classifier's probability is the score on its own.
+RULE_WEIGHT = 0.7
+AMBIGUOUS_RULE = 0.6
+TYPO_PENALTY = 0.9
+
+# Candidates returned by default, the score below which none is run, and
+# the score below which an interpretation is not worth offering at all
+DEFAULT_CANDIDATES = 3
+MIN_CONFIDENCE = 0.5
+CANDIDATE_FLOOR = 0.05
+
+# Score of the "go there" reading of a path no rule explains: an input that
+# is only a path ("~/src", "cd src") is run, a path among words no rule
+# knows ("get rid of src") is offered but not run
+PATH_ONLY_SCORE = MIN_CONFIDENCE
+PATH_DEFAULT_SCORE = 0.45
+
+# OPEN phrases that also start tests, scripts and services ("run the tests");
+# alone they leave the intent to the classifier, below the confidence gate
+AMBIGUOUS_OPEN_VERBS = frozenset({'run', 'start', 'execute'})
+
+# Intents whose path argument may be a misspelt alias ("downlaods"); a
+# misspelt name is never corrected to an alias for anything that writes
+# or deletes
+FUZZY_ALIAS_TYPES = frozenset({CommandType.NAVIGATION, CommandType.LIST_FILES})
+
+# Intents matched by plain substring phrases, after the regex-matched ones
+RULE_PHRASE_INTENTS = (
+    (CommandType.NAVIGATION, 'navigation'),
+    (CommandType.LIST_FILES, 'list_files'),
+    (CommandType.CREATE, 'create'),
+    (CommandType.DELETE, 'delete'),
+    (CommandType.MOVE, 'move'),
+    (CommandType.COPY, 'copy'),
+    (CommandType.OPEN, 'open'),
+)
+
+def _best_first(entries: List[Tuple[float, int, CommandType]],
+                k: int) -> Iterator[Tuple[float, int, CommandType]]:
+    """Heap entries best first: the k best with a bounded heap, the rest only if they are reached."""
+    top = heapq.nsmallest(k, entries)
+    yield from top
+    yield from sorted(set(entries).difference(top))
+
+class Candidate(NamedTuple):
+    """One ranked interpretation of an input."""
+    command_type: CommandType
+    args: List[str]
+    command: Command  # Built and validated
+    score: float
 
 class CommandGenerator:
     """Generates terminal commands from natural language input."""
     
-    def __init__(self):
-        self.os_type = get_os()
+    def __init__(self, os_type: Optional[OS] = None, expand_home: bool = True):
+        """
+        Initialize the generator.
+        
+        Args:
+            os_type: Platform to render commands for (defaults to the current one)
+            expand_home: If False, generated commands keep "~" for the home
+                directory instead of this user's home (for scripts run elsewhere)
+        """
+        self.os_type = os_type or get_os()
+        self.expand_home = expand_home
         self.shell = get_shell()
         self.platform = platform.system().lower()
         
+        # Templates, aliases and phrases: the built-in tables merged with the
+        # user's rules, loaded from the precompiled snapshot. They are
+        # read-only mappings shared by every generator, so one generator can
+        # be used from many threads.
+        rules = load_rules()
+        
         # Command templates by OS and command type
-        self.templates = {
-            'navigation': {
-                'windows': 'cd {path}',
-                'darwin': 'cd {path}',
-                'linux': 'cd {path}'
-            },
-            'list_files': {
-                'windows': 'Get-ChildItem',
-                'darwin': 'ls -la',
-                'linux': 'ls -la'
-            },
-            'create_file': {
-                'windows': 'New-Item -ItemType File -Path "{path}"',
-                'darwin': 'touch "{path}"',
-                'linux': 'touch "{path}"'
-            },
-            'create_dir': {
-                'windows': 'New-Item -ItemType Directory -Path "{path}"',
-                'darwin': 'mkdir -p "{path}"',
-                'linux': 'mkdir -p "{path}"'
-            },
-            'open': {
-                'windows': 'Start-Process "{path}"',
-                'darwin': 'open "{path}"',
-                'linux': 'xdg-open "{path}"'
-            },
-            'delete_file': {
-                'windows': 'Remove-Item -Path "{path}" -Force',
-                'darwin': 'rm -f "{path}"',
-                'linux': 'rm -f "{path}"'
-            },
-            'delete_dir': {
-                'windows': 'Remove-Item -Path "{path}" -Recurse -Force',
-                'darwin': 'rm -rf "{path}"',
-                'linux': 'rm -rf "{path}"'
-            },
-            'move': {
-                'windows': 'Move-Item -Path "{src}" -Destination "{dest}" -Force',
-                'darwin': 'mv "{src}" "{dest}"',
-                'linux': 'mv "{src}" "{dest}"'
-            },
-            'copy': {
-                'windows': 'Copy-Item -Path "{src}" -Destination "{dest}" -Recurse -Force',
-                'darwin': 'cp -r "{src}" "{dest}"',
-                'linux': 'cp -r "{src}" "{dest}"'
-            },
-            'print_working_dir': {
-                'windows': 'Get-Location',
-                'darwin': 'pwd',
-                'linux': 'pwd'
-            },
-            'docker_list_containers': {
-                'windows': 'docker ps -a',
-                'darwin': 'docker ps -a',
-                'linux': 'docker ps -a'
-            },
-            'docker_list_images': {
-                'windows': 'docker images',
-                'darwin': 'docker images',
-                'linux': 'docker images'
-            },
-            'docker_run': {
-                'windows': 'docker run -d {image}',
-                'darwin': 'docker run -d {image}',
-                'linux': 'docker run -d {image}'
-            },
-            'docker_stop': {
-                'windows': 'docker stop {container}',
-                'darwin': 'docker stop {container}',
-                'linux': 'docker stop {container}'
-            },
-            'docker_rm': {
-                'windows': 'docker rm {container}',
-                'darwin': 'docker rm {container}',
-                'linux': 'docker rm {container}'
-            },
-            'docker_rmi': {
-                'windows': 'docker rmi {image}',
-                'darwin': 'docker rmi {image}',
-                'linux': 'docker rmi {image}'
-            },
-            'docker_logs': {
-                'windows': 'docker logs {container}',
-                'darwin': 'docker logs {container}',
-                'linux': 'docker logs {container}'
-            }
-        }
-        
-        # Common aliases and their corresponding system directories
-        self.directory_aliases = {
-            'home': 'home',
-            '~': 'home',
-            'desktop': 'desktop',
-            'documents': 'documents',
-            'downloads': 'downloads',
-            'pictures': 'pictures',
-            'music': 'music',
-            'videos': 'videos',
-            'movies': 'videos',
-            'pics': 'pictures',
-            'docs': 'documents',
-            'dl': 'downloads'
-        }
+        self.templates = rules.templates
+        
+        # Templates split into argv tokens, filled in by build_command, and
+        # whole-word phrase regexes, filled in by the rules; both guarded by
+        # _cache_lock so a generator can be shared between threads
+        self._token_cache: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        self._phrase_patterns: Dict[str, Pattern] = {}
+        self._cache_lock = threading.Lock()
+        
+        # Common aliases and their corresponding system directories (or paths)
+        self.directory_aliases = rules.aliases
+        
+        # Trigger phrases by intent, matched against the lower-cased input
+        self.phrases = rules.phrases
+        
+        # Dictionary for typo correction, built from the phrases on first use
+        self._vocabulary: Optional[Tuple[str, ...]] = None
     
     def _get_platform_key(self) -> str:
         """Get the platform key for command templates."""
@@ -137,20 +211,32 @@ class CommandGenerator:
             # Default to linux for unknown OS
             return 'linux'
     
-    def _resolve_path(self, path: str) -> str:
-        """Resolve a path, handling special directories and environment variables."""
+    def _resolve_path(self, path: str, fuzzy: bool = False) -> str:
+        """
+        Resolve a path, handling special directories and environment variables.
+        
+        Args:
+            path: Path argument as extracted from the input
+            fuzzy: If True, a name that does not exist and is close to an
+                alias resolves to that alias (only for FUZZY_ALIAS_TYPES)
+        """
         if not path:
             return ""
             
         # Handle home directory
         if path == '~' or path.startswith('~/'):
-            return os.path.expanduser(path)
+            return os.path.expanduser(path) if self.expand_home else path
             
         # Check if it's a system directory alias
         path_lower = path.lower()
         if path_lower in self.directory_aliases:
-            sys_dir = self.directory_aliases[path_lower]
-            return get_system_directory(sys_dir, self.os_type)
+            return self._alias_target(self.directory_aliases[path_lower])
+        
+        # Tolerate typos in aliases ("downlaods"), unless the name exists as is
+        if fuzzy and path_lower.isalpha() and not os.path.exists(path):
+            match = get_index(tuple(self.directory_aliases)).lookup(path_lower, allowed_distance(path_lower))
+            if match:
+                return self._alias_target(self.directory_aliases[match[0]])
             
         # Handle Windows environment variables
         if self.os_type == OS.WINDOWS and '%' in path:
@@ -158,6 +244,12 @@ class CommandGenerator:
             
         return path
     
+    def _alias_target(self, target: str) -> str:
+        """Resolve an alias target: a system directory name or, for user aliases, a path."""
+        if target in SYSTEM_DIRECTORIES:
+            return get_system_directory(target, self.os_type)
+        return os.path.expanduser(target)
+    
     def _normalize_path(self, path: str) -> str:
         """Normalize path separators for the current OS."""
         if not path:
@@ -178,6 +270,640 @@ class CommandGenerator:
                 
         return path
     
+    def resolve_path(self, path: str, fuzzy: bool = False) -> str:
+        """Resolve a user-supplied path to one usable in-process (no shell expansion)."""
+        path = self._normalize_path(self._resolve_path(path, fuzzy))
+        return os.path.expandvars(os.path.expanduser(path)) if path else ""
+    
+    def resolve_args(self, command_type: CommandType, args: List[str]) -> List[str]:
+        """Resolve the path arguments of a command, leaving other arguments untouched."""
+        if command_type in (CommandType.FIND, CommandType.CONTENT_SEARCH, CommandType.DISK_USAGE,
+                            CommandType.DEDUPE):
+            return [self.resolve_path(args[0]) if args else '.'] + list(args[1:])
+        if command_type in (CommandType.PROCESS, CommandType.KILL):
+            return list(args)
+        if command_type == CommandType.LOG:
+            return [self.resolve_path(args[0])] + list(args[1:]) if args else []
+        if command_type in (CommandType.ARCHIVE, CommandType.EXTRACT, CommandType.SYNC):
+            return [self.resolve_path(arg) for arg in args[:2]] + list(args[2:])
+        return [self.resolve_path(arg, command_type in FUZZY_ALIAS_TYPES) for arg in args]
+    
+    def _render_find(self, args: List[str], platform_key: str) -> str:
+        """Render FIND predicates as the platform's equivalent search command."""
+        path = self._normalize_path(self._resolve_path(args[0])) if args else "."
+        predicates = dict(arg.split('=', 1) for arg in args[1:] if '=' in arg)
+        
+        if platform_key == 'windows':
+            filters = ''
+            if predicates.get('type') == 'd':
+                filters += ' -Directory'
+            else:
+                filters += ' -File'
+            if 'name' in predicates:
+                filters += f' -Filter "{predicates["name"]}"'
+            elif 'ext' in predicates:
+                filters += f' -Filter "*.{predicates["ext"]}"'
+            conditions = []
+            if 'min_size' in predicates:
+                conditions.append(f'$_.Length -gt {predicates["min_size"]}')
+            if 'max_size' in predicates:
+                conditions.append(f'$_.Length -lt {predicates["max_size"]}')
+            if 'max_age' in predicates:
+                conditions.append(f'$_.LastWriteTime -gt (Get-Date).AddSeconds(-{predicates["max_age"]})')
+            if 'min_age' in predicates:
+                conditions.append(f'$_.LastWriteTime -lt (Get-Date).AddSeconds(-{predicates["min_age"]})')
+            if conditions:
+                filters += ' | Where-Object { ' + ' -and '.join(conditions) + ' }'
+        else:
+            filters = ' -type d' if predicates.get('type') == 'd' else ' -type f'
+            if 'name' in predicates:
+                filters += f' -iname "{predicates["name"]}"'
+            elif 'ext' in predicates:
+                filters += f' -iname "*.{predicates["ext"]}"'
+            if 'min_size' in predicates:
+                filters += f' -size +{int(predicates["min_size"]) // 1024}k'
+            if 'max_size' in predicates:
+                filters += f' -size -{int(predicates["max_size"]) // 1024 + 1}k'
+            if 'max_age' in predicates:
+                filters += f' -mmin -{int(float(predicates["max_age"])) // 60}'
+            if 'min_age' in predicates:
+                filters += f' -mmin +{int(float(predicates["min_age"])) // 60}'
+        
+        return self.templates['find'][platform_key].format(path=path, filters=filters)
+    
+    def _render_content_search(self, args: List[str], platform_key: str) -> str:
+        """Render a CONTENT_SEARCH as the platform's equivalent grep command."""
+        if len(args) < 2:
+            return ""
+        path = self._normalize_path(self._resolve_path(args[0]))
+        pattern = args[1].replace('"', '\\"')
+        predicates = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+        is_regex = predicates.get('regex') == '1'
+        ignore_case = predicates.get('ignore_case') == '1'
+        
+        if platform_key == 'windows':
+            options = ('' if is_regex else '-SimpleMatch ') + ('' if ignore_case else '-CaseSensitive ')
+            filters = ''
+            if 'name' in predicates:
+                filters = f' -Filter "{predicates["name"]}"'
+            elif 'ext' in predicates:
+                filters = f' -Filter "*.{predicates["ext"]}"'
+        else:
+            options = ('E' if is_regex else 'F') + ('i' if ignore_case else '')
+            filters = ''
+            if 'name' in predicates:
+                filters = f' --include="{predicates["name"]}"'
+            elif 'ext' in predicates:
+                filters = f' --include="*.{predicates["ext"]}"'
+        
+        return self.templates['content_search'][platform_key].format(
+            path=path, pattern=pattern, options=options, filters=filters)
+    
+    def _render_archive(self, command_type: CommandType, args: List[str], platform_key: str) -> str:
+        """Render an ARCHIVE or EXTRACT as the platform's equivalent tar/zip command."""
+        if len(args) < 2:
+            return ""
+        src = self._normalize_path(self._resolve_path(args[0]))
+        dest = self._normalize_path(self._resolve_path(args[1]))
+        if command_type == CommandType.ARCHIVE:
+            fmt = archive_format(dest) or 'tar.gz'
+            if fmt == 'zip':
+                return self.templates['archive_zip'][platform_key].format(src=src, dest=dest)
+            return self.templates['archive_tar'][platform_key].format(src=src, dest=dest, flags=TAR_FLAGS[fmt])
+        template = 'extract_zip' if archive_format(src) == 'zip' else 'extract_tar'
+        return self.templates[template][platform_key].format(src=src, dest=dest)
+    
+    def _render_process(self, command_type: CommandType, args: List[str], platform_key: str) -> str:
+        """Render a PROCESS or KILL as the platform's equivalent ps/ss/kill command."""
+        if len(args) < 2:
+            return ""
+        options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+        kind, value = args[0], args[1]
+        if command_type == CommandType.KILL:
+            signal = options.get('signal', 'TERM')
+            force = ' -Force' if signal == 'KILL' else ''
+            return self.templates[f'kill_{kind}'][platform_key].format(
+                pid=value, name=value, port=value, signal=signal, force=force)
+        if kind == 'port':
+            return self.templates['process_port'][platform_key].format(port=value)
+        if kind == 'name':
+            return self.templates['process_name'][platform_key].format(name=value)
+        count = int(options.get('count', 10))
+        return self.templates[f'process_top_{value}'][platform_key].format(count=count, lines=count + 1)
+    
+    def _process_name(self, original: str) -> Optional[str]:
+        """
+        The process named in a request ("the node process", "is nginx running"), if any.
+        
+        Taken from the input as typed: names are matched case-sensitively
+        (``pkill -x NetworkManager``).
+        """
+        for pattern in (r'\b(?:named|called)\s+["\']?([\w.-]+)', r'\b([\w.-]+)\s+process(?:es)?\b',
+                        r'\bis\s+([\w.-]+)\s+running\b'):
+            match = re.search(pattern, original, re.IGNORECASE)
+            if match and match.group(1).lower() not in _NOT_PROCESS_NAMES and not match.group(1).isdigit():
+                return match.group(1)
+        return None
+    
+    def _extract_process_args(self, text: str, original: str) -> List[str]:
+        """
+        Extract what to inspect from a PROCESS request.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the process name
+            
+        Returns:
+            ``['port', N]``, ``['name', NAME]`` or ``['top', 'memory'|'cpu', 'count=N']``
+        """
+        match = _PORT_NUMBER.search(text)
+        if match:
+            return ['port', next(group for group in match.groups() if group)]
+        name = self._process_name(original)
+        if name:
+            return ['name', name]
+        sort = 'cpu' if re.search(r'\b(?:cpu|processor)\b', text) else 'memory'
+        match = re.search(r'\btop\s+(\d+)\b', text) or re.search(r'\b(\d+)\s+(?:biggest|largest|heaviest)\b', text)
+        return ['top', sort, f'count={match.group(1) if match else 10}']
+    
+    def _extract_kill_args(self, text: str, original: str) -> Optional[List[str]]:
+        """
+        Extract the target and signal of a KILL request.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the process name
+            
+        Returns:
+            ``['pid'|'name'|'port', VALUE]`` then ``signal=KILL`` for forced
+            kills; None if no process is designated
+        """
+        match = _PORT_NUMBER.search(text)
+        if match:
+            args = ['port', next(group for group in match.groups() if group)]
+        else:
+            match = (re.search(r'\b(?:pid|process)\s+(?:id\s+)?#?(\d+)\b', text) or
+                     re.search(r'\b(?:kill|terminate|pkill)\s+(?:-9\s+)?(\d+)\b', text))
+            if match:
+                args = ['pid', match.group(1)]
+            else:
+                name = self._process_name(original)
+                if name is None:
+                    match = re.search(r'\b(?:kill|killall|pkill|terminate|quit|end|stop)\s+(?:-9\s+)?'
+                                      r'(?:(?:the|all|every|stuck|hung|frozen|hanging|old)\s+)*([\w.-]+)',
+                                      original, re.IGNORECASE)
+                    if match and match.group(1).lower() not in _NOT_PROCESS_NAMES:
+                        name = match.group(1)
+                if name is None:
+                    return None
+                args = ['name', name]
+        if re.search(r'\b(?:force(?:fully|d)?|hard|sigkill)\b|(?:^|\s)-9\b', text):
+            args.append('signal=KILL')
+        return args
+    
+    def _render_log(self, args: List[str], platform_key: str) -> str:
+        """Render a LOG as the platform's equivalent tail/head/grep command."""
+        if len(args) < 2:
+            return ""
+        path = self._normalize_path(self._resolve_path(args[0]))
+        mode = args[1]
+        options = dict(arg.split('=', 1) for arg in args[2:] if '=' in arg)
+        count = options.get('count', '' if mode == 'search' else '10')
+        if 'pattern' not in options and mode != 'search':
+            return self.templates[f'log_{mode}'][platform_key].format(path=path, count=count, filter='')
+        
+        pattern = options.get('pattern', '').replace('"', '\\"')
+        is_regex = options.get('regex') == '1'
+        ignore_case = options.get('ignore_case') == '1'
+        if platform_key == 'windows':
+            flags = ('' if is_regex else '-SimpleMatch ') + ('' if ignore_case else '-CaseSensitive ')
+            limits = {'tail': f' | Select-Object -Last {count}', 'head': f' | Select-Object -First {count}'}
+            grep = f' | Select-String {flags}-Pattern "{pattern}"'
+        else:
+            flags = ('E' if is_regex else 'F') + ('i' if ignore_case else '')
+            limits = {'tail': f' | tail -n {count}', 'head': f' -m {count}'}
+            grep = f' | grep --line-buffered -{flags} "{pattern}"'
+        if mode == 'follow':
+            return self.templates['log_follow'][platform_key].format(path=path, count=count, filter=grep)
+        limit = limits['tail' if mode == 'tail' else 'head'] if count else ''
+        return self.templates['log_search'][platform_key].format(
+            path=path, pattern=pattern, options=flags, limit=limit)
+    
+    def _log_path(self, text: str) -> Optional[str]:
+        """The file a LOG request reads: a log by its name if there is one, else any file path."""
+        tokens = [token.strip('"\'').rstrip('.,;:!?') for token in text.split()]
+        tokens = [token for token in tokens if token and not token.startswith('-')]
+        for token in tokens:
+            if _LOG_FILE.search(token):
+                return token
+        for token in tokens:
+            if '/' in token or re.search(r'[a-zA-Z_]\.[a-zA-Z0-9]{1,5}$', token):
+                return token
+        return None
+    
+    def _extract_log_args(self, text: str, original: str) -> Optional[List[str]]:
+        """
+        Extract the file, mode and line filters of a LOG request.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the file and search text
+            
+        Returns:
+            The file, the mode ('tail', 'head', 'search' or 'follow'), then
+            ``key=value`` options; None without a file
+        """
+        options = []
+        match = (re.search(r'\b(?:containing|contains?|mentioning|matching|with the (?:text|word|string))'
+                           r'\s+(?:"([^"]+)"|\'([^\']+)\'|(\S+))', original, re.IGNORECASE) or
+                 re.search(r'\b(?:search|grep|watch|monitor|follow|tail)\s+\S+\s+for\s+(?:"([^"]+)"|\'([^\']+)\'|(\S+))',
+                           original, re.IGNORECASE))
+        if match:
+            group = next(index for index in range(1, 4) if match.group(index))
+            options.append(f"pattern={match.group(group)}")
+            # Only the search text is removed: "search app.log for x" names the file too
+            start, end = match.span(group)
+            original = original[:start] + ' ' + original[end:]
+            text = text[:start] + ' ' + text[end:]
+            if re.search(r'\b(?:ignor(?:e|ing) case|case[- ]insensitive(?:ly)?)\b', text):
+                options.append('ignore_case=1')
+            if re.search(r'\b(?:regex|regular expression)\b', text):
+                options.append('regex=1')
+        else:
+            match = _LOG_LEVEL.search(_FILE_NAME_TOKEN.sub(' ', text))
+            if match:
+                options += [f'pattern={LOG_LEVEL_PATTERNS[match.group(1)]}', 'ignore_case=1']
+        
+        path = self._log_path(original)
+        if path is None:
+            return None
+        
+        match = (re.search(r'\b(?:last|first|top|bottom|latest|tail|head)\s+(?:-n\s*)?(\d+)\b'
+                           r'(?!\s*(?:minute|hour|day|week|month|year)s?\b)', text) or
+                 re.search(r'\b(\d+)\s+(?:lines|entries|errors|warnings|exceptions)\b', text))
+        if match:
+            options.append(f'count={match.group(1)}')
+        options += [p for p in self._extract_find_args(text, original)[1:] if p.startswith(('max_age=', 'min_age='))]
+        
+        if re.search(r'\b(?:follow(?:ing)?|watch|live|stream)\b|\btail\s+-f\b', text):
+            mode = 'follow'
+        elif re.search(r'\b(?:first|head|top|beginning)\b', text):
+            mode = 'head'
+        elif re.search(r'\b(?:last|tail|bottom|latest|recent|end)\b'
+                       r'(?!\s+(?:\d+\s*)?(?:minute|hour|day|week|month|year)s?\b)', text):
+            mode = 'tail'
+        else:
+            mode = 'search' if any(o.startswith(('pattern=', 'max_age=', 'min_age=')) for o in options) else 'tail'
+        return [path, mode] + options
+    
+    def _render_sync(self, args: List[str], platform_key: str) -> str:
+        """Render a SYNC as the platform's equivalent rsync/robocopy command."""
+        if len(args) < 2:
+            return ""
+        src = self._normalize_path(self._resolve_path(args[0]))
+        dest = self._normalize_path(self._resolve_path(args[1]))
+        template = 'sync_delete' if 'delete=1' in args[2:] else 'sync'
+        name = re.split(r'[/\\]', src.rstrip('/\\'))[-1] or src
+        return self.templates[template][platform_key].format(src=src, dest=dest, name=name)
+    
+    def _extract_sync_args(self, original: str) -> Optional[List[str]]:
+        """
+        Extract the source, destination and options from a SYNC request.
+        
+        Args:
+            original: The input with its original case, for the paths
+            
+        Returns:
+            The source and destination, then ``delete=1`` if deletions
+            should be propagated; None without a destination
+        """
+        remainder = _SYNC_DELETE.sub('', original)
+        match = (re.search(r'\bkeep\s+(\S+)\s+in\s+sync\s+with\s+(?:the\s+)?(\S+)', remainder, re.IGNORECASE) or
+                 re.search(r'(\S+)\s+(?:to|into|onto|with)\s+(?:the\s+)?(\S+)(?:\s+(?:folder|directory))?\s*$',
+                           remainder, re.IGNORECASE))
+        if not match:
+            return None
+        args = [match.group(1).strip('"\''), match.group(2).strip('"\'')]
+        if remainder != original:
+            args.append('delete=1')
+        return args
+    
+    def _extract_archive_args(self, text: str, original: str) -> Optional[List[str]]:
+        """
+        Extract the source, archive name and options from an ARCHIVE request.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the file names
+            
+        Returns:
+            The source, the archive to create, then ``key=value`` options
+            (``level``); None if there is nothing to archive
+        """
+        dest = None
+        match = re.search(r'\b(?:into|to|as|named|called)\s+(?:an?\s+|the\s+)?(?:archive\s+|file\s+)?'
+                          r'["\']?([^\s"\']+)', original, re.IGNORECASE)
+        if match:
+            dest = match.group(1)
+            remainder = original[:match.start()]
+        else:
+            remainder = original
+        
+        src = None
+        match = re.search(r'\b(?:zip|compress|archive|tar|tarball|pack|bundle)(?:\s+up)?\s+(?:of\s+)?'
+                          r'(?:(?:the|my|this|a)\s+)?(?:(?:folder|directory|file)\s+)?["\']?([^\s"\']+)',
+                          remainder, re.IGNORECASE)
+        if match and match.group(1).lower() not in ('it', 'everything', 'all', 'files', 'here', 'up'):
+            src = match.group(1)
+        if src is None:
+            src = self._extract_find_args(text, original)[0]
+        if src == dest:
+            return None
+        
+        if dest is not None and archive_format(dest) is not None:
+            fmt = archive_format(dest)
+        elif re.search(r'\bzip\b', text):
+            fmt = 'zip'
+        elif re.search(r'\bxz\b|\blzma\b', text):
+            fmt = 'tar.xz'
+        elif re.search(r'\bbz(?:ip)?2?\b', text):
+            fmt = 'tar.bz2'
+        else:
+            fmt = 'tar.gz'
+        if dest is None:
+            name = os.path.basename(src.rstrip('/\\')) or 'archive'
+            dest = ('archive' if name in ('.', '..', '~') else name) + ARCHIVE_SUFFIXES[fmt]
+        elif archive_format(dest) is None:
+            dest += ARCHIVE_SUFFIXES[fmt]
+        
+        args = [src, dest]
+        if re.search(r'\b(?:fast(?:est)?|quick(?:ly)?)\b', text):
+            args.append('level=1')
+        elif re.search(r'\b(?:best|max(?:imum)?|smallest)\b', text):
+            args.append('level=9')
+        return args
+    
+    def _extract_unpack_args(self, text: str, original: str) -> Optional[List[str]]:
+        """
+        Extract the archive and destination from an EXTRACT request.
+        
+        Returns:
+            [archive, destination directory], or None without an archive
+        """
+        match = next((m for m in re.finditer(r'["\']?([^\s"\']+)', original)
+                      if archive_format(m.group(1)) is not None), None)
+        if match is None:
+            match = re.search(r'\b(?:extract|unzip|untar|unpack|decompress|uncompress)\s+'
+                              r'(?:(?:the|my|this)\s+)?(?:(?:archive|file)\s+)?["\']?([^\s"\']+)',
+                              original, re.IGNORECASE)
+        if match is None or match.group(1).lower() in ('to', 'into', 'in', 'it', 'here'):
+            return None
+        
+        dest = '.'
+        found = re.search(r'\b(?:to|into|in)\s+(?:the\s+)?["\']?([^\s"\']+)', original[match.end():],
+                          re.IGNORECASE)
+        if found and found.group(1).lower() not in ('here', 'folder', 'directory'):
+            dest = found.group(1)
+        return [match.group(1), dest]
+    
+    def _extract_content_search_args(self, text: str, original: str) -> List[str]:
+        """
+        Extract the search root, text and file predicates from a content search.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the search text
+            
+        Returns:
+            List[str]: The search root, the search text, then ``key=value``
+            predicates; empty if no search text was found
+        """
+        match = re.search(
+            r'\b(?:containing|contains?|that mentions?|mentioning|with the (?:text|word|string)|with text)'
+            r'\s+(?:the\s+(?:text|word|string)\s+)?(?:"([^"]+)"|\'([^\']+)\'|(\S+))',
+            original, re.IGNORECASE)
+        if not match:
+            return []
+        pattern = next(group for group in match.groups() if group)
+        
+        remainder = (original[:match.start()] + ' ' + original[match.end():]).strip()
+        find_args = self._extract_find_args(remainder.lower(), remainder)
+        predicates = [p for p in find_args[1:] if not p.startswith('type=')]
+        if re.search(r'\b(?:ignor(?:e|ing) case|case[- ]insensitive(?:ly)?)\b', text):
+            predicates.append('ignore_case=1')
+        if re.search(r'\b(?:regex|regular expression)\b', text):
+            predicates.append('regex=1')
+        return [find_args[0], pattern] + predicates
+    
+    def _extract_disk_usage_args(self, text: str, original: str) -> List[str]:
+        """Extract the root, entry count and entry kind from a disk usage request."""
+        root = self._extract_find_args(text, original)[0]
+        args = [root]
+        match = re.search(r'\btop\s+(\d+)\b', text) or re.search(r'\b(\d+)\s+(?:biggest|largest)\b', text)
+        if match:
+            args.append(f'top={match.group(1)}')
+        if re.search(r'\b(?:folders?|director(?:y|ies))\b', text):
+            args.append('type=d')
+        elif re.search(r'\bfiles\b', text):
+            args.append('type=f')
+        return args
+    
+    def _extract_dedupe_args(self, text: str, original: str) -> List[str]:
+        """Extract the root and file predicates from a duplicate file request."""
+        find_args = self._extract_find_args(text, original)
+        return [find_args[0]] + [p for p in find_args[1:] if not p.startswith('type=')]
+    
+    def _extract_find_args(self, text: str, original: str) -> List[str]:
+        """
+        Extract the search root and predicates from a FIND request.
+        
+        Args:
+            text: Lower-cased natural language input
+            original: The input with its original case, for the root and name patterns
+            
+        Returns:
+            List[str]: The search root followed by ``key=value`` predicates
+        """
+        root = '.'
+        predicates = []
+        
+        match = re.search(r'\b(?:in|under|inside|within|from)\s+(?!the\b|a\b)([^\s]+)', original,
+                          re.IGNORECASE)
+        if match and not re.match(r'\d', match.group(1)):
+            root = match.group(1).strip('"\'')
+        else:
+            match = re.search(r'(?:^|\s)((?:~|/|\.{1,2}/)[^\s*?]*)', original)
+            if match:
+                root = match.group(1)
+        
+        match = re.search(r'\b(?:named|called|matching)\s+["\']?([^\s"\']+)', original, re.IGNORECASE)
+        if match:
+            predicates.append(f'name={match.group(1)}')
+        else:
+            match = (re.search(r'(?:^|\s)\*?\.([a-z0-9]{1,10})\b', text) or
+                     re.search(r'\bextension\s+\.?([a-z0-9]{1,10})\b', text))
+            if not match:
+                match = re.search(r'\b([a-z0-9]{1,5})\s+files\b', text)
+                if match and match.group(1) not in COMMON_EXTENSIONS:
+                    match = None
+            if match:
+                predicates.append(f'ext={match.group(1)}')
+            else:
+                match = re.search(r'(?:^|\s)([^\s]*[*?][^\s]*)', original)
+                if match:
+                    predicates.append(f'name={match.group(1)}')
+        
+        if re.search(r'\b(?:director(?:y|ies)|folders?)\b', text) and 'files' not in text:
+            predicates.append('type=d')
+        
+        size_re = (r'\b(bigger|larger|greater|more|over|above|at least|smaller|less|under|below|at most)'
+                   r'\s+(?:than\s+)?(\d+(?:\.\d+)?)\s*([kmgt]i?b?|bytes?|b)\b')
+        for word, amount, unit in re.findall(size_re, text):
+            key = 'max_size' if word in ('smaller', 'less', 'under', 'below', 'at most') else 'min_size'
+            predicates.append(f'{key}={parse_size(amount, unit)}')
+        
+        units = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000, 'year': 31536000}
+        match = re.search(r'\b(?:last|past)\s+(\d+)?\s*(minute|hour|day|week|month|year)s?\b', text)
+        if match:
+            predicates.append(f'max_age={int(match.group(1) or 1) * units[match.group(2)]}')
+        elif re.search(r'\btoday\b', text):
+            now = datetime.now()
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            predicates.append(f'max_age={int((now - midnight).total_seconds())}')
+        elif re.search(r'\b(?:this|a)\s+(week|month|year)\b', text):
+            period = re.search(r'\b(?:this|a)\s+(week|month|year)\b', text).group(1)
+            predicates.append(f'max_age={units[period]}')
+        match = re.search(r'\bolder\s+than\s+(\d+)\s*(minute|hour|day|week|month|year)s?\b', text)
+        if match:
+            predicates.append(f'min_age={int(match.group(1)) * units[match.group(2)]}')
+        
+        return [root] + predicates
+    
+    def _select_template(self, command_type: CommandType,
+                         args: List[str]) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Choose the template and its fields for a template-rendered command.
+        
+        Args:
+            command_type: One of TEMPLATE_COMMAND_TYPES
+            args: Command arguments
+            
+        Returns:
+            (template key, format fields), or None if the arguments are insufficient
+        """
+        if command_type == CommandType.NAVIGATION:
+            if not args:
+                return None
+            return 'navigation', {'path': self._normalize_path(self._resolve_path(args[0], fuzzy=True))}
+            
+        if command_type == CommandType.LIST_FILES:
+            path = self._normalize_path(self._resolve_path(args[0], fuzzy=True)) if args else "."
+            return 'list_files', {'path': path or "."}
+            
+        if command_type == CommandType.CREATE:
+            if not args:
+                return None
+            path = self._normalize_path(self._resolve_path(args[0]))
+            if not path:
+                return None
+            
+            # Check if it's a directory (ends with path separator or has an extension)
+            is_dir = path.endswith(os.sep) or not os.path.splitext(path)[1]
+            return ('create_dir' if is_dir else 'create_file'), {'path': path}
+            
+        if command_type == CommandType.OPEN:
+            if not args:
+                return None
+            return 'open', {'path': self._normalize_path(self._resolve_path(args[0]))}
+            
+        if command_type == CommandType.DOCKER:
+            if not args:
+                return None
+            subcommand = args[0]
+            if subcommand == 'list_containers':
+                return 'docker_list_containers', {}
+            if subcommand == 'list_images':
+                return 'docker_list_images', {}
+            if subcommand in ('run', 'rmi') and len(args) >= 2:
+                return f'docker_{subcommand}', {'image': args[1]}
+            if subcommand in ('stop', 'rm', 'logs') and len(args) >= 2:
+                return f'docker_{subcommand}', {'container': args[1]}
+            return None
+        
+        return None
+    
+    def _template_tokens(self, template_key: str, platform_key: str) -> Tuple[str, ...]:
+        """Split a POSIX template into argv tokens once, before any substitution."""
+        key = (template_key, platform_key)
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            with self._cache_lock:
+                tokens = self._token_cache.get(key)
+                if tokens is None:
+                    tokens = tuple(shlex.split(self.templates[template_key][platform_key]))
+                    self._token_cache[key] = tokens
+        return tokens
+    
+    def _phrase_pattern(self, intent: str) -> Pattern:
+        """An intent's phrases as one whole-word regex, compiled on first use."""
+        pattern = self._phrase_patterns.get(intent)
+        if pattern is None:
+            with self._cache_lock:
+                pattern = self._phrase_patterns.get(intent)
+                if pattern is None:
+                    phrase_list = self.phrases.get(intent)
+                    pattern = re.compile(rf"\b(?:{'|'.join(phrase_list)})\b" if phrase_list else r'(?!)')
+                    self._phrase_patterns[intent] = pattern
+        return pattern
+    
+    def build_command(self, command_type: CommandType, args: List[str] = None) -> Optional[Command]:
+        """
+        Build the typed representation of a command.
+        
+        Template commands on POSIX platforms get an argv vector built by
+        substituting the arguments into the pre-split template, so paths are
+        passed through verbatim and never re-parsed by a shell. Commands run
+        by native engines carry their resolved arguments instead.
+        
+        Args:
+            command_type: Type of command to build
+            args: List of arguments for the command
+            
+        Returns:
+            Optional[Command]: The command, or None if it cannot be generated
+        """
+        if args is None:
+            args = []
+        
+        display = self.generate_command(command_type, args)
+        if not display:
+            return None
+        platform_key = self._get_platform_key()
+        
+        if command_type in NATIVE_COMMAND_TYPES:
+            return Command(command_type, MODE_NATIVE, display, platform_key,
+                           args=self.resolve_args(command_type, args))
+        
+        if command_type == CommandType.NAVIGATION:
+            return Command(command_type, MODE_EVAL, display, platform_key)
+        
+        selected = self._select_template(command_type, args)
+        if selected is None:
+            return Command(command_type, MODE_SHELL, display, platform_key)
+        
+        template_key, fields = selected
+        expanded = {name: os.path.expandvars(os.path.expanduser(value))
+                    for name, value in fields.items()}
+        cache_policy = IDEMPOTENT_TEMPLATES.get(template_key)
+        watch_paths = (expanded.get('path', '.'),) if cache_policy == CACHE_WATCH else ()
+        if platform_key == 'windows':
+            return Command(command_type, MODE_SHELL, display, platform_key,
+                           cache_policy=cache_policy, watch_paths=watch_paths)
+        
+        argv = [token.format(**expanded) for token in self._template_tokens(template_key, platform_key)]
+        return Command(command_type, MODE_ARGV, display, platform_key, argv=argv,
+                       cache_policy=cache_policy, watch_paths=watch_paths)
+    
     def generate_command(self, command_type: CommandType, args: List[str] = None) -> str:
         """
         Generate a command based on the command type and arguments.
@@ -189,36 +915,22 @@ class CommandGenerator:
         Returns:
             str: Generated command string
         """
+        with STAGE_SECONDS.time('generate'):
+            return self._generate_command(command_type, args)
+    
+    def _generate_command(self, command_type: CommandType, args: Optional[List[str]]) -> str:
         if args is None:
             args = []
             
         platform_key = self._get_platform_key()
         
         try:
-            if command_type == CommandType.NAVIGATION:
-                if not args:
-                    return ""
-                path = self._normalize_path(self._resolve_path(args[0]))
-                return f"cd {path}"
-                
-            elif command_type == CommandType.LIST_FILES:
-                path = self._normalize_path(self._resolve_path(args[0])) if args else "."
-                return f"ls -la {path}" if path else "ls -la"
-                
-            elif command_type == CommandType.CREATE:
-                if not args:
-                    return ""
-                path = self._normalize_path(self._resolve_path(args[0]))
-                if not path:
+            if command_type in TEMPLATE_COMMAND_TYPES:
+                selected = self._select_template(command_type, args)
+                if selected is None:
                     return ""
-                    
-                # Check if it's a directory (ends with path separator or has an extension)
-                is_dir = path.endswith(os.sep) or not os.path.splitext(path)[1]
-                
-                if is_dir:
-                    return self.templates['create_dir'][platform_key].format(path=path)
-                else:
-                    return self.templates['create_file'][platform_key].format(path=path)
+                template_key, fields = selected
+                return self.templates[template_key][platform_key].format(**fields)
                     
             elif command_type in (CommandType.MOVE, CommandType.COPY):
                 if len(args) < 2:
@@ -248,39 +960,33 @@ class CommandGenerator:
                 else:
                     return self.templates['delete_file'][platform_key].format(path=path)
                     
-            elif command_type == CommandType.OPEN:
-                if not args:
-                    return ""
-                path = self._normalize_path(self._resolve_path(args[0]))
-                return self.templates['open'][platform_key].format(path=path)
-                
-            elif command_type == CommandType.DOCKER:
-                if not args:
-                    return ""
-                
-                subcommand = args[0]
-                
-                if subcommand == 'list_containers':
-                    return self.templates['docker_list_containers'][platform_key]
-                elif subcommand == 'list_images':
-                    return self.templates['docker_list_images'][platform_key]
-                elif subcommand == 'run':
-                    if len(args) < 2: return ""
-                    return self.templates['docker_run'][platform_key].format(image=args[1])
-                elif subcommand == 'stop':
-                    if len(args) < 2: return ""
-                    return self.templates['docker_stop'][platform_key].format(container=args[1])
-                elif subcommand == 'rm':
-                    if len(args) < 2: return ""
-                    return self.templates['docker_rm'][platform_key].format(container=args[1])
-                elif subcommand == 'rmi':
-                    if len(args) < 2: return ""
-                    return self.templates['docker_rmi'][platform_key].format(image=args[1])
-                elif subcommand == 'logs':
-                    if len(args) < 2: return ""
-                    return self.templates['docker_logs'][platform_key].format(container=args[1])
-                else:
-                    return ""
+            elif command_type == CommandType.FIND:
+                return self._render_find(args, platform_key)
+            
+            elif command_type == CommandType.CONTENT_SEARCH:
+                return self._render_content_search(args, platform_key)
+            
+            elif command_type == CommandType.DISK_USAGE:
+                path = self._normalize_path(self._resolve_path(args[0])) if args else "."
+                options = dict(arg.split('=', 1) for arg in args[1:] if '=' in arg)
+                template = 'disk_usage_files' if options.get('type') == 'f' else 'disk_usage'
+                return self.templates[template][platform_key].format(path=path, top=options.get('top', 10))
+            
+            elif command_type in (CommandType.ARCHIVE, CommandType.EXTRACT):
+                return self._render_archive(command_type, args, platform_key)
+            
+            elif command_type == CommandType.SYNC:
+                return self._render_sync(args, platform_key)
+            
+            elif command_type in (CommandType.PROCESS, CommandType.KILL):
+                return self._render_process(command_type, args, platform_key)
+            
+            elif command_type == CommandType.DEDUPE:
+                path = self._normalize_path(self._resolve_path(args[0])) if args else "."
+                return self.templates['dedupe'][platform_key].format(path=path)
+            
+            elif command_type == CommandType.LOG:
+                return self._render_log(args, platform_key)
 
             else:
                 return ""
@@ -299,113 +1005,422 @@ class CommandGenerator:
         Returns:
             Tuple[CommandType, List[str]]: Command type and list of arguments
         """
-        if not text:
-            return CommandType.UNKNOWN, []
-            
-        text = text.lower().strip()
+        with STAGE_SECONDS.time('interpret'):
+            command_type, args = self._interpret(to_english(text), correct_typos=True)
+        INTENTS.inc(command_type.name)
+        return command_type, args
+    
+    def candidates(self, text: str, k: int = DEFAULT_CANDIDATES) -> List[Candidate]:
+        """
+        Score every intent in one pass and return the best interpretations.
         
-        # Check for navigation commands
-        nav_phrases = [
-            'go to', 'navigate to', 'change to', 'cd to', 'open directory',
-            'show me', 'take me to', 'browse to'
-        ]
+        Every rule whose phrases occur is scored, not just the first, and
+        blended with the classifier's probability for its intent; the
+        classifier alone scores intents no rule matched. Scoring needs no
+        arguments, so they are only extracted, and commands only built, for
+        the best intents as they come off the heap. Input in another language
+        is first rewritten with that language's phrase pack.
         
-        list_phrases = [
-            'list files', 'show files', 'list directory', 'ls', 'dir',
-            'what\'s in', 'what is in', 'show contents of'
-        ]
+        Args:
+            text: Natural language input
+            k: Maximum number of candidates
+            
+        Returns:
+            List[Candidate]: Best first; empty if nothing could be built
+        """
+        with STAGE_SECONDS.time('interpret'):
+            scored, text, original, paths, rule_types = self._score_intents(to_english(text))
+            chosen = []
+            for negated, _, command_type in _best_first(scored, k):
+                if len(chosen) == k or -negated < CANDIDATE_FLOOR:
+                    break
+                if command_type in rule_types:
+                    args = self._rule_args(command_type, text, original, paths)
+                elif command_type == CommandType.NAVIGATION and paths and not rule_types:
+                    args = paths[:1]
+                else:
+                    args = self._classified_args(command_type, text, original, paths)
+                if args is not None:
+                    chosen.append((command_type, args, -negated))
+        result = []
+        for command_type, args, score in chosen:
+            command = self.build_command(command_type, args)
+            if command is not None:
+                result.append(Candidate(command_type, args, validate_command(command), round(score, 4)))
+        INTENTS.inc(result[0].command_type.name if result else CommandType.UNKNOWN.name)
+        return result
+    
+    def _score_intents(self, text: str) -> Tuple[List[Tuple[float, int, CommandType]], str, str,
+                                                List[str], Tuple[CommandType, ...]]:
+        """
+        Score every plausible intent without extracting any arguments.
         
-        create_phrases = [
-            'create file', 'make file', 'new file', 'touch',
-            'create directory', 'make directory', 'new directory', 'mkdir'
-        ]
+        Returns:
+            (heap entries of (-score, priority, type), the lower-cased text
+            and the text with its case that arguments should come from, the
+            paths, and the intents matched by rules)
+        """
+        original = text.strip()
+        text = original.lower()
+        if not text:
+            return [], text, original, [], ()
+        # Paths keep the case they were typed in
+        paths = extract_paths(original)
         
-        delete_phrases = [
-            'delete', 'remove', 'rm', 'del', 'erase', 'trash'
-        ]
+        penalty = 1.0
+        rule_types = tuple(self._rule_intents(text))
+        if not rule_types:
+            corrected = self.correct_typos(text)
+            if corrected != text:
+                corrected_types = tuple(self._rule_intents(corrected))
+                if corrected_types:
+                    rule_types, penalty = corrected_types, TYPO_PENALTY
+                    text, original = corrected, self._keep_case(original, corrected)
+                    paths = extract_paths(original)
         
-        move_phrases = [
-            'move', 'mv', 'relocate', 'transfer'
-        ]
+        # "run the tests": a generic verb alone does not make an OPEN, and
+        # what follows it is not a place to go
+        verb_only = (bool(rule_types) and rule_types[-1] == CommandType.OPEN and
+                     all(phrase in AMBIGUOUS_OPEN_VERBS for phrase in self.phrases['open'] if phrase in text))
+        if verb_only:
+            rule_types = rule_types[:-1]
         
-        copy_phrases = [
-            'copy', 'cp', 'duplicate', 'clone'
-        ]
+        ranked = classify(original)
+        scores: Dict[CommandType, float] = {}
+        if rule_types:
+            probabilities = dict(ranked)
+            for i, command_type in enumerate(rule_types):
+                rule = 1.0 if i == 0 else AMBIGUOUS_RULE
+                scores[command_type] = (RULE_WEIGHT * rule + (1 - RULE_WEIGHT) *
+                                        probabilities.get(command_type, 0.0)) * penalty
         
-        open_phrases = [
-            'open', 'launch', 'start', 'run', 'execute'
-        ]
+        # Intents only the classifier suggests; ranked is sorted, so stop at the floor
+        weight = 1 - RULE_WEIGHT if rule_types else 1.0
+        for command_type, probability in ranked:
+            if probability * weight < CANDIDATE_FLOOR:
+                break
+            if command_type not in scores and command_type != CommandType.UNKNOWN:
+                scores[command_type] = probability * weight
         
-        # Extract potential paths from the text
-        paths = extract_paths(text)
+        # As in the single-answer path, a bare path means "go there"
+        if paths and not rule_types and not verb_only:
+            bare = re.sub(r'^cd\s+', '', original, flags=re.IGNORECASE).strip('"\'')
+            path_score = PATH_ONLY_SCORE if bare == paths[0] else PATH_DEFAULT_SCORE
+            scores[CommandType.NAVIGATION] = max(scores.get(CommandType.NAVIGATION, 0.0), path_score)
+        # Ties go to the earlier rule, then to the order the classifier ranked
+        return ([(-score, i, command_type) for i, (command_type, score) in enumerate(scores.items())],
+                text, original, paths, rule_types)
+    
+    def _keyword_vocabulary(self) -> Tuple[str, ...]:
+        """Words of the intent phrases, the dictionary for typo correction."""
+        if self._vocabulary is not None:
+            return self._vocabulary
+        words = [word for phrase_list in self.phrases.values()
+                 for phrase in phrase_list for word in phrase.split()]
+        words += ['docker', 'container', 'containers', 'image', 'images', 'logs',
+                  'files', 'file', 'folder', 'folders', 'directory', 'directories']
+        self._vocabulary = tuple(dict.fromkeys(word for word in words if len(word) >= 3 and word.isalpha()))
+        return self._vocabulary
+    
+    def correct_typos(self, text: str) -> str:
+        """
+        Replace misspelt intent keywords, e.g. "delte" -> "delete".
         
-        # Check for Docker (High priority)
-        if 'docker' in text or 'container' in text or ('image' in text and not any(p in text for p in ['jpg', 'png', 'gif'])):
-            words = text.split()
-            
-            if 'list' in text or 'show' in text:
-                if 'image' in text:
-                    return CommandType.DOCKER, ['list_images']
-                return CommandType.DOCKER, ['list_containers']
-                
-            if 'run' in text or 'start' in text:
-                # heuristic: use word after 'run' or 'start' or last word
-                target = words[-1]
-                keyword = 'run' if 'run' in words else 'start'
-                
-                if keyword in words:
-                    idx = words.index(keyword)
-                    if idx + 1 < len(words):
-                        target = words[idx+1]
-                        # Skip keywords like 'docker' or 'container'
-                        if target in ['docker', 'container'] and idx + 2 < len(words):
-                            target = words[idx+2]
-                            
-                return CommandType.DOCKER, ['run', target]
-                
-            if 'stop' in text:
-                return CommandType.DOCKER, ['stop', words[-1]]
-                
-            if 'delete' in text or 'remove' in text or 'rm' in text:
-                if 'image' in text:
-                    return CommandType.DOCKER, ['rmi', words[-1]]
-                return CommandType.DOCKER, ['rm', words[-1]]
-
-            if 'log' in text:
-                return CommandType.DOCKER, ['logs', words[-1]]
+        Only purely alphabetic words that are not the command's path
+        arguments are considered, within an edit distance that grows with
+        the word length.
         
-        # Check for navigation
-        if any(phrase in text for phrase in nav_phrases):
-            return CommandType.NAVIGATION, paths[:1] if paths else [text.split()[-1]]
+        Args:
+            text: Lower-cased natural language input
             
-        # Check for list files
-        if any(phrase in text for phrase in list_phrases):
-            return CommandType.LIST_FILES, paths[:1] if paths else []
+        Returns:
+            str: The corrected text (unchanged if nothing was corrected)
+        """
+        index = get_index(self._keyword_vocabulary())
+        protected = set(extract_paths(text))
+        words = text.split()
+        changed = False
+        for i, word in enumerate(words):
+            if word in protected:
+                continue
+            corrected = self._correct_word(index, word)
+            if corrected is not None:
+                words[i] = corrected
+                changed = True
+        return ' '.join(words) if changed else text
+    
+    @staticmethod
+    def _keep_case(original: str, corrected: str) -> str:
+        """The input as typed with the corrected keywords of ``corrected`` put in."""
+        words = original.split()
+        fixed = corrected.split()
+        if len(words) != len(fixed):
+            return corrected
+        return ' '.join(word if word.lower() == new else new for word, new in zip(words, fixed))
+    
+    @staticmethod
+    def _correct_word(index, word: str) -> Optional[str]:
+        """The keyword a misspelt word stands for, or None to keep the word."""
+        if not word.isalpha():
+            return None
+        limit = allowed_distance(word)
+        if not limit:
+            return None
+        match = index.lookup(word, limit)
+        if match and match[1] > 0:
+            return match[0]
+        return None
+    
+    def _interpret(self, text: str, correct_typos: bool) -> Tuple[CommandType, List[str]]:
+        """Rule-based interpretation, with typo correction and the classifier as fallbacks."""
+        if not text:
+            return CommandType.UNKNOWN, []
             
-        # Check for create
-        if any(phrase in text for phrase in create_phrases):
-            return CommandType.CREATE, paths[:1] if paths else [text.split()[-1]]
+        original = text.strip()
+        text = text.lower().strip()
+        
+        # Extract potential paths from the text, in the case they were typed in
+        paths = extract_paths(original)
+        
+        matched = self._match_rules(text, original, paths)
+        if matched is not None:
+            return matched
+        
+        # No phrase matched: retry once with misspelt keywords corrected
+        if correct_typos:
+            corrected = self.correct_typos(text)
+            if corrected != text:
+                command_type, args = self._interpret(self._keep_case(original, corrected),
+                                                     correct_typos=False)
+                if command_type != CommandType.UNKNOWN:
+                    return command_type, args
+        
+        # Still nothing: ask the statistical classifier
+        ranked = classify(original)
+        if ranked and ranked[0][1] >= CLASSIFIER_THRESHOLD:
+            best = ranked[0][0]
+            if best == CommandType.UNKNOWN:
+                return CommandType.UNKNOWN, []
+            fallback_args = self._classified_args(best, text, original, paths)
+            if fallback_args is not None:
+                return best, fallback_args
             
-        # Check for delete
-        if any(phrase in text for phrase in delete_phrases):
-            return CommandType.DELETE, paths[:1] if paths else []
+        # Default to navigation if a path is detected
+        if paths:
+            return CommandType.NAVIGATION, paths[:1]
+
+        return CommandType.UNKNOWN, []
+    
+    def _match_rules(self, text: str, original: str,
+                     paths: List[str]) -> Optional[Tuple[CommandType, List[str]]]:
+        """
+        Match the trigger phrases, in priority order.
+        
+        Args:
+            text: Lower-cased, stripped input
+            original: Stripped input with its original case
+            paths: Paths extracted from the input
             
-        # Check for move
-        if any(phrase in text for phrase in move_phrases):
-            return CommandType.MOVE, paths[:2] if len(paths) >= 2 else []
+        Returns:
+            (command type, arguments), or None if no phrase matched
+        """
+        for command_type in self._rule_intents(text):
+            args = self._rule_args(command_type, text, original, paths)
+            if args is not None:
+                return command_type, args
+        return None
+    
+    def _rule_intents(self, text: str) -> Iterator[CommandType]:
+        """
+        The intents whose trigger phrases occur in the text, in priority order.
+        
+        Checked lazily, so stopping at the first usable one costs no more
+        than a first-match search.
+        """
+        # Trigger phrases by intent
+        phrases = self.phrases
+        
+        # Check for Docker (High priority)
+        if 'docker' in text or 'container' in text or ('image' in text and not any(p in text for p in ['jpg', 'png', 'gif'])):
+            yield CommandType.DOCKER
+        
+        # Intent words are looked for in the text without file names ("copy backup.zip")
+        verbs = _FILE_NAME_TOKEN.sub(' ', text)
+        
+        # Check for log reading (before processes and content search: "errors in app.log")
+        log_path = self._log_path(text)
+        if log_path is not None and (self._phrase_pattern('log').search(text) or _LOG_LINES.search(text) or
+                                     (_LOG_FILE.search(log_path) and
+                                      (_LOG_LEVEL.search(verbs) or _LOG_VERBS.search(verbs)))):
+            yield CommandType.LOG
+        
+        # Check for processes (before OPEN: "what processes are running")
+        if not _FILE_NOUN.search(verbs):
+            if self._phrase_pattern('kill').search(verbs):
+                yield CommandType.KILL
+            if self._phrase_pattern('process').search(verbs) or _PROCESS_RUNNING.search(text):
+                yield CommandType.PROCESS
+        
+        # Check for duplicate files (before archives and FIND: "find duplicate zip files")
+        if ((self._phrase_pattern('dedupe').search(text) or _DUPLICATE_NOUN.search(text))
+                and not _DUPLICATE_TRANSFER.search(text)):
+            yield CommandType.DEDUPE
+        
+        # Check for sync (before DELETE: "sync docs to usb and delete removed files")
+        if self._phrase_pattern('sync').search(text):
+            yield CommandType.SYNC
+        
+        # Check for archives, on the text without file names ("copy backup.zip")
+        if self._phrase_pattern('extract').search(verbs):
+            yield CommandType.EXTRACT
+        match = self._phrase_pattern('archive').search(verbs)
+        if match and (_ARCHIVE_CONTENTS.match(verbs, match.end()) or
+                      not (_ARCHIVE_NOUN_BEFORE.search(verbs, 0, match.start()) or
+                           _ARCHIVE_NOUN_AFTER.match(verbs, match.end()))):
+            yield CommandType.ARCHIVE
+        
+        # Check for content search (before FIND: "find files containing TODO")
+        if self._phrase_pattern('content_search').search(text):
+            yield CommandType.CONTENT_SEARCH
+        
+        # Check for disk usage (before FIND: "find the biggest files")
+        if self._phrase_pattern('disk_usage').search(text):
+            yield CommandType.DISK_USAGE
+        
+        # Check for search
+        if self._phrase_pattern('find').search(text):
+            yield CommandType.FIND
+        
+        # Substring phrases, in priority order
+        for command_type, intent in RULE_PHRASE_INTENTS:
+            if any(phrase in text for phrase in phrases[intent]):
+                yield command_type
+    
+    def _rule_args(self, command_type: CommandType, text: str, original: str,
+                   paths: List[str]) -> Optional[List[str]]:
+        """
+        Arguments for an intent matched by its phrases.
+        
+        Returns:
+            The arguments, or None if the rule does not apply after all
+            (Docker text without a subcommand, a content search without
+            a pattern)
+        """
+        if command_type == CommandType.DOCKER:
+            return self._extract_docker_args(text)
+        if command_type == CommandType.CONTENT_SEARCH:
+            return self._extract_content_search_args(text, original) or None
+        if command_type == CommandType.DISK_USAGE:
+            return self._extract_disk_usage_args(text, original)
+        if command_type == CommandType.ARCHIVE:
+            return self._extract_archive_args(text, original)
+        if command_type == CommandType.EXTRACT:
+            return self._extract_unpack_args(text, original)
+        if command_type == CommandType.DEDUPE:
+            return self._extract_dedupe_args(text, original)
+        if command_type == CommandType.SYNC:
+            return self._extract_sync_args(original)
+        if command_type == CommandType.LOG:
+            return self._extract_log_args(text, original)
+        if command_type == CommandType.KILL:
+            return self._extract_kill_args(text, original)
+        if command_type == CommandType.PROCESS:
+            return self._extract_process_args(text, original)
+        if command_type == CommandType.FIND:
+            return self._extract_find_args(text, original)
+        if command_type in (CommandType.NAVIGATION, CommandType.CREATE):
+            return paths[:1] if paths else [text.split()[-1]]
+        if command_type in (CommandType.LIST_FILES, CommandType.DELETE, CommandType.OPEN):
+            return paths[:1] if paths else []
+        if command_type in (CommandType.MOVE, CommandType.COPY):
+            return self._extract_transfer_args(original) or (paths[:2] if len(paths) >= 2 else [])
+        return None
+    
+    def _extract_docker_args(self, text: str) -> Optional[List[str]]:
+        """Docker subcommand and target from text that mentions Docker, or None."""
+        words = text.split()
+        
+        if 'list' in text or 'show' in text:
+            if 'image' in text:
+                return ['list_images']
+            return ['list_containers']
             
-        # Check for copy
-        if any(phrase in text for phrase in copy_phrases):
-            return CommandType.COPY, paths[:2] if len(paths) >= 2 else []
+        if 'run' in text or 'start' in text:
+            # heuristic: use word after 'run' or 'start' or last word
+            target = words[-1]
+            keyword = 'run' if 'run' in words else 'start'
             
-        # Check for open
-        if any(phrase in text for phrase in open_phrases):
-            return CommandType.OPEN, paths[:1] if paths else []
+            if keyword in words:
+                idx = words.index(keyword)
+                if idx + 1 < len(words):
+                    target = words[idx+1]
+                    # Skip keywords like 'docker' or 'container'
+                    if target in ['docker', 'container'] and idx + 2 < len(words):
+                        target = words[idx+2]
+                        
+            return ['run', target]
             
-        # Default to navigation if a path is detected
-        if paths:
-            return CommandType.NAVIGATION, paths[:1]
+        if 'stop' in text:
+            return ['stop', words[-1]]
             
+        if 'delete' in text or 'remove' in text or 'rm' in text:
+            if 'image' in text:
+                return ['rmi', words[-1]]
+            return ['rm', words[-1]]
 
-
-        return CommandType.UNKNOWN, []
\ No newline at end of file
+        if 'log' in text:
+            return ['logs', words[-1]]
+        
+        return None
+    
+    def _extract_transfer_args(self, original: str) -> List[str]:
+        """
+        Extract (source, destination) from "<verb> <src> to <dest>" phrasing.
+        
+        The input is split on the keyword as typed, so both paths keep their
+        case and an absolute destination keeps its leading slash.
+        """
+        match = re.search(r'("[^"]+"|\'[^\']+\'|\S+)\s+(?:to|into|in|over to)\s+(?:the\s+)?'
+                          r'("[^"]+"|\'[^\']+\'|\S+)(?:\s+(?:folder|directory))?\s*$', original, re.IGNORECASE)
+        if not match:
+            return []
+        return [match.group(1).strip('"\''), match.group(2).strip('"\'')]
+    
+    def _classified_args(self, command_type: CommandType, text: str, original: str,
+                         paths: List[str]) -> Optional[List[str]]:
+        """
+        Build arguments for a command type chosen by the classifier.
+        
+        Returns:
+            The arguments, or None if the input does not carry enough
+            information for that command type
+        """
+        if command_type in (CommandType.NAVIGATION, CommandType.CREATE,
+                            CommandType.DELETE, CommandType.OPEN):
+            return paths[:1] if paths else None
+        if command_type == CommandType.LIST_FILES:
+            return []
+        if command_type in (CommandType.MOVE, CommandType.COPY):
+            transfer_args = self._extract_transfer_args(original) or (paths[:2] if len(paths) >= 2 else [])
+            return transfer_args or None
+        if command_type == CommandType.FIND:
+            return self._extract_find_args(text, original)
+        if command_type == CommandType.CONTENT_SEARCH:
+            return self._extract_content_search_args(text, original) or None
+        if command_type == CommandType.DISK_USAGE:
+            return self._extract_disk_usage_args(text, original)
+        if command_type == CommandType.ARCHIVE:
+            return self._extract_archive_args(text, original)
+        if command_type == CommandType.EXTRACT:
+            return self._extract_unpack_args(text, original)
+        if command_type == CommandType.DEDUPE:
+            return self._extract_dedupe_args(text, original)
+        if command_type == CommandType.SYNC:
+            return self._extract_sync_args(original)
+        if command_type == CommandType.LOG:
+            return self._extract_log_args(text, original)
+        if command_type == CommandType.KILL:
+            return self._extract_kill_args(text, original)
+        if command_type == CommandType.PROCESS:
+            return self._extract_process_args(text, original)
+        return None
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Incremental as-you-type translation for shell line-editor integration.
+
+An IncrementalTranslator is fed the whole input line after every edit and
+returns the current best command within a small time budget. Work is
+memoised between edits: finished translations by text (so backspacing is
+free), typo corrections and classifier contributions by word (so only the
+word being typed costs anything). The rule pass always runs; the typo and
+classifier fallbacks only run while budget remains, and a result cut short
+is marked partial and not memoised.
+
+``hcmd --preview-server`` serves translations over stdin/stdout for a
+shell coprocess, one request per line::
+
+    <seq> TAB <text>                 ->   <seq> TAB <status> TAB <command>
+
+where status is ``ok``, ``partial``, ``unsafe`` or ``none``. When several
+requests are pending only the newest is answered; older ones are stale.
+"""
+import os
+import select
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+from ..constants import CommandType
+from .classifier import get_model, words_of
+from .fuzzy import get_index
+from .generator import CLASSIFIER_THRESHOLD, CommandGenerator
+from .validator import extract_paths, validate_command
+
+# Per-keystroke time budget, in seconds
+DEFAULT_BUDGET = 0.001
+
+# Finished translations remembered by input text
+MEMO_SIZE = 512
+
+class Preview(NamedTuple):
+    """The best translation of an input line so far."""
+    seq: int
+    text: str
+    command_type: CommandType
+    args: List[str]
+    command: str
+    safe: bool
+    complete: bool  # False if the budget ran out before every fallback ran
+    elapsed: float
+
+class IncrementalTranslator:
+    """Translates a line as it is being typed, reusing work between edits."""
+
+    def __init__(self, generator: Optional[CommandGenerator] = None,
+                 budget: float = DEFAULT_BUDGET, memo_size: int = MEMO_SIZE):
+        """
+        Prepare the translator and warm every cache it relies on.
+
+        Args:
+            generator: Generator to translate with (a new one by default)
+            budget: Time budget per update, in seconds
+            memo_size: Number of finished translations to remember
+        """
+        self.generator = generator or CommandGenerator()
+        self.budget = budget
+        self.memo_size = memo_size
+        self._index = get_index(self.generator._keyword_vocabulary())
+        self._model = get_model()
+        self._memo: 'OrderedDict[str, Tuple[CommandType, List[str], str, bool]]' = OrderedDict()
+        self._word_fixes: Dict[str, Optional[str]] = {}
+        self._word_scores: Dict[str, Tuple[List[float], int]] = {}
+        self._latest = 0
+        self._lock = threading.Lock()
+        self.update('list files')  # Compiles the regexes on the rule path
+
+    def is_stale(self, seq: int) -> bool:
+        """True if a newer update than ``seq`` has been requested."""
+        return seq < self._latest
+
+    def update(self, text: str, seq: Optional[int] = None) -> Preview:
+        """
+        Translate the current line.
+
+        Args:
+            text: The whole input line
+            seq: Request number; defaults to one more than the last
+
+        Returns:
+            Preview: The best translation found within the budget
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if seq is None:
+                seq = self._latest + 1
+            self._latest = max(self._latest, seq)
+            key = ' '.join(text.split())
+            memo = self._memo.get(key)
+            if memo is not None:
+                self._memo.move_to_end(key)
+                command_type, args, command, safe = memo
+                return Preview(seq, text, command_type, args, command, safe, True,
+                               time.perf_counter() - started)
+
+            command_type, args, complete = self._translate(key, started + self.budget)
+            command, safe = self._render(command_type, args)
+            if complete:
+                self._memo[key] = (command_type, args, command, safe)
+                if len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+        return Preview(seq, text, command_type, args, command, safe, complete,
+                       time.perf_counter() - started)
+
+    def _translate(self, key: str, deadline: float) -> Tuple[CommandType, List[str], bool]:
+        """The generator's interpretation, split into budgeted stages."""
+        if not key:
+            return CommandType.UNKNOWN, [], True
+        generator = self.generator
+        text = key.lower()
+        paths = extract_paths(text)
+
+        matched = generator._match_rules(text, key, paths)
+        if matched is not None:
+            return matched[0], matched[1], True
+        if time.perf_counter() > deadline:
+            return self._default(paths) + (False,)
+
+        # Typo correction, one memoised lookup per word
+        protected = set(paths)
+        words = text.split()
+        corrected_words = []
+        for word in words:
+            fix = None
+            if word not in protected:
+                if word not in self._word_fixes:
+                    self._word_fixes[word] = generator._correct_word(self._index, word)
+                fix = self._word_fixes[word]
+            corrected_words.append(fix or word)
+        # Like the generator, try the corrected text before the original
+        attempts = [(text, key, paths)]
+        if corrected_words != words:
+            corrected = ' '.join(corrected_words)
+            corrected_paths = extract_paths(corrected)
+            matched = generator._match_rules(corrected, corrected, corrected_paths)
+            if matched is not None:
+                return matched[0], matched[1], True
+            attempts.insert(0, (corrected, corrected, corrected_paths))
+        if time.perf_counter() > deadline:
+            return self._default(paths) + (False,)
+
+        # Classifier, from memoised per-word score contributions
+        for i, (attempt_text, attempt_original, attempt_paths) in enumerate(attempts):
+            classified = self._classify(attempt_text, attempt_original, attempt_paths)
+            if classified is None:
+                continue
+            if classified[0] != CommandType.UNKNOWN or i == len(attempts) - 1:
+                return classified + (True,)
+
+        return self._default(paths) + (True,)
+
+    def _classify(self, text: str, original: str,
+                  paths: List[str]) -> Optional[Tuple[CommandType, List[str]]]:
+        if self._model is None:
+            return None
+        parts = []
+        for word in words_of(original):
+            part = self._word_scores.get(word)
+            if part is None:
+                part = self._word_scores[word] = self._model.word_scores(word)
+            parts.append(part)
+        ranked = self._model.rank(self._model.scores_from_words(parts))
+        if not ranked or ranked[0][1] < CLASSIFIER_THRESHOLD:
+            return None
+        best = ranked[0][0]
+        if best == CommandType.UNKNOWN:
+            return CommandType.UNKNOWN, []
+        fallback_args = self.generator._classified_args(best, text, original, paths)
+        return (best, fallback_args) if fallback_args is not None else None
+
+    @staticmethod
+    def _default(paths: List[str]) -> Tuple[CommandType, List[str]]:
+        if paths:
+            return CommandType.NAVIGATION, paths[:1]
+        return CommandType.UNKNOWN, []
+
+    def _render(self, command_type: CommandType, args: List[str]) -> Tuple[str, bool]:
+        if command_type == CommandType.UNKNOWN:
+            return '', False
+        command = self.generator.build_command(command_type, args)
+        if command is None:
+            return '', False
+        command = validate_command(command)
+        return command.display, command.is_safe
+
+def _format_reply(preview: Preview) -> bytes:
+    if not preview.command:
+        status = 'none'
+    elif not preview.safe:
+        status = 'unsafe'
+    else:
+        status = 'ok' if preview.complete else 'partial'
+    command = preview.command.replace('\t', ' ').replace('\n', ' ')
+    return f"{preview.seq}\t{status}\t{command}\n".encode('utf-8')
+
+def serve(infile: BinaryIO = None, outfile: BinaryIO = None,
+          translator: Optional[IncrementalTranslator] = None) -> int:
+    """
+    Answer translation requests until end of input.
+
+    Args:
+        infile: Request stream (stdin by default)
+        outfile: Reply stream (stdout by default)
+        translator: Translator to use (a new one by default)
+
+    Returns:
+        int: Exit status
+    """
+    in_fd = (infile or sys.stdin.buffer).fileno()
+    out = outfile or sys.stdout.buffer
+    translator = translator or IncrementalTranslator()
+    pending = b''
+    while True:
+        chunk = os.read(in_fd, 65536)
+        if not chunk:
+            return 0
+        pending += chunk
+        # Take everything already queued; only the newest line matters
+        while select.select([in_fd], [], [], 0)[0]:
+            chunk = os.read(in_fd, 65536)
+            if not chunk:
+                break
+            pending += chunk
+        if b'\n' not in pending:
+            continue
+        lines, _, pending = pending.rpartition(b'\n')
+        request = lines.rsplit(b'\n', 1)[-1].decode('utf-8', errors='replace')
+        seq_text, _, text = request.partition('\t')
+        try:
+            seq = int(seq_text)
+        except ValueError:
+            seq, text = translator._latest + 1, request
+        out.write(_format_reply(translator.update(text, seq)))
+        out.flush()
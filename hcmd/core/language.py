@@ -0,0 +1,227 @@
+"""
+Phrase packs: commands typed in other languages.
+
+A pack, ``hcmd/data/lang/<code>.tsv``, maps the phrases of one language to
+the English phrases the rules are written for. The input is rewritten
+before it is interpreted, so the intent rules, path extraction and the
+classifier work unchanged::
+
+    # phrase<TAB>English phrase
+    ve a	go to
+    descargas	downloads
+    {} में जाओ	go to {}
+
+An entry of the form ``{} PHRASE`` -> ``ENGLISH {}`` only matches at the end
+of the input and moves the rest of the input after the English phrase,
+for languages that put the verb last.
+
+Only the pack of the selected language is read, and compiled into its own
+matcher, on first use. The language comes from ``$HCMD_LANG``; otherwise
+from the script of the input (Devanagari is Hindi) or from letters only
+one language uses (ñ, ß); otherwise from the locale. ASCII input in an
+English locale never touches a pack, so installing more packs costs
+nothing to users who do not select them. To measure that::
+
+    python -m hcmd.core.language --bench
+
+To see what an input is rewritten to::
+
+    HCMD_LANG=es python -m hcmd.core.language ve a descargas
+"""
+import functools
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+# Directory holding the installed packs
+PACK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'lang')
+
+# The language the rules are written in; it needs no pack
+DEFAULT_LANGUAGE = 'en'
+
+# Checked in order on non-ASCII input: characters and the language they give away
+SCRIPT_HINTS = (
+    (re.compile('[ऀ-ॿ]'), 'hi'),
+    (re.compile('[ñ¿¡]', re.IGNORECASE), 'es'),
+    (re.compile('[äöüß]', re.IGNORECASE), 'de'),
+)
+
+# What may surround a phrase. \b is no use for scripts whose vowel signs
+# are not word characters, so phrases end at spaces, or at punctuation
+# followed by a space ("a." ends a phrase, "a.txt" does not).
+_BEFORE = r'(?<![^\s"\'(¿¡])'
+_AFTER = r'(?=["\'),;:.!?।]*(?:\s|$))'
+
+# Placeholder for the rest of the input in verb-last entries
+_REST = '{}'
+
+def _key(phrase: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', phrase).lower().split())
+
+def _alternation(phrases: Iterable[str]) -> str:
+    # Longest first, so "ve a la carpeta" wins over "ve a"
+    ordered = sorted(phrases, key=len, reverse=True)
+    return '|'.join(r'\s+'.join(map(re.escape, phrase.split())) for phrase in ordered)
+
+class PhrasePack:
+    """The phrases of one language, compiled into two matchers."""
+
+    def __init__(self, language: str, entries: Iterable[Tuple[str, str]]):
+        """
+        Compile a pack.
+
+        Args:
+            language: Language code (``es``)
+            entries: (phrase, English phrase) pairs
+
+        Raises:
+            ValueError: For a verb-last entry not shaped ``{} PHRASE`` -> ``ENGLISH {}``
+        """
+        self.language = language
+        self._inline: Dict[str, str] = {}
+        self._final: Dict[str, str] = {}
+        for phrase, english in entries:
+            if _REST in phrase or _REST in english:
+                if not (phrase.startswith(_REST) and english.endswith(_REST)):
+                    raise ValueError(f"{language}: '{phrase}' must be '{{}} PHRASE' -> 'ENGLISH {{}}'")
+                self._final[_key(phrase[len(_REST):])] = english[:-len(_REST)].strip()
+            else:
+                self._inline[_key(phrase)] = english.strip()
+        self._inline_pattern: Optional[Pattern] = (
+            re.compile(f"{_BEFORE}(?:{_alternation(self._inline)}){_AFTER}", re.IGNORECASE)
+            if self._inline else None)
+        self._final_pattern: Optional[Pattern] = (
+            re.compile(rf"(?:^|\s)(?:{_alternation(self._final)})[\s.!?।]*$", re.IGNORECASE)
+            if self._final else None)
+
+    @classmethod
+    def load(cls, language: str, pack_dir: str = PACK_DIR) -> 'PhrasePack':
+        """
+        Read and compile an installed pack.
+
+        Raises:
+            OSError: If the pack is not installed
+        """
+        entries = []
+        with open(os.path.join(pack_dir, f"{language}.tsv"), encoding='utf-8') as fh:
+            for line in fh:
+                line = line.rstrip('\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                phrase, _, english = line.partition('\t')
+                if english:
+                    entries.append((phrase, english))
+        return cls(language, entries)
+
+    def __len__(self) -> int:
+        return len(self._inline) + len(self._final)
+
+    def translate(self, text: str) -> str:
+        """Rewrite an input with the pack's phrases replaced by their English phrases."""
+        text = unicodedata.normalize('NFC', text)
+        if self._final_pattern is not None:
+            match = self._final_pattern.search(text)
+            if match:
+                english = self._final[_key(match.group(0).strip(' .!?।'))]
+                text = f"{english} {text[:match.start()].strip()}".strip()
+        if self._inline_pattern is not None:
+            text = self._inline_pattern.sub(lambda m: self._inline[_key(m.group(0))], text)
+        return ' '.join(text.split())
+
+# Compiled packs by (directory, language); None when the pack is not installed
+_packs: Dict[Tuple[str, str], Optional[PhrasePack]] = {}
+_packs_lock = threading.Lock()
+
+def get_pack(language: str, pack_dir: str = PACK_DIR) -> Optional[PhrasePack]:
+    """The compiled pack of a language, loaded on first use; None if it has none."""
+    key = (pack_dir, language)
+    if key in _packs:
+        return _packs[key]
+    with _packs_lock:
+        if key not in _packs:
+            try:
+                _packs[key] = PhrasePack.load(language, pack_dir)
+            except FileNotFoundError:
+                _packs[key] = None
+    return _packs[key]
+
+def installed_languages(pack_dir: str = PACK_DIR) -> List[str]:
+    """Codes of the installed packs."""
+    try:
+        return sorted(name[:-4] for name in os.listdir(pack_dir) if name.endswith('.tsv'))
+    except OSError:
+        return []
+
+@functools.lru_cache(maxsize=1)
+def locale_language() -> str:
+    """The language of the locale (``es_ES.UTF-8`` is ``es``), computed once."""
+    for variable in ('LC_ALL', 'LC_MESSAGES', 'LANG'):
+        value = os.environ.get(variable)
+        if value:
+            language = value.split('.')[0].split('_')[0].lower()
+            return DEFAULT_LANGUAGE if language in ('c', 'posix') else language
+    return DEFAULT_LANGUAGE
+
+def select_language(text: str) -> str:
+    """
+    The language an input is in: ``$HCMD_LANG``, then hints in the input
+    itself, then the locale.
+    """
+    configured = os.environ.get('HCMD_LANG')
+    if configured:
+        return configured.lower()
+    if not text.isascii():
+        for pattern, language in SCRIPT_HINTS:
+            if pattern.search(text):
+                return language
+    return locale_language()
+
+def to_english(text: str, pack_dir: str = PACK_DIR) -> str:
+    """Rewrite an input in the rules' language; English input is returned as is."""
+    language = select_language(text)
+    if language == DEFAULT_LANGUAGE:
+        return text
+    pack = get_pack(language, pack_dir)
+    return pack.translate(text) if pack is not None else text
+
+def _bench(counts: Tuple[int, ...] = (0, 10, 100, 1000), phrases: int = 200,
+           utterances: int = 20000) -> None:
+    """Time loading and translating with more and more synthetic packs installed."""
+    samples = {'en': 'list files in downloads', 'es': 'lista los archivos en descargas'}
+    print(f"{'packs':>6} {'first es call':>14} {'en / input':>11} {'es / input':>11}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as pack_dir:
+            for i in range(count):
+                with open(os.path.join(pack_dir, f"x{i:04d}.tsv"), 'w', encoding='utf-8') as fh:
+                    fh.write(''.join(f"frase{i}x{j} numero\tphrase {j}\n" for j in range(phrases)))
+            with open(os.path.join(PACK_DIR, 'es.tsv'), encoding='utf-8') as src, \
+                    open(os.path.join(pack_dir, 'es.tsv'), 'w', encoding='utf-8') as dst:
+                dst.write(src.read())
+
+            timings = {}
+            for language, text in samples.items():
+                os.environ['HCMD_LANG'] = language
+                started = time.perf_counter()
+                to_english(text, pack_dir)
+                timings[f'{language}_first'] = time.perf_counter() - started
+                started = time.perf_counter()
+                for _ in range(utterances):
+                    to_english(text, pack_dir)
+                timings[language] = (time.perf_counter() - started) / utterances
+            os.environ.pop('HCMD_LANG', None)
+        print(f"{count:>6} {timings['es_first'] * 1e3:>11.2f} ms {timings['en'] * 1e6:>8.2f} us "
+              f"{timings['es'] * 1e6:>8.2f} us")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        _bench()
+    elif len(sys.argv) > 1:
+        print(to_english(' '.join(sys.argv[1:])))
+    else:
+        for language in installed_languages():
+            print(f"{language}: {len(get_pack(language))} phrases")
@@ -0,0 +1,335 @@
+"""
+Low-latency process launcher for the hcmd tool.
+
+Commands that need no shell are started with ``os.posix_spawnp``, which
+glibc implements with vfork semantics: the child never copies the parent's
+page tables, so launching a process costs the same from a large Python
+heap as from a small one. Commands that do need a shell can optionally be
+handed to a zygote, a small helper interpreter started once, which forks
+the shell from its own tiny heap instead of ours.
+
+To compare the launch paths on this machine::
+
+    python -m hcmd.core.launcher [iterations]
+"""
+import marshal
+import os
+import selectors
+import signal
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (returncode, stdout, stderr)
+LaunchResult = Tuple[int, str, str]
+
+class Limits(NamedTuple):
+    """Resource limits applied to a launched child; None means unlimited."""
+    cpu_seconds: Optional[int] = None
+    memory_bytes: Optional[int] = None
+    file_size_bytes: Optional[int] = None
+    deadline: Optional[float] = None  # wall-clock seconds before the child is killed
+
+    @property
+    def has_rlimits(self) -> bool:
+        """True if any setrlimit() limit is set."""
+        return (self.cpu_seconds is not None or self.memory_bytes is not None or
+                self.file_size_bytes is not None)
+
+HAS_POSIX_SPAWN = hasattr(os, 'posix_spawnp') and sys.platform != 'win32'
+
+_HEADER = struct.Struct('<I')
+
+# Source of the zygote helper. It is run with ``python -S`` so it imports
+# nothing beyond the few modules it needs.
+ZYGOTE_SOURCE = r'''
+import marshal, os, struct, subprocess, sys
+header = struct.Struct('<I')
+inp, out = sys.stdin.buffer, sys.stdout.buffer
+def read_exact(n):
+    data = b''
+    while len(data) < n:
+        chunk = inp.read(n - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+while True:
+    argv, cwd = marshal.loads(read_exact(header.unpack(read_exact(header.size))[0]))
+    try:
+        proc = subprocess.run(argv, cwd=cwd, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        reply = (proc.returncode, proc.stdout, proc.stderr)
+    except OSError as e:
+        reply = (127, b'', str(e).encode('utf-8', 'replace'))
+    data = marshal.dumps(reply)
+    out.write(header.pack(len(data)) + data)
+    out.flush()
+'''
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8', errors='replace')
+
+def _timed_out(deadline: float) -> str:
+    return f"Timed out after {deadline:g}s"
+
+def _apply_rlimits(limits: Limits) -> None:
+    """Runs in the child between fork and exec."""
+    for which, value in ((resource.RLIMIT_CPU, limits.cpu_seconds),
+                         (resource.RLIMIT_AS, limits.memory_bytes),
+                         (resource.RLIMIT_FSIZE, limits.file_size_bytes)):
+        if value is not None:
+            resource.setrlimit(which, (value, value))
+
+def _run_subprocess(argv: Sequence[str], cwd: Optional[str],
+                    limits: Optional[Limits] = None) -> LaunchResult:
+    preexec = None
+    if limits is not None and limits.has_rlimits and resource is not None:
+        preexec = lambda: _apply_rlimits(limits)
+    with subprocess.Popen(list(argv), cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True, preexec_fn=preexec) as proc:
+        try:
+            stdout, stderr = proc.communicate(timeout=limits.deadline if limits else None)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, stderr = proc.communicate()
+            return proc.returncode, stdout, _timed_out(limits.deadline)
+    return proc.returncode, stdout, stderr
+
+def _collect(pid: int, out_fd: int, err_fd: int,
+             deadline: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+    """Drain a child's stdout and stderr pipes, then reap it."""
+    chunks = {out_fd: [], err_fd: []}
+    kill_at = time.monotonic() + deadline if deadline is not None else None
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_fd, selectors.EVENT_READ)
+        selector.register(err_fd, selectors.EVENT_READ)
+        while selector.get_map():
+            timeout = None
+            if kill_at is not None:
+                timeout = kill_at - time.monotonic()
+                if timeout <= 0:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    return -signal.SIGKILL, b''.join(chunks[out_fd]), _timed_out(deadline).encode()
+            for key, _ in selector.select(timeout):
+                data = os.read(key.fd, 65536)
+                if data:
+                    chunks[key.fd].append(data)
+                else:
+                    selector.unregister(key.fd)
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    return returncode, b''.join(chunks[out_fd]), b''.join(chunks[err_fd])
+
+def spawn(argv: Sequence[str], cwd: Optional[str] = None,
+          limits: Optional[Limits] = None) -> LaunchResult:
+    """
+    Run a command without a shell and capture its output.
+
+    Uses ``os.posix_spawnp`` where available. ``posix_spawn`` can neither
+    change the child's working directory nor its rlimits, so a ``cwd``
+    other than the current one, rlimits, and platforms without
+    ``posix_spawn`` fall back to subprocess.
+
+    Args:
+        argv: The argument vector; argv[0] is looked up on PATH
+        cwd: Working directory for the command
+        limits: Optional resource limits and wall-clock deadline
+
+    Returns:
+        LaunchResult: (returncode, stdout, stderr); returncode is negative
+        if the command was killed by a signal and 127 if it was not found
+    """
+    if not argv:
+        raise ValueError("Empty argument vector")
+    if (not HAS_POSIX_SPAWN or (limits is not None and limits.has_rlimits) or
+            (cwd is not None and os.path.realpath(cwd) != os.path.realpath(os.getcwd()))):
+        try:
+            return _run_subprocess(argv, cwd, limits)
+        except FileNotFoundError as e:
+            return 127, '', str(e)
+
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    try:
+        file_actions = [
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_DUP2, out_w, 1),
+            (os.POSIX_SPAWN_DUP2, err_w, 2),
+        ]
+        try:
+            pid = os.posix_spawnp(argv[0], list(argv), os.environ, file_actions=file_actions)
+        except FileNotFoundError:
+            return 127, '', f"{argv[0]}: command not found"
+    finally:
+        os.close(out_w)
+        os.close(err_w)
+    try:
+        returncode, stdout, stderr = _collect(pid, out_r, err_r,
+                                              limits.deadline if limits is not None else None)
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+    return returncode, _decode(stdout), _decode(stderr)
+
+class Zygote:
+    """
+    A small pre-started helper that launches commands on request.
+
+    The helper is a fresh interpreter started with ``-S``; requests and
+    replies travel over its stdin and stdout as length-prefixed marshal
+    records. Requests are serialized, so one zygote runs one command at a
+    time.
+    """
+
+    def __init__(self, python: Optional[str] = None):
+        """
+        Start the helper.
+
+        Args:
+            python: Interpreter to run the helper with (defaults to this one)
+        """
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            [python or sys.executable, '-S', '-c', ZYGOTE_SOURCE],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+
+    @property
+    def alive(self) -> bool:
+        """True while the helper process is running."""
+        return self._proc.poll() is None
+
+    def _read_exact(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self._proc.stdout.read(size - len(data))
+            if not chunk:
+                raise OSError("Zygote exited unexpectedly")
+            data += chunk
+        return data
+
+    def run(self, argv: Sequence[str], cwd: Optional[str] = None) -> LaunchResult:
+        """
+        Run a command through the helper and capture its output.
+
+        Args:
+            argv: The argument vector
+            cwd: Working directory for the command
+
+        Returns:
+            LaunchResult: (returncode, stdout, stderr)
+        """
+        request = marshal.dumps((list(argv), cwd))
+        with self._lock:
+            self._proc.stdin.write(_HEADER.pack(len(request)) + request)
+            self._proc.stdin.flush()
+            size, = _HEADER.unpack(self._read_exact(_HEADER.size))
+            returncode, stdout, stderr = marshal.loads(self._read_exact(size))
+        return returncode, _decode(stdout), _decode(stderr)
+
+    def close(self) -> None:
+        """Stop the helper."""
+        with self._lock:
+            if self._proc.poll() is None:
+                self._proc.stdin.close()
+                try:
+                    self._proc.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+                    self._proc.wait()
+            self._proc.stdout.close()
+
+_zygote: Optional[Zygote] = None
+_zygote_lock = threading.Lock()
+
+def get_zygote() -> Zygote:
+    """Get the process-wide zygote, (re)starting it if needed."""
+    global _zygote
+    with _zygote_lock:
+        if _zygote is None or not _zygote.alive:
+            _zygote = Zygote()
+    return _zygote
+
+def launch(argv: Sequence[str], cwd: Optional[str] = None, use_zygote: bool = False,
+           limits: Optional[Limits] = None) -> LaunchResult:
+    """
+    Run a command with the fastest available launcher.
+
+    Args:
+        argv: The argument vector
+        cwd: Working directory for the command
+        use_zygote: Hand the command to the zygote helper instead of
+            spawning it from this process (ignored when limits are set)
+        limits: Optional resource limits and wall-clock deadline
+
+    Returns:
+        LaunchResult: (returncode, stdout, stderr)
+    """
+    if use_zygote and HAS_POSIX_SPAWN and limits is None:
+        try:
+            return get_zygote().run(argv, cwd)
+        except OSError:
+            pass  # Helper died; launch directly
+    return spawn(argv, cwd, limits)
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def benchmark(iterations: int = 200) -> List[Tuple[str, float, float, float]]:
+    """
+    Time the launch paths with a trivial command.
+
+    Args:
+        iterations: Launches per path
+
+    Returns:
+        List of (path, launches per second, p50 ms, p99 ms)
+    """
+    shell = os.environ.get('SHELL', '/bin/sh')
+    true = shutil.which('true') or '/bin/true'
+    paths = [
+        ('subprocess shell -c', lambda: _run_subprocess([shell, '-c', 'true'], None)),
+        ('posix_spawn argv', lambda: spawn([true])),
+        ('posix_spawn shell -c', lambda: spawn([shell, '-c', 'true'])),
+    ]
+    if HAS_POSIX_SPAWN:
+        zygote = get_zygote()
+        paths.append(('zygote shell -c', lambda: zygote.run([shell, '-c', 'true'])))
+
+    results = []
+    for name, call in paths:
+        call()  # Warm up
+        samples = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            begin = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+        results.append((name, iterations / elapsed,
+                        _percentile(samples, 0.5) * 1000, _percentile(samples, 0.99) * 1000))
+    return results
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Simulate a large parent heap, which is what makes fork() expensive
+    ballast = [bytearray(4096) for _ in range(int(os.environ.get('HCMD_BENCH_HEAP_MB', '256')) * 256)]
+    print(f"{'launcher':<24}{'spawns/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, rate, p50, p99 in benchmark(count):
+        print(f"{name:<24}{rate:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+    if _zygote is not None:
+        _zygote.close()
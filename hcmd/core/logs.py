@@ -0,0 +1,414 @@
+"""Constant-memory log file reading: tail, head, search and follow."""
+import mmap
+import os
+import re
+import select
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .grep import MAX_LINE, _count_newlines, required_literal
+
+# Bytes read per step when walking a file backwards
+TAIL_BLOCK = 64 * 1024
+
+# Once a binary search has narrowed a time range to this many bytes, the
+# remaining lines are scanned one by one
+BISECT_LIMIT = 64 * 1024
+
+# Lines without a timestamp (stack traces, continuations) skipped while
+# probing for the time of an offset
+PROBE_LINES = 64
+
+# Leading bytes of a line searched for its timestamp
+TIMESTAMP_SCAN = 100
+
+# Delay between two size checks when following without inotify, and the
+# longest wait for an inotify event before the stop flag is checked again
+FOLLOW_POLL = 0.5
+
+# Modes of a LogQuery
+LOG_MODES = ('tail', 'head', 'search', 'follow')
+
+# Option keys of a LogQuery
+LOG_OPTIONS = ('count', 'pattern', 'regex', 'ignore_case', 'max_age', 'min_age')
+
+_MONTHS = {m: i for i, m in enumerate(
+    (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'), 1)}
+
+# ISO 8601 ("2024-05-01T12:00:00"), syslog ("May  1 12:00:00") and
+# common log format ("01/May/2024:12:00:00") timestamps
+_TIMESTAMP = re.compile(
+    rb'(?P<iso>(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d))'
+    rb'|(?P<syslog>\b([A-Z][a-z]{2}) +(\d{1,2}) (\d\d):(\d\d):(\d\d))'
+    rb'|(?P<clf>(\d\d)/([A-Z][a-z]{2})/(\d{4}):(\d\d):(\d\d):(\d\d))')
+
+def parse_timestamp(line: bytes, year: Optional[int] = None) -> Optional[float]:
+    """
+    Find the timestamp near the start of a log line.
+
+    Args:
+        line: The raw line (only its first TIMESTAMP_SCAN bytes are used)
+        year: Year assumed for syslog timestamps, which have none (default:
+            the current year, or the previous one for dates in the future)
+
+    Returns:
+        float: The local time as a Unix timestamp, or None
+    """
+    match = _TIMESTAMP.search(line, 0, TIMESTAMP_SCAN)
+    if match is None:
+        return None
+    g = match.groups()
+    try:
+        if match.group('iso'):
+            stamp = datetime(int(g[1]), int(g[2]), int(g[3]), int(g[4]), int(g[5]), int(g[6]))
+        elif match.group('clf'):
+            stamp = datetime(int(g[16]), _MONTHS[g[15]], int(g[14]), int(g[17]), int(g[18]), int(g[19]))
+        else:
+            now = datetime.now()
+            stamp = datetime(year or now.year, _MONTHS[g[8]], int(g[9]), int(g[10]), int(g[11]), int(g[12]))
+            if year is None and (stamp - now).days >= 1:
+                stamp = stamp.replace(year=now.year - 1)
+    except (KeyError, ValueError):
+        return None
+    return stamp.timestamp()
+
+class LogQuery:
+    """A compiled log request: a file, a mode and optional line filters."""
+
+    def __init__(self, path: str, mode: str = 'tail', options: Optional[List[str]] = None):
+        """
+        Compile a log request.
+
+        Args:
+            path: The log file
+            mode: 'tail' (last lines), 'head' (first lines), 'search' (every
+                matching line) or 'follow' (the last lines, then new ones)
+            options: ``key=value`` strings: count (lines for tail, head and
+                follow; matches for search), pattern, regex=1,
+                ignore_case=1, max_age and min_age (seconds before now)
+
+        Raises:
+            ValueError: For an unknown mode or option
+        """
+        if mode not in LOG_MODES:
+            raise ValueError(f"Unknown log mode: {mode}")
+        values = {}
+        for option in options or []:
+            key, _, value = option.partition('=')
+            if key not in LOG_OPTIONS:
+                raise ValueError(f"Unknown log option: {key}")
+            values[key] = value
+
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.mode = mode
+        self.count = int(values['count']) if 'count' in values else (None if mode == 'search' else 10)
+        now = time.time()
+        self.since = now - float(values['max_age']) if 'max_age' in values else None
+        self.until = now - float(values['min_age']) if 'min_age' in values else None
+
+        self.pattern = values.get('pattern')
+        self.regex = None
+        self.literal = b''
+        if self.pattern:
+            is_regex = values.get('regex') == '1'
+            ignore_case = values.get('ignore_case') == '1'
+            source = self.pattern if is_regex else re.escape(self.pattern)
+            self.regex = re.compile(source.encode('utf-8'), re.IGNORECASE if ignore_case else 0)
+            if not ignore_case:
+                self.literal = required_literal(self.pattern) if is_regex else self.pattern.encode('utf-8')
+
+    def accepts(self, line: bytes) -> bool:
+        """Apply the pattern and time range to one line."""
+        if self.regex is not None and not self.regex.search(line):
+            return False
+        if self.since is not None or self.until is not None:
+            stamp = parse_timestamp(line)
+            if stamp is None:
+                return False
+            if self.since is not None and stamp < self.since:
+                return False
+            if self.until is not None and stamp > self.until:
+                return False
+        return True
+
+def _result(raw: bytes, offset: int, line: Optional[int] = None) -> Dict:
+    text = raw[:MAX_LINE].rstrip(b'\r').decode('utf-8', errors='replace')
+    result = {'offset': offset, 'text': text}
+    if line is not None:
+        result['line'] = line
+    return result
+
+def reverse_lines(fd: int, size: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield the lines of a file from last to first, with their offsets.
+
+    The file is read backwards in TAIL_BLOCK steps, so the cost depends on
+    how many lines are consumed, not on the size of the file.
+    """
+    pos = size
+    carry = b''
+    while pos > 0:
+        step = min(TAIL_BLOCK, pos)
+        pos -= step
+        block = os.pread(fd, step, pos) + carry
+        lines = block.split(b'\n')
+        # The first piece may be the tail of a line that started earlier
+        carry = lines.pop(0)
+        offset = pos + len(block)
+        for line in reversed(lines):
+            offset -= len(line) + 1
+            yield offset + 1, line
+        if len(carry) > 1 << 24:
+            # A single line over 16 MiB; yield its end rather than grow forever
+            yield pos, carry
+            carry = b''
+    if carry:
+        yield 0, carry
+
+def tail(query: LogQuery) -> Iterator[Dict]:
+    """The last ``count`` (matching) lines, in file order."""
+    fd = os.open(query.path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        # A final newline ends the last line rather than starting an empty one
+        if size and os.pread(fd, 1, size - 1) == b'\n':
+            size -= 1
+        found: List[Dict] = []
+        for offset, line in reverse_lines(fd, size):
+            if len(found) >= query.count:
+                break
+            if query.since is not None:
+                # Everything before the first line older than the range is older too
+                stamp = parse_timestamp(line)
+                if stamp is not None and stamp < query.since:
+                    break
+            if query.accepts(line):
+                found.append(_result(line, offset))
+    finally:
+        os.close(fd)
+    return iter(reversed(found))
+
+def head(query: LogQuery) -> Iterator[Dict]:
+    """The first ``count`` (matching) lines."""
+    found = 0
+    offset = 0
+    with open(query.path, 'rb') as fh:
+        for number, line in enumerate(fh, 1):
+            if found >= query.count:
+                return
+            raw = line.rstrip(b'\n')
+            if query.accepts(raw):
+                yield _result(raw, offset, number)
+                found += 1
+            offset += len(line)
+
+def _next_line(buf, pos: int, size: int) -> int:
+    """Offset of the first line starting at or after ``pos``."""
+    if pos <= 0:
+        return 0
+    found = buf.find(b'\n', pos - 1, size)
+    return size if found < 0 else found + 1
+
+def _time_at(buf, pos: int, size: int) -> Optional[float]:
+    """Timestamp of the first stamped line at or after ``pos``."""
+    start = _next_line(buf, pos, size)
+    for _ in range(PROBE_LINES):
+        if start >= size:
+            return None
+        end = buf.find(b'\n', start, size)
+        end = size if end < 0 else end
+        stamp = parse_timestamp(buf[start:min(end, start + TIMESTAMP_SCAN)])
+        if stamp is not None:
+            return stamp
+        start = end + 1
+    return None
+
+def _bisect_time(buf, size: int, when: float, after: bool) -> int:
+    """
+    Offset of the first line stamped at or after ``when`` (after ``when`` if ``after``).
+
+    The file is assumed to be sorted by time, as appended logs are.
+    """
+    lo, hi = 0, size
+    while hi - lo > BISECT_LIMIT:
+        mid = (lo + hi) // 2
+        stamp = _time_at(buf, mid, size)
+        if stamp is None or (stamp > when if after else stamp >= when):
+            hi = mid
+        else:
+            lo = mid
+    pos = _next_line(buf, lo, size)
+    while pos < size:
+        end = buf.find(b'\n', pos, size)
+        end = size if end < 0 else end
+        stamp = parse_timestamp(buf[pos:min(end, pos + TIMESTAMP_SCAN)])
+        if stamp is not None and (stamp > when if after else stamp >= when):
+            return pos
+        pos = end + 1
+    return size
+
+def _is_time_sorted(buf, size: int) -> bool:
+    first = _time_at(buf, 0, size)
+    last = _time_at(buf, max(0, size - BISECT_LIMIT), size)
+    return first is not None and last is not None and first <= last
+
+def search(query: LogQuery) -> Iterator[Dict]:
+    """
+    Every matching line, in file order.
+
+    The file is memory-mapped. A literal that every match contains is
+    located with find() and the regular expression only runs on the lines
+    around it; a time range is turned into a byte range by binary search
+    when the log is sorted by time.
+    """
+    with open(query.path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _search_range(query, mm, size)
+
+def _search_range(query: LogQuery, buf, size: int) -> Iterator[Dict]:
+    start, end = 0, size
+    ranged = False
+    if (query.since is not None or query.until is not None) and _is_time_sorted(buf, size):
+        if query.since is not None:
+            start = _bisect_time(buf, size, query.since, after=False)
+        if query.until is not None:
+            end = _bisect_time(buf, size, query.until, after=True)
+        ranged = True
+
+    filtered = not ranged and (query.since is not None or query.until is not None)
+    line_no = 1 if start == 0 else None
+    counted_to = 0
+    found = 0
+    pos = start
+    while pos < end and (query.count is None or found < query.count):
+        verified = False
+        if query.literal:
+            hit = buf.find(query.literal, pos, end)
+        elif query.regex is not None:
+            # No literal to look for: the expression runs over the mapping
+            match = query.regex.search(buf, pos, end)
+            hit = -1 if match is None else match.start()
+            verified = True
+        else:
+            hit = pos
+        if hit < 0:
+            return
+        line_start = buf.rfind(b'\n', pos, hit) + 1 or pos
+        line_end = buf.find(b'\n', hit, end)
+        line_end = end if line_end < 0 else line_end
+        line = buf[line_start:line_end]
+        pos = line_end + 1
+        if not verified and query.regex is not None and not query.regex.search(line):
+            continue
+        # Lines inside a bisected range are already known to be in it
+        if filtered and not query.accepts(line):
+            continue
+        if line_no is not None:
+            line_no += _count_newlines(buf, counted_to, line_start)
+            counted_to = line_start
+        yield _result(line, line_start, line_no)
+        found += 1
+
+def _inotify() -> Optional[Tuple[Callable[[str], int], Callable[[], None], int]]:
+    """An inotify instance (add_watch, close, fd), or None where unavailable."""
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    # IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+    mask = 0x002 | 0x004 | 0x800 | 0x400
+
+    def add_watch(path: str) -> int:
+        return libc.inotify_add_watch(fd, os.fsencode(path), mask)
+
+    return add_watch, lambda: os.close(fd), fd
+
+def follow(query: LogQuery, stop: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """
+    The last ``count`` lines, then every (matching) line appended afterwards.
+
+    Waits on inotify where available and polls the file size otherwise.
+    Truncation restarts from the beginning and a rotated file (moved or
+    deleted, then recreated) is reopened by name. Runs until ``stop`` is set.
+    """
+    yield from tail(query)
+    watcher = _inotify()
+    fh = open(query.path, 'rb')
+    try:
+        fh.seek(0, os.SEEK_END)
+        if watcher is not None:
+            watcher[0](query.path)
+        partial = b''
+        while stop is None or not stop.is_set():
+            if watcher is not None:
+                ready, _, _ = select.select([watcher[2]], [], [], FOLLOW_POLL)
+                if ready:
+                    try:
+                        os.read(watcher[2], 65536)
+                    except BlockingIOError:
+                        pass
+            else:
+                time.sleep(FOLLOW_POLL)
+
+            try:
+                current = os.stat(query.path)
+            except FileNotFoundError:
+                continue
+            if current.st_ino != os.fstat(fh.fileno()).st_ino:
+                # Rotated: finish the old file, then switch to the new one
+                data = partial + fh.read()
+                offset = fh.tell() - len(data)
+                if data and not data.endswith(b'\n'):
+                    # The old file will not grow any more
+                    data += b'\n'
+                fh.close()
+                fh = open(query.path, 'rb')
+                if watcher is not None:
+                    watcher[0](query.path)
+            else:
+                if current.st_size < fh.tell():
+                    # Truncated in place
+                    fh.seek(0)
+                    partial = b''
+                data = partial + fh.read()
+                offset = fh.tell() - len(data)
+            lines = data.split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                if query.accepts(line):
+                    yield _result(line, offset)
+                offset += len(line) + 1
+    finally:
+        fh.close()
+        if watcher is not None:
+            watcher[1]()
+
+def read_log(query: LogQuery, stop: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """
+    Run a log request.
+
+    Args:
+        query: The compiled request
+        stop: For follow mode, an event that ends it
+
+    Yields:
+        Dict: ``{'offset', 'text'}`` per line, plus ``line`` (its number)
+        where it is known without reading the file from the start
+    """
+    if query.mode == 'head':
+        return head(query)
+    if query.mode == 'follow':
+        return follow(query, stop)
+    if query.mode == 'tail':
+        return tail(query)
+    return search(query)
@@ -0,0 +1,301 @@
+"""
+Low-overhead metrics registry for long-running hcmd processes.
+
+Counters and fixed-bucket histograms write to per-thread shards, so the
+hot path takes no lock: each thread only ever mutates its own dict, and
+readers sum the shards. The registry renders the Prometheus text format,
+can serve it on a local HTTP endpoint and can write a JSON snapshot.
+
+Metrics are always collected; they only cost a few dict operations per
+event. Set ``HCMD_METRICS=0`` to turn recording into a no-op.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+                   0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Common state of a metric: name, help text, label names and shards."""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot_shards(self) -> List[Dict]:
+        with self._shards_lock:
+            # Copy each shard; dict(copy) of a dict mutated by another thread
+            # is safe in CPython, at worst missing the update in flight
+            return [dict(shard) for shard in self._shards]
+
+    def reset(self) -> None:
+        """Forget every recorded value."""
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = 'counter'
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Add ``amount`` to the series identified by ``label_values``."""
+        if not ENABLED:
+            return
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        """Current totals per label combination."""
+        totals: Dict[LabelValues, float] = {}
+        for shard in self._snapshot_shards():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+                for key, value in sorted(self.values().items())]
+
+    def snapshot(self) -> List[Dict]:
+        return [{'labels': dict(zip(self.labels, key)), 'value': value}
+                for key, value in sorted(self.values().items())]
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, with their sum."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record one observation for the series identified by ``label_values``."""
+        if not ENABLED:
+            return
+        shard = self._shard()
+        series = shard.get(label_values)
+        if series is None:
+            # One slot per bucket plus +Inf, then the sum
+            series = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *label_values: str) -> '_Timer':
+        """Context manager observing the wall-clock duration of its block."""
+        return _Timer(self, label_values)
+
+    def values(self) -> Dict[LabelValues, List[float]]:
+        """Per label combination: per-bucket counts (with +Inf last) and then the sum."""
+        totals: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshot_shards():
+            for key, series in shard.items():
+                series = list(series)
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = series
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = [_format_value(b) for b in self.buckets] + ['+Inf']
+        for key, series in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+    def snapshot(self) -> List[Dict]:
+        result = []
+        for key, series in sorted(self.values().items()):
+            counts = series[:-1]
+            result.append({'labels': dict(zip(self.labels, key)),
+                           'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], counts)),
+                           'count': sum(counts), 'sum': series[-1]})
+        return result
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram: Histogram, label_values: LabelValues):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+class MetricsRegistry:
+    """A named collection of metrics with Prometheus and JSON exporters."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        """Get or create a counter."""
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """Every metric as a JSON-serialisable dict."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return {
+            'timestamp': time.time(),
+            'pid': os.getpid(),
+            'metrics': {m.name: {'type': m.kind, 'help': m.help, 'series': m.snapshot()}
+                        for m in metrics},
+        }
+
+    def write_snapshot(self, path: str) -> None:
+        """Write snapshot() to a JSON file atomically."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.snapshot(), fh, indent=2)
+        os.replace(tmp, path)
+
+    def reset(self) -> None:
+        """Forget every recorded value, keeping the metrics registered."""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.reset()
+
+    def serve(self, port: int = 9464, host: str = '127.0.0.1') -> Tuple[str, int]:
+        """
+        Serve ``/metrics`` (Prometheus) and ``/metrics.json`` from a daemon thread.
+
+        Args:
+            port: TCP port (0 picks a free one)
+            host: Interface to bind; loopback by default
+
+        Returns:
+            Tuple[str, int]: The bound (host, port)
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        if self._server is None:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='hcmd-metrics',
+                             daemon=True).start()
+        return self._server.server_address[:2]
+
+    def stop_serving(self) -> None:
+        """Stop the HTTP endpoint, if running."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+ENABLED = os.environ.get('HCMD_METRICS', '1') != '0'
+
+# The process-wide registry and the metrics recorded by hcmd itself
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'hcmd_stage_seconds', 'Time spent per pipeline stage', ('stage',))
+INTENTS = REGISTRY.counter(
+    'hcmd_intents_total', 'Interpreted inputs per command type', ('type',))
+BLOCKED = REGISTRY.counter(
+    'hcmd_blocked_commands_total', 'Commands rejected by the safety check, per rule', ('rule',))
+EXIT_CODES = REGISTRY.counter(
+    'hcmd_exit_codes_total', 'Executed commands per mode and exit code', ('mode', 'code'))
+CACHE_LOOKUPS = REGISTRY.counter(
+    'hcmd_result_cache_lookups_total', 'Result cache lookups', ('result',))
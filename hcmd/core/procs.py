@@ -0,0 +1,356 @@
+"""Process and socket inspection read directly from /proc (Linux)."""
+import heapq
+import os
+import signal
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+PROC_ROOT = '/proc'
+
+# Snapshots younger than this are served from the cache
+SNAPSHOT_TTL = 1.0
+
+# Sampling window for CPU usage when no recent snapshot is cached
+CPU_SAMPLE = 0.25
+
+# /proc/net tables searched for sockets, by protocol
+SOCKET_TABLES = (('tcp', 'tcp'), ('tcp6', 'tcp6'), ('udp', 'udp'), ('udp6', 'udp6'))
+
+# TCP states of /proc/net/tcp, by their hex code
+TCP_STATES = {
+    '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1',
+    '05': 'FIN_WAIT2', '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT',
+    '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING',
+}
+
+# Signals a KILL may send, by name
+SIGNALS = {'TERM': signal.SIGTERM, 'KILL': getattr(signal, 'SIGKILL', signal.SIGTERM),
+           'INT': signal.SIGINT, 'HUP': getattr(signal, 'SIGHUP', signal.SIGTERM)}
+
+class ProcStat(NamedTuple):
+    """The fields of /proc/<pid>/stat hcmd uses."""
+    pid: int
+    name: str
+    state: str
+    ppid: int
+    cpu_ticks: int
+    start_ticks: int
+    rss_pages: int
+
+class Snapshot(NamedTuple):
+    """Every process at one point in time."""
+    taken: float
+    procs: Dict[int, ProcStat]
+
+_snapshot_lock = threading.Lock()
+_snapshot: Optional[Snapshot] = None
+
+def _require_proc() -> None:
+    if not os.path.isdir(os.path.join(PROC_ROOT, 'self')):
+        raise OSError("Process inspection reads /proc, which this system does not provide")
+
+def _read(path: str, size: int = 4096) -> bytes:
+    """Read a small /proc file with a single read() call."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+def _parse_stat(pid: int, data: bytes) -> ProcStat:
+    # The name is parenthesized and may itself contain spaces and parentheses
+    close = data.rindex(b')')
+    name = data[data.index(b'(') + 1:close].decode('utf-8', 'replace')
+    fields = data[close + 2:].split()
+    return ProcStat(pid, name, fields[0].decode(), int(fields[1]),
+                    int(fields[11]) + int(fields[12]), int(fields[19]), int(fields[21]))
+
+def take_snapshot(max_age: float = SNAPSHOT_TTL) -> Snapshot:
+    """
+    Read /proc/<pid>/stat for every process.
+
+    Only the stat file is read here, in one pass with one read() per
+    process; command lines and owners are looked up later for the few
+    processes that are reported. Snapshots are shared between callers for
+    ``max_age`` seconds.
+
+    Args:
+        max_age: Oldest cached snapshot to return instead of a new one
+
+    Returns:
+        Snapshot: The processes by pid
+    """
+    global _snapshot
+    _require_proc()
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _snapshot.taken < max_age:
+            return _snapshot
+    procs: Dict[int, ProcStat] = {}
+    for name in os.listdir(PROC_ROOT):
+        if not name.isdigit():
+            continue
+        try:
+            procs[int(name)] = _parse_stat(int(name), _read(f"{PROC_ROOT}/{name}/stat"))
+        except (OSError, ValueError, IndexError):
+            # Exited since listdir(), or a kernel we cannot parse
+            continue
+    snapshot = Snapshot(time.monotonic(), procs)
+    with _snapshot_lock:
+        _snapshot = snapshot
+    return snapshot
+
+def _meminfo_total() -> int:
+    for line in _read(f"{PROC_ROOT}/meminfo").split(b'\n'):
+        if line.startswith(b'MemTotal:'):
+            return int(line.split()[1]) * 1024
+    return 0
+
+def _uptime_ticks(ticks: int) -> float:
+    return float(_read(f"{PROC_ROOT}/uptime").split()[0]) * ticks
+
+def _describe(stat: ProcStat, cpu_percent: float, page_size: int, mem_total: int) -> Dict:
+    """Build the reported dict of a process, reading its command line and owner."""
+    process = {
+        'pid': stat.pid,
+        'ppid': stat.ppid,
+        'name': stat.name,
+        'state': stat.state,
+        'cpu_percent': round(cpu_percent, 1),
+        'rss': stat.rss_pages * page_size,
+        'mem_percent': round(100.0 * stat.rss_pages * page_size / mem_total, 1) if mem_total else 0.0,
+        'user': None,
+        'cmdline': '',
+        'start_ticks': stat.start_ticks,
+    }
+    try:
+        uid = os.stat(f"{PROC_ROOT}/{stat.pid}").st_uid
+        process['user'] = _user_name(uid)
+        cmdline = _read(f"{PROC_ROOT}/{stat.pid}/cmdline", 65536)
+        process['cmdline'] = cmdline.rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace')
+    except OSError:
+        pass
+    return process
+
+def _user_name(uid: int) -> str:
+    try:
+        import pwd
+        return pwd.getpwuid(uid).pw_name
+    except (ImportError, KeyError):
+        return str(uid)
+
+def _cpu_rates(sort: str, max_age: float = SNAPSHOT_TTL) -> Tuple[Snapshot, Dict[int, float]]:
+    """The current snapshot and each process's CPU usage in percent of one core."""
+    ticks = os.sysconf('SC_CLK_TCK')
+    if sort != 'cpu':
+        # Lifetime average, as ps reports it
+        snapshot = take_snapshot(max_age)
+        uptime = _uptime_ticks(ticks)
+        return snapshot, {pid: 100.0 * p.cpu_ticks / max(uptime - p.start_ticks, 1)
+                          for pid, p in snapshot.procs.items()}
+    base = take_snapshot(max_age=float('inf'))
+    elapsed = time.monotonic() - base.taken
+    if elapsed > 10 * SNAPSHOT_TTL:
+        base = take_snapshot(max_age=0)
+        elapsed = 0.0
+    if elapsed < CPU_SAMPLE:
+        time.sleep(CPU_SAMPLE - elapsed)
+    current = take_snapshot(max_age=0)
+    seconds = current.taken - base.taken
+    rates = {}
+    for pid, p in current.procs.items():
+        before = base.procs.get(pid)
+        used = p.cpu_ticks - before.cpu_ticks if before and before.start_ticks == p.start_ticks else 0
+        rates[pid] = 100.0 * used / ticks / seconds
+    return current, rates
+
+def top_processes(sort: str = 'memory', count: int = 10) -> List[Dict]:
+    """
+    The processes using the most memory or CPU.
+
+    The N largest are selected with a heap before any per-process file
+    beyond ``stat`` is read.
+
+    Args:
+        sort: 'memory' (resident size) or 'cpu' (usage over a short sample)
+        count: Number of processes to return
+
+    Returns:
+        List[Dict]: Process dicts, largest first
+    """
+    snapshot, rates = _cpu_rates(sort)
+    if sort == 'cpu':
+        key = lambda p: (rates.get(p.pid, 0.0), p.rss_pages)
+    else:
+        key = lambda p: (p.rss_pages, rates.get(p.pid, 0.0))
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    mem_total = _meminfo_total()
+    return [_describe(p, rates.get(p.pid, 0.0), page_size, mem_total)
+            for p in heapq.nlargest(count, snapshot.procs.values(), key=key)]
+
+def find_processes(name: str, exact: bool = False, max_age: float = SNAPSHOT_TTL) -> List[Dict]:
+    """
+    Processes whose name (or program file name) matches.
+
+    Args:
+        name: Name to look for, case-insensitively
+        exact: Require the whole name to match instead of a substring
+        max_age: Oldest cached snapshot that may be used
+
+    Returns:
+        List[Dict]: Process dicts, by pid
+    """
+    snapshot, rates = _cpu_rates('memory', max_age)
+    wanted = name.lower()
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    mem_total = _meminfo_total()
+    matches = []
+    for pid in sorted(snapshot.procs):
+        stat = snapshot.procs[pid]
+        if _name_matches(stat.name.lower(), wanted, exact):
+            matches.append(_describe(stat, rates.get(pid, 0.0), page_size, mem_total))
+        elif len(stat.name) >= 15:
+            # The kernel truncates names to 15 characters; compare argv[0] instead
+            process = _describe(stat, rates.get(pid, 0.0), page_size, mem_total)
+            argv0 = os.path.basename(process['cmdline'].split(' ', 1)[0]).lower()
+            if _name_matches(argv0, wanted, exact):
+                matches.append(process)
+    return matches
+
+def _name_matches(name: str, wanted: str, exact: bool) -> bool:
+    return name == wanted if exact else wanted in name
+
+def _decode_address(hex_addr: str) -> Tuple[str, int]:
+    """Decode an ``ADDR:PORT`` field of /proc/net/tcp{,6} (address words in host order)."""
+    addr, port = hex_addr.split(':')
+    raw = bytes.fromhex(addr)
+    # Each 32-bit word is stored in host (little-endian) byte order
+    raw = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    if len(raw) == 4:
+        host = '.'.join(str(b) for b in raw)
+    else:
+        import ipaddress
+        host = str(ipaddress.IPv6Address(raw))
+    return host, int(port, 16)
+
+def _sockets(port: Optional[int] = None) -> List[Dict]:
+    """Sockets from /proc/net, optionally only those bound to a local port."""
+    sockets = []
+    for proto, table in SOCKET_TABLES:
+        try:
+            with open(f"{PROC_ROOT}/net/{table}", 'r') as fh:
+                lines = fh.read().split('\n')[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            host, local_port = _decode_address(fields[1])
+            if port is not None and local_port != port:
+                continue
+            state = TCP_STATES.get(fields[3], fields[3]) if proto.startswith('tcp') else None
+            sockets.append({'proto': proto, 'address': host, 'port': local_port,
+                            'state': state, 'inode': int(fields[9])})
+    return sockets
+
+def _socket_owners(inodes: Set[int]) -> Dict[int, int]:
+    """Map socket inodes to the pid holding them, by scanning /proc/<pid>/fd."""
+    owners: Dict[int, int] = {}
+    wanted = {f"socket:[{inode}]": inode for inode in inodes if inode}
+    for name in os.listdir(PROC_ROOT):
+        if not wanted:
+            break
+        if not name.isdigit():
+            continue
+        try:
+            with os.scandir(f"{PROC_ROOT}/{name}/fd") as entries:
+                for entry in entries:
+                    try:
+                        inode = wanted.pop(os.readlink(entry.path), None)
+                    except OSError:
+                        continue
+                    if inode is not None:
+                        owners[inode] = int(name)
+        except OSError:
+            # Exited, or owned by another user
+            continue
+    return owners
+
+def port_users(port: int) -> List[Dict]:
+    """
+    The sockets bound to a local port and the processes holding them.
+
+    Args:
+        port: The port number
+
+    Returns:
+        List[Dict]: ``{'proto', 'address', 'port', 'state', 'pid', 'name',
+        'user', 'cmdline'}`` per socket; ``pid`` is None for sockets of
+        processes the current user cannot inspect
+    """
+    _require_proc()
+    sockets = _sockets(port)
+    owners = _socket_owners({s['inode'] for s in sockets})
+    snapshot = take_snapshot()
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    mem_total = _meminfo_total()
+    for sock in sockets:
+        pid = owners.get(sock.pop('inode'))
+        stat = snapshot.procs.get(pid) if pid is not None else None
+        process = _describe(stat, 0.0, page_size, mem_total) if stat is not None else {}
+        sock.update(pid=pid, name=process.get('name'), user=process.get('user'),
+                    cmdline=process.get('cmdline'))
+    return sockets
+
+def resolve_targets(kind: str, value: str) -> List[Dict]:
+    """
+    The processes a KILL request designates.
+
+    Args:
+        kind: 'pid', 'name' (exact process name) or 'port' (holders of the port)
+
+    Returns:
+        List[Dict]: Process dicts, by pid
+    """
+    if kind == 'pid':
+        snapshot = take_snapshot(max_age=0)
+        stat = snapshot.procs.get(int(value))
+        if stat is None:
+            return []
+        return [_describe(stat, 0.0, os.sysconf('SC_PAGE_SIZE'), _meminfo_total())]
+    if kind == 'name':
+        # Signals must never be based on a cached view
+        return find_processes(value, exact=True, max_age=0)
+    if kind == 'port':
+        pids = sorted({s['pid'] for s in port_users(int(value)) if s['pid'] is not None})
+        return [p for pid in pids for p in resolve_targets('pid', str(pid))]
+    raise ValueError(f"Unknown process target: {kind}")
+
+def send_signal(processes: Iterable[Dict], signame: str = 'TERM') -> Tuple[List[int], List[str]]:
+    """
+    Signal processes, skipping those that exited or were replaced since they were resolved.
+
+    Args:
+        processes: Process dicts from resolve_targets
+        signame: A key of SIGNALS
+
+    Returns:
+        (pids signalled, error messages)
+    """
+    sig = SIGNALS[signame]
+    done: List[int] = []
+    errors: List[str] = []
+    snapshot = take_snapshot(max_age=0)
+    for process in processes:
+        current = snapshot.procs.get(process['pid'])
+        if current is None or current.start_ticks != process['start_ticks']:
+            # The pid was reused by another program
+            errors.append(f"{process['pid']} ({process['name']}): no longer running")
+            continue
+        try:
+            os.kill(process['pid'], sig)
+            done.append(process['pid'])
+        except OSError as e:
+            errors.append(f"{process['pid']} ({process['name']}): {e.strerror or e}")
+    return done, errors
@@ -0,0 +1,287 @@
+"""Result cache for read-only commands, invalidated by filesystem changes."""
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .command import CACHE_TTL, CACHE_WATCH, MODE_ARGV, Command
+
+# Defaults for the cache bounds
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 8 << 20
+
+# Lifetime of CACHE_TTL results, e.g. ``docker ps``
+DEFAULT_TTL = 2.0
+
+# inotify(7) constants
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT = struct.Struct('iIII')
+
+# (returncode, stdout, stderr)
+CachedResult = Tuple[int, str, str]
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify, used in non-blocking mode."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int]]:
+        """Return the pending (wd, mask) events without blocking."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, name_len = _EVENT.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += _EVENT.size + name_len
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def _dir_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_ctime_ns)
+
+class _Entry:
+    __slots__ = ('result', 'size', 'expires', 'watches', 'stamps')
+
+    def __init__(self, result: CachedResult, size: int, expires: Optional[float],
+                 watches: Tuple[int, ...], stamps: Tuple[Tuple[str, Optional[Tuple[int, int, int]]], ...]):
+        self.result = result
+        self.size = size
+        self.expires = expires
+        self.watches = watches
+        self.stamps = stamps
+
+class ResultCache:
+    """
+    Bounded LRU cache of read-only command results.
+
+    Only commands built with a cache policy are stored. Results are keyed
+    on the normalised command and the working directory. CACHE_WATCH
+    results are dropped when inotify reports a change in one of their
+    directories; where inotify is unavailable (other platforms, or the
+    watch limit is reached) the directory's inode, mtime and ctime are
+    compared on every lookup instead, which misses in-place changes to
+    files. CACHE_TTL results expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL,
+                 use_inotify: bool = True):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Largest number of stored results
+            max_bytes: Largest total size of stored output, in bytes
+            ttl: Lifetime of CACHE_TTL results, in seconds
+            use_inotify: Use inotify where available (else mtime checks only)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inotify: Optional[_Inotify] = None
+        self._watch_ids: Dict[str, int] = {}
+        self._watch_keys: Dict[int, Set[Tuple[str, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                self._inotify = None
+
+    @staticmethod
+    def key(command: Command, cwd: Optional[str] = None) -> Tuple[str, str]:
+        """The cache key: the normalised command and the working directory."""
+        if command.mode == MODE_ARGV:
+            normalized = '\0'.join(command.argv)
+        else:
+            normalized = ' '.join(command.display.split())
+        return normalized, os.path.realpath(cwd or os.getcwd())
+
+    def get(self, command: Command, cwd: Optional[str] = None) -> Optional[CachedResult]:
+        """
+        Look up a command's cached result.
+
+        Args:
+            command: The command about to run
+            cwd: Its working directory
+
+        Returns:
+            Optional[CachedResult]: The stored result, or None on a miss
+        """
+        if not command.is_cacheable:
+            return None
+        key = self.key(command, cwd)
+        with self._lock:
+            self._process_events()
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_fresh(entry):
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def put(self, command: Command, result: CachedResult, cwd: Optional[str] = None) -> bool:
+        """
+        Store a command's result if its policy allows it.
+
+        Args:
+            command: The command that ran
+            result: (returncode, stdout, stderr)
+            cwd: Its working directory
+
+        Returns:
+            bool: True if the result was stored
+        """
+        if not command.is_cacheable or result[0] != 0:
+            return False
+        size = len(result[1]) + len(result[2])
+        if size > self.max_bytes:
+            return False
+
+        key = self.key(command, cwd)
+        base = key[1]
+        paths = tuple(os.path.join(base, os.path.expanduser(p)) for p in command.watch_paths)
+        with self._lock:
+            self._discard(key)
+            expires = time.monotonic() + self.ttl if command.cache_policy == CACHE_TTL else None
+            watches: List[int] = []
+            stamps = []
+            if command.cache_policy == CACHE_WATCH:
+                for path in paths:
+                    wd = self._watch(path, key)
+                    if wd is None:
+                        stamps.append((path, _dir_stamp(path)))
+                    else:
+                        watches.append(wd)
+            self._entries[key] = _Entry(result, size, expires, tuple(watches), tuple(stamps))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+        return True
+
+    def clear(self) -> None:
+        """Drop every stored result."""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def close(self) -> None:
+        """Drop every stored result and release the inotify descriptor."""
+        self.clear()
+        with self._lock:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count, stored bytes, hits, misses and active watches."""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits,
+                    'misses': self.misses, 'watches': len(self._watch_keys)}
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        if entry.expires is not None and time.monotonic() >= entry.expires:
+            return False
+        return all(_dir_stamp(path) == stamp for path, stamp in entry.stamps)
+
+    def _watch(self, path: str, key: Tuple[str, str]) -> Optional[int]:
+        if self._inotify is None:
+            return None
+        real = os.path.realpath(path)
+        wd = self._watch_ids.get(real)
+        if wd is None:
+            try:
+                wd = self._inotify.add_watch(real)
+            except OSError:
+                return None  # Not a directory, gone, or out of watches
+            self._watch_ids[real] = wd
+        self._watch_keys.setdefault(wd, set()).add(key)
+        return wd
+
+    def _process_events(self) -> None:
+        if self._inotify is None:
+            return
+        for wd, mask in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                for key in list(self._entries):
+                    self._discard(key)
+                continue
+            for key in list(self._watch_keys.get(wd, ())):
+                self._discard(key)
+            if mask & IN_IGNORED:
+                self._forget_watch(wd, remove=False)
+
+    def _forget_watch(self, wd: int, remove: bool = True) -> None:
+        self._watch_keys.pop(wd, None)
+        for path, watched in list(self._watch_ids.items()):
+            if watched == wd:
+                del self._watch_ids[path]
+        if remove and self._inotify is not None:
+            self._inotify.rm_watch(wd)
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for wd in entry.watches:
+            keys = self._watch_keys.get(wd)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._forget_watch(wd)
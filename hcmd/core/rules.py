@@ -0,0 +1,299 @@
+"""
+Rule snapshot for the hcmd tool.
+
+Templates, directory aliases, intent phrases and the dangerous-command
+patterns come from the built-in tables in ``hcmd.constants`` merged with
+the user's rules file (``~/.hcmd/rules.json``, or ``$HCMD_RULES``)::
+
+    {
+        "templates": {"list_files": {"linux": "ls -lah {path}"}},
+        "aliases": {"proj": "~/code/project"},
+        "phrases": {"list_files": ["show me the files in"]},
+        "dangerous_patterns": ["git\\\\s+push\\\\s+--force"]
+    }
+
+The merged result, with every pattern already compiled to regex engine
+code, is written to a versioned marshal snapshot. Later starts load it
+with a single read and rebuild it automatically when either source
+changes. To rebuild it by hand, or to time initialisation::
+
+    python -m hcmd.core.rules
+    python -m hcmd.core.rules --bench 10000
+"""
+import gc
+import hashlib
+import json
+import marshal
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Pattern, Tuple
+
+from .. import constants
+from ..constants import COMMAND_TEMPLATES, DANGEROUS_PATTERNS, DIRECTORY_ALIASES, INTENT_PHRASES
+from .detector import get_data_dir
+
+try:
+    import _sre
+    try:
+        from re import _compiler as sre_compile, _parser as sre_parse
+    except ImportError:  # Python < 3.11
+        import sre_compile
+        import sre_parse
+except ImportError:
+    _sre = None
+
+SNAPSHOT_VERSION = 1
+
+# Flags every dangerous pattern is compiled with
+PATTERN_FLAGS = re.IGNORECASE
+
+# Regex engine code is only valid for the interpreter that produced it
+ENGINE_KEY = f"{sys.implementation.name}-{sys.version_info[0]}.{sys.version_info[1]}-" \
+             f"{getattr(_sre, 'MAGIC', 0)}"
+
+class RuleSet(NamedTuple):
+    """Every rule the generator and validator need, ready to use and read-only."""
+    templates: Mapping[str, Mapping[str, str]]
+    aliases: Mapping[str, str]
+    phrases: Mapping[str, Tuple[str, ...]]
+    dangerous: Tuple[Tuple[str, Pattern], ...]
+
+def config_path() -> str:
+    """Path of the user's rules file (which need not exist)."""
+    return os.environ.get('HCMD_RULES') or os.path.join(get_data_dir(), 'rules.json')
+
+def _source_stamps(path: str) -> List[Tuple[str, int, int]]:
+    stamps = []
+    for source in (constants.__file__, path):
+        try:
+            st = os.stat(source)
+            stamps.append((source, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((source, 0, -1))
+    return stamps
+
+def _read_config(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            config = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"hcmd: ignoring unreadable rules file {path}: {e}", file=sys.stderr)
+        return {}
+    if not isinstance(config, dict):
+        print(f"hcmd: ignoring rules file {path}: expected a JSON object", file=sys.stderr)
+        return {}
+    return config
+
+def _precompile(pattern: str) -> Optional[Tuple]:
+    """
+    Compile a pattern down to the arguments of ``_sre.compile``.
+
+    This mirrors ``re.compile`` minus its cache, so the expensive parse and
+    code generation happen once, at build time.
+    """
+    if _sre is None:
+        return None
+    parsed = sre_parse.parse(pattern, PATTERN_FLAGS)
+    code = sre_compile._code(parsed, PATTERN_FLAGS)
+    groupindex = dict(parsed.state.groupdict)
+    indexgroup = [None] * parsed.state.groups
+    for name, index in groupindex.items():
+        indexgroup[index] = name
+    return (pattern, int(PATTERN_FLAGS | parsed.state.flags), [int(op) for op in code],
+            parsed.state.groups - 1, groupindex, tuple(indexgroup))
+
+def compile_rules(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Merge the built-in tables with a rules file and precompile the patterns.
+
+    Args:
+        path: Rules file (defaults to config_path())
+
+    Returns:
+        Dict[str, Any]: The marshal-able snapshot payload
+    """
+    path = path or config_path()
+    config = _read_config(path)
+
+    templates = {key: dict(platforms) for key, platforms in COMMAND_TEMPLATES.items()}
+    for key, platforms in (config.get('templates') or {}).items():
+        if isinstance(platforms, str):
+            platforms = {platform_key: platforms for platform_key in ('windows', 'darwin', 'linux')}
+        templates.setdefault(key, {}).update({k: str(v) for k, v in platforms.items()})
+
+    aliases = dict(DIRECTORY_ALIASES)
+    aliases.update({str(k).lower(): str(v) for k, v in (config.get('aliases') or {}).items()})
+
+    phrases = {intent: list(phrase_list) for intent, phrase_list in INTENT_PHRASES.items()}
+    for intent, phrase_list in (config.get('phrases') or {}).items():
+        known = phrases.setdefault(intent, [])
+        known.extend(p.lower() for p in phrase_list if p.lower() not in known)
+
+    dangerous = []
+    for pattern in list(DANGEROUS_PATTERNS) + list(config.get('dangerous_patterns') or []):
+        try:
+            dangerous.append((pattern, _precompile(pattern)))
+        except (re.error, TypeError) as e:
+            print(f"hcmd: ignoring invalid dangerous pattern {pattern!r}: {e}", file=sys.stderr)
+
+    return {'templates': templates, 'aliases': aliases, 'phrases': phrases,
+            'dangerous': dangerous}
+
+def _materialize(payload: Dict[str, Any]) -> RuleSet:
+    dangerous = []
+    for pattern, parts in payload['dangerous']:
+        regex = None
+        if parts is not None and _sre is not None:
+            try:
+                regex = _sre.compile(*parts)
+            except (TypeError, ValueError, RuntimeError):
+                regex = None
+        dangerous.append((pattern, regex or re.compile(pattern, PATTERN_FLAGS)))
+    return RuleSet(
+        MappingProxyType({key: MappingProxyType(platforms)
+                          for key, platforms in payload['templates'].items()}),
+        MappingProxyType(payload['aliases']),
+        MappingProxyType({intent: tuple(phrase_list)
+                          for intent, phrase_list in payload['phrases'].items()}),
+        tuple(dangerous))
+
+def snapshot_path(path: Optional[str] = None) -> str:
+    """Where the snapshot for a rules file is kept."""
+    key = hashlib.sha1(os.path.abspath(path or config_path()).encode('utf-8', 'surrogateescape'))
+    return os.path.join(get_data_dir('cache'), f'rules-{key.hexdigest()}.snap')
+
+def build_snapshot(path: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Compile the rules and write their snapshot atomically.
+
+    Args:
+        path: Rules file (defaults to config_path())
+
+    Returns:
+        Tuple[str, Dict]: The snapshot path and the payload written to it
+    """
+    path = path or config_path()
+    payload = compile_rules(path)
+    target = snapshot_path(path)
+    data = marshal.dumps((SNAPSHOT_VERSION, ENGINE_KEY, _source_stamps(path), payload))
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, target)
+    except OSError:
+        pass  # Read-only home: keep working from the compiled rules
+    return target, payload
+
+def _load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(snapshot_path(path), 'rb') as fh:
+            version, engine, stamps, payload = marshal.loads(fh.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if version != SNAPSHOT_VERSION or engine != ENGINE_KEY:
+        return None
+    if [tuple(stamp) for stamp in stamps] != _source_stamps(path):
+        return None
+    return payload
+
+_rules: Dict[Optional[str], RuleSet] = {}
+_rules_lock = threading.Lock()
+
+def load_rules(path: Optional[str] = None, refresh: bool = False) -> RuleSet:
+    """
+    Get the rules, from the snapshot when it is current.
+
+    Args:
+        path: Rules file (defaults to config_path())
+        refresh: Re-check the sources even if the rules are already loaded
+
+    Returns:
+        RuleSet: The merged, compiled rules, shared and read-only
+    """
+    # The default rules are also kept under None: the validator asks for
+    # them on every check, and resolving config_path() touches the disk
+    rules = _rules.get(path)
+    if rules is not None and not refresh:
+        return rules
+    key = path
+    path = path or config_path()
+    with _rules_lock:
+        rules = _rules.get(path)
+        if rules is None or refresh:
+            payload = _load_snapshot(path)
+            if payload is None:
+                _, payload = build_snapshot(path)
+            rules = _rules[path] = _materialize(payload)
+        if key is None:
+            _rules[None] = rules
+    return rules
+
+_BENCH_SCRIPT = '''
+import time
+started = time.perf_counter()
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.validator import is_command_safe
+CommandGenerator()
+is_command_safe("ls -la")
+print(time.perf_counter() - started)
+'''
+
+def _bench(count: int, runs: int = 5) -> None:
+    """Time process initialisation with ``count`` custom rules, with and without a snapshot."""
+    with tempfile.TemporaryDirectory() as home:
+        per_kind = count // 4
+        config = {
+            'templates': {f'custom_{i}': f'echo custom {i} {{path}}' for i in range(per_kind)},
+            'aliases': {f'place{i}': f'~/places/{i}' for i in range(per_kind)},
+            'phrases': {'list_files': [f'show listing number {i}' for i in range(per_kind)]},
+            'dangerous_patterns': [rf'\bforbidden{i}\s+--(force|all)\b' for i in range(count - 3 * per_kind)],
+        }
+        rules_file = os.path.join(home, 'rules.json')
+        with open(rules_file, 'w', encoding='utf-8') as fh:
+            json.dump(config, fh)
+        env = dict(os.environ, HCMD_HOME=home, HCMD_RULES=rules_file, HCMD_METRICS='0')
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+
+        def timed(remove_snapshot: bool) -> List[float]:
+            samples = []
+            for _ in range(runs):
+                if remove_snapshot:
+                    try:
+                        os.remove(os.path.join(home, 'cache', os.path.basename(snapshot_path(rules_file))))
+                    except OSError:
+                        pass
+                out = subprocess.run([sys.executable, '-c', _BENCH_SCRIPT], env=env,
+                                     capture_output=True, text=True, check=True).stdout
+                samples.append(float(out.split()[-1]))
+            return sorted(samples)
+
+        cold = timed(remove_snapshot=True)
+        warm = timed(remove_snapshot=False)
+        print(f"{count} custom rules, median of {runs} fresh processes (imports included):")
+        print(f"  compiled from sources: {cold[len(cold) // 2] * 1000:8.1f} ms")
+        print(f"  loaded from snapshot:  {warm[len(warm) // 2] * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        started = time.perf_counter()
+        target, payload = build_snapshot()
+        print(f"Wrote {target}: {len(payload['templates'])} templates, {len(payload['aliases'])} aliases, "
+              f"{sum(len(p) for p in payload['phrases'].values())} phrases, "
+              f"{len(payload['dangerous'])} patterns in {(time.perf_counter() - started) * 1000:.1f} ms")
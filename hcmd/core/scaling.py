@@ -0,0 +1,137 @@
+"""
+Thread-scaling benchmark for the translation pipeline.
+
+One CommandGenerator is shared by every thread, the way a service would
+share it; each thread translates the same mix of inputs (interpret,
+build, validate) and every result is checked against a single-threaded
+reference run, so the benchmark doubles as a stress test. On a GIL build
+throughput stays flat as threads are added; on a free-threaded build
+(``python3.13t``) it should grow with the core count::
+
+    python -m hcmd.core.scaling [seconds-per-step] [max-threads]
+"""
+import os
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .generator import CommandGenerator
+from .validator import validate_command
+
+# Inputs covering the rule, typo-correction and classifier paths
+SAMPLE_INPUTS = (
+    'list files',
+    'show files in downloads',
+    'where am i',
+    'go to documents',
+    'copy notes.txt to backup/notes.txt',
+    'move report.pdf to archive',
+    'delete old.log',
+    'find files larger than 10mb in downloads',
+    'search for TODO in src',
+    'disk usage of downloads',
+    'shwo me the fiels',
+    'which folder am i in right now',
+    'docker list containers',
+    'make a directory called build',
+)
+
+Translation = Tuple[str, Tuple[str, ...], str, bool]
+
+def translate(generator: CommandGenerator, text: str) -> Translation:
+    """
+    Run one input through the whole pipeline.
+
+    Args:
+        generator: The shared generator
+        text: Natural language input
+
+    Returns:
+        Translation: (command type name, args, command, safe)
+    """
+    command_type, args = generator.interpret_natural_language(text)
+    command = generator.build_command(command_type, args)
+    if command is None:
+        return command_type.name, tuple(args), '', False
+    command = validate_command(command)
+    return command_type.name, tuple(args), command.display, command.is_safe
+
+def gil_enabled() -> bool:
+    """True unless this is a free-threaded build running without the GIL."""
+    check = getattr(sys, '_is_gil_enabled', None)
+    return check() if check is not None else True
+
+def measure(generator: CommandGenerator, threads: int, seconds: float,
+            expected: List[Translation]) -> Tuple[int, int]:
+    """
+    Translate from ``threads`` threads for ``seconds``.
+
+    Args:
+        generator: The shared generator
+        threads: Number of threads
+        seconds: How long to run
+        expected: Single-threaded results for SAMPLE_INPUTS
+
+    Returns:
+        Tuple[int, int]: (translations completed, mismatched results)
+    """
+    start = threading.Barrier(threads + 1)
+    stop = threading.Event()
+    counts = [0] * threads
+    errors = [0] * threads
+
+    def work(slot: int) -> None:
+        done = wrong = 0
+        start.wait()
+        while not stop.is_set():
+            for text, reference in zip(SAMPLE_INPUTS, expected):
+                if translate(generator, text) != reference:
+                    wrong += 1
+            done += len(SAMPLE_INPUTS)
+        counts[slot] = done
+        errors[slot] = wrong
+
+    workers = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts), sum(errors)
+
+def run(seconds: float = 2.0, max_threads: int = 16,
+        generator: Optional[CommandGenerator] = None) -> List[Tuple[int, float, int]]:
+    """
+    Measure throughput at 1, 2, 4, ... up to ``max_threads`` threads.
+
+    Args:
+        seconds: Duration of each step
+        max_threads: Largest thread count
+        generator: Generator to share (a new one by default)
+
+    Returns:
+        List of (threads, translations per second, mismatched results)
+    """
+    generator = generator or CommandGenerator()
+    expected = [translate(generator, text) for text in SAMPLE_INPUTS]
+    results = []
+    threads = 1
+    while threads <= max_threads:
+        done, wrong = measure(generator, threads, seconds, expected)
+        results.append((threads, done / seconds, wrong))
+        threads *= 2
+    return results
+
+if __name__ == '__main__':
+    step = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil_enabled() else 'disabled'}, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'threads':>8}{'per second':>14}{'speedup':>10}{'mismatches':>12}")
+    baseline = None
+    for threads, rate, wrong in run(step, limit):
+        baseline = baseline or rate
+        print(f"{threads:>8}{rate:>14.0f}{rate / baseline:>10.2f}{wrong:>12}")
@@ -0,0 +1,297 @@
+"""
+Execution scheduler for running hcmd as a shared service.
+
+Commands are queued by priority class and run by a fixed pool of workers
+in front of a CommandExecutor. Each CommandType can be capped to a number
+of concurrent runs, batch work can never occupy the workers kept for
+interactive requests, and child processes get rlimits and a wall-clock
+deadline.
+
+To check that interactive latency holds under a saturating batch load::
+
+    python -m hcmd.core.scheduler [seconds]
+"""
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from ..constants import CommandType
+from .command import Command, MODE_ARGV
+from .executor import CommandExecutor
+from .launcher import Limits
+from .validator import validate_command
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BATCH: 'batch'}
+
+DEFAULT_WORKERS = 4
+
+# Concurrent runs allowed per CommandType; types not listed are only
+# bounded by the worker count. Bulk transfers and log dumps saturate the
+# disk or the Docker daemon long before they saturate the CPU.
+DEFAULT_CAPS = {
+    CommandType.COPY: 1,
+    CommandType.MOVE: 1,
+    CommandType.DELETE: 1,
+    CommandType.DISK_USAGE: 1,
+    CommandType.ARCHIVE: 1,
+    CommandType.EXTRACT: 1,
+    CommandType.DEDUPE: 1,
+    CommandType.SYNC: 1,
+    CommandType.KILL: 1,
+    CommandType.LOG: 2,
+    CommandType.DOCKER: 2,
+}
+
+# Limits applied to child processes unless the caller passes its own
+DEFAULT_LIMITS = {
+    PRIORITY_INTERACTIVE: Limits(cpu_seconds=30, deadline=60.0),
+    PRIORITY_BATCH: Limits(cpu_seconds=600, memory_bytes=2 << 30,
+                           file_size_bytes=16 << 30, deadline=3600.0),
+}
+
+# Wait times remembered per priority class for the statistics
+WAIT_SAMPLES = 1024
+
+RunResult = Tuple[bool, str, Dict]
+
+class _Job:
+    __slots__ = ('command', 'priority', 'cwd', 'limits', 'progress', 'future', 'queued_at')
+
+    def __init__(self, command: Command, priority: int, cwd: Optional[str],
+                 limits: Optional[Limits], progress: Optional[Callable[[Dict], None]]):
+        self.command = command
+        self.priority = priority
+        self.cwd = cwd
+        self.limits = limits
+        self.progress = progress
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+class Scheduler:
+    """
+    Priority queues, per-type concurrency caps and child resource limits.
+
+    A job is started when a worker is free, its CommandType is under its
+    cap, and, for batch jobs, fewer than ``workers - reserved`` batch jobs
+    are already running. Within a priority class jobs start in FIFO order,
+    skipping over jobs whose type is at its cap.
+    """
+
+    def __init__(self, executor: Optional[CommandExecutor] = None,
+                 workers: int = DEFAULT_WORKERS, reserved: int = 1,
+                 caps: Optional[Dict[CommandType, int]] = None,
+                 limits: Optional[Dict[int, Limits]] = None):
+        """
+        Start the scheduler.
+
+        Args:
+            executor: Executor the jobs run on (a new one by default)
+            workers: Number of worker threads
+            reserved: Workers that only interactive jobs may use
+            caps: Concurrent runs allowed per CommandType (DEFAULT_CAPS by default)
+            limits: Default Limits per priority class (DEFAULT_LIMITS by default)
+        """
+        if workers < 1 or not 0 <= reserved < workers:
+            raise ValueError("Need at least one worker and fewer reserved workers than workers")
+        self.executor = executor or CommandExecutor()
+        self.workers = workers
+        self.reserved = reserved
+        self.caps = dict(DEFAULT_CAPS if caps is None else caps)
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+
+        self._queues: Dict[int, Deque[_Job]] = {p: deque() for p in PRIORITY_NAMES}
+        self._running: Dict[CommandType, int] = {}
+        self._running_by_priority: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._waits: Dict[int, Deque[float]] = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_NAMES}
+        self._completed: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, name=f'hcmd-sched-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, command: Command, priority: int = PRIORITY_INTERACTIVE,
+               cwd: Optional[str] = None, limits: Optional[Limits] = None,
+               progress: Optional[Callable[[Dict], None]] = None) -> Future:
+        """
+        Queue a command.
+
+        Args:
+            command: The command to run; validated here if it has no verdict yet
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            cwd: Working directory for the command
+            limits: Limits for the child process (the priority's default if None)
+            progress: Optional callback receiving engine events
+
+        Returns:
+            Future: Resolves to the executor's (success, output, details);
+            details gains 'queued' (seconds spent waiting) and 'priority'
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        if command.verdict is None:
+            command = validate_command(command)
+        job = _Job(command, priority, cwd, limits or self.limits.get(priority), progress)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._queues[priority].append(job)
+            self._cond.notify()
+        return job.future
+
+    def run(self, command: Command, priority: int = PRIORITY_INTERACTIVE,
+            cwd: Optional[str] = None, limits: Optional[Limits] = None,
+            progress: Optional[Callable[[Dict], None]] = None) -> RunResult:
+        """Queue a command and wait for its result; see submit()."""
+        return self.submit(command, priority, cwd, limits, progress).result()
+
+    def stats(self) -> Dict:
+        """
+        Queue depths, running counts and wait-time statistics.
+
+        Returns:
+            Dict: Per priority class: 'queued', 'running', 'completed' and
+            'wait' (count, mean, p50, p99 and max over the recent jobs, in
+            seconds); plus 'running_by_type'
+        """
+        with self._cond:
+            result = {}
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                result[name] = {
+                    'queued': len(self._queues[priority]),
+                    'running': self._running_by_priority[priority],
+                    'completed': self._completed[priority],
+                    'wait': {
+                        'count': len(waits),
+                        'mean': sum(waits) / len(waits) if waits else 0.0,
+                        'p50': _percentile(waits, 0.5),
+                        'p99': _percentile(waits, 0.99),
+                        'max': waits[-1] if waits else 0.0,
+                    },
+                }
+            result['running_by_type'] = {t.name: n for t, n in self._running.items() if n}
+            return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting jobs; queued jobs still run.
+
+        Args:
+            wait: Block until the workers have finished
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _eligible(self, job: _Job) -> bool:
+        cap = self.caps.get(job.command.command_type)
+        if cap is not None and self._running.get(job.command.command_type, 0) >= cap:
+            return False
+        if job.priority != PRIORITY_INTERACTIVE:
+            return self._running_by_priority[PRIORITY_BATCH] < self.workers - self.reserved
+        return True
+
+    def _next_job(self) -> Optional[_Job]:
+        """Pop the first runnable job, most urgent class first. Caller holds the lock."""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            for index, job in enumerate(queue):
+                if self._eligible(job):
+                    del queue[index]
+                    return job
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed and not any(self._queues.values()):
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                command_type = job.command.command_type
+                self._running[command_type] = self._running.get(command_type, 0) + 1
+                self._running_by_priority[job.priority] += 1
+                waited = time.monotonic() - job.queued_at
+                self._waits[job.priority].append(waited)
+
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    success, output, details = self.executor.run(
+                        job.command, cwd=job.cwd, progress=job.progress, limits=job.limits)
+                    details = dict(details, queued=round(waited, 6),
+                                   priority=PRIORITY_NAMES[job.priority])
+                    job.future.set_result((success, output, details))
+                except BaseException as e:
+                    job.future.set_exception(e)
+
+            with self._cond:
+                self._running[command_type] -= 1
+                self._running_by_priority[job.priority] -= 1
+                self._completed[job.priority] += 1
+                # A finished job may unblock a capped or batch job
+                self._cond.notify_all()
+
+def _load_test(seconds: float = 10.0, workers: int = DEFAULT_WORKERS) -> None:
+    """Measure interactive latency alone, then under a saturating batch load."""
+    interactive = validate_command(Command(CommandType.LIST_FILES, MODE_ARGV, 'true', 'linux',
+                                           argv=('true',)))
+    batch = validate_command(Command(CommandType.DOCKER, MODE_ARGV, 'sleep 0.2', 'linux',
+                                     argv=('sleep', '0.2')))
+
+    def measure(scheduler: Scheduler, duration: float) -> List[float]:
+        latencies = []
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            started = time.perf_counter()
+            scheduler.run(interactive)
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.005)
+        return sorted(latencies)
+
+    def report(label: str, latencies: List[float]) -> None:
+        print(f"{label:<28}{len(latencies):>8}{_percentile(latencies, 0.5) * 1000:>10.2f}"
+              f"{_percentile(latencies, 0.99) * 1000:>10.2f}")
+
+    scheduler = Scheduler(CommandExecutor(), workers=workers, caps={})
+    print(f"{'interactive latency':<28}{'runs':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    report('idle', measure(scheduler, seconds / 2))
+
+    stop = threading.Event()
+
+    def flood() -> None:
+        # Keep far more batch work queued than the workers can drain
+        while not stop.is_set():
+            if scheduler.stats()['batch']['queued'] < workers * 8:
+                scheduler.submit(batch, PRIORITY_BATCH)
+            else:
+                time.sleep(0.01)
+
+    feeder = threading.Thread(target=flood, daemon=True)
+    feeder.start()
+    time.sleep(0.5)
+    report(f'batch-saturated ({workers} workers)', measure(scheduler, seconds / 2))
+    stop.set()
+    feeder.join()
+    stats = scheduler.stats()
+    print(f"batch: {stats['batch']['completed']} completed, {stats['batch']['queued']} still queued, "
+          f"wait p99 {stats['batch']['wait']['p99'] * 1000:.0f} ms")
+    scheduler.shutdown(wait=False)
+
+if __name__ == '__main__':
+    _load_test(float(sys.argv[1]) if len(sys.argv) > 1 else 10.0)
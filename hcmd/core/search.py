@@ -0,0 +1,188 @@
+"""
+Parallel filesystem search engine for the hcmd tool.
+
+To compare with ``find`` on a directory, or on a synthetic tree of N files::
+
+    python -m hcmd.core.search --bench DIR
+    python -m hcmd.core.search --bench 200000
+"""
+import fnmatch
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .walker import DEFAULT_WORKERS, scan_tree
+
+# Directories that are never descended into unless searched explicitly
+DEFAULT_EXCLUDES = frozenset({'.git', '.hg', '.svn', '__pycache__'})
+
+SIZE_UNITS = {
+    '': 1, 'b': 1, 'byte': 1, 'bytes': 1,
+    'k': 1024, 'kb': 1024, 'kib': 1024,
+    'm': 1024 ** 2, 'mb': 1024 ** 2, 'mib': 1024 ** 2,
+    'g': 1024 ** 3, 'gb': 1024 ** 3, 'gib': 1024 ** 3,
+    't': 1024 ** 4, 'tb': 1024 ** 4, 'tib': 1024 ** 4,
+}
+
+class FindQuery:
+    """
+    A compiled set of search predicates.
+
+    Predicates are encoded as ``key=value`` strings (the form produced by
+    CommandGenerator for FIND) and compiled once, cheapest first: the name
+    checks run on the directory entry alone, and ``stat`` is only called for
+    entries that passed them and only when a size or age predicate exists.
+    """
+
+    def __init__(self, root: str = '.', predicates: Optional[List[str]] = None):
+        """
+        Compile a query.
+
+        Args:
+            root: Directory to search
+            predicates: ``key=value`` strings. Supported keys: name (glob),
+                ext, type (f or d), min_size, max_size (bytes), max_age,
+                min_age (seconds since modification), max_depth, exclude
+        """
+        self.root = os.path.abspath(os.path.expanduser(root or '.'))
+        self.name_re = None
+        self.extensions: tuple = ()
+        self.type: Optional[str] = None
+        self.min_size: Optional[int] = None
+        self.max_size: Optional[int] = None
+        self.max_age: Optional[float] = None
+        self.min_age: Optional[float] = None
+        self.max_depth: Optional[int] = None
+        self.excludes = set(DEFAULT_EXCLUDES)
+
+        for predicate in predicates or []:
+            key, _, value = predicate.partition('=')
+            if key == 'name':
+                self.name_re = re.compile(fnmatch.translate(value), re.IGNORECASE)
+            elif key == 'ext':
+                self.extensions += tuple('.' + e.lstrip('.').lower() for e in value.split(','))
+            elif key == 'type':
+                self.type = value
+            elif key in ('min_size', 'max_size', 'max_depth'):
+                setattr(self, key, int(value))
+            elif key in ('max_age', 'min_age'):
+                setattr(self, key, float(value))
+            elif key == 'exclude':
+                self.excludes.update(value.split(','))
+            else:
+                raise ValueError(f"Unknown search predicate: {predicate}")
+
+        self.needs_stat = any(v is not None for v in
+                              (self.min_size, self.max_size, self.max_age, self.min_age))
+        self._root_depth = self.root.rstrip(os.sep).count(os.sep)
+
+    def prune(self, entry: os.DirEntry) -> bool:
+        """Return True for sub-directories that must not be descended into."""
+        if entry.name in self.excludes:
+            return True
+        if self.max_depth is not None:
+            return entry.path.count(os.sep) - self._root_depth >= self.max_depth
+        return False
+
+    def matches(self, entry: os.DirEntry, now: Optional[float] = None) -> bool:
+        """Evaluate the predicates against a directory entry."""
+        try:
+            if self.type is not None:
+                if entry.is_dir(follow_symlinks=False) != (self.type == 'd'):
+                    return False
+            elif entry.is_dir(follow_symlinks=False):
+                # Directories only match queries that ask for them
+                return False
+            if self.extensions and not entry.name.lower().endswith(self.extensions):
+                return False
+            if self.name_re is not None and not self.name_re.match(entry.name):
+                return False
+            if self.needs_stat:
+                st = entry.stat(follow_symlinks=False)
+                if self.min_size is not None and st.st_size < self.min_size:
+                    return False
+                if self.max_size is not None and st.st_size > self.max_size:
+                    return False
+                age = (now or time.time()) - st.st_mtime
+                if self.max_age is not None and age > self.max_age:
+                    return False
+                if self.min_age is not None and age < self.min_age:
+                    return False
+        except OSError:
+            return False
+        return True
+
+def find(query: FindQuery, workers: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Search a tree in parallel, yielding matches as they are found.
+
+    Args:
+        query: The compiled query
+        workers: Number of scanner threads
+
+    Yields:
+        Dict: ``{'path', 'type', 'size', 'mtime'}`` for every match
+    """
+    now = time.time()
+    for scanned in scan_tree(query.root, workers=workers, prune=query.prune,
+                             select=lambda entry: query.matches(entry, now)):
+        for entry in scanned.dirs + scanned.files:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            match = {'path': entry.path, 'type': 'd' if is_dir else 'f'}
+            try:
+                st = entry.stat(follow_symlinks=False)
+                match['size'] = st.st_size
+                match['mtime'] = st.st_mtime
+            except OSError:
+                match['size'] = None
+                match['mtime'] = None
+            yield match
+
+def parse_size(amount: str, unit: str = '') -> int:
+    """Convert an amount and unit such as ('100', 'mb') into bytes."""
+    return int(float(amount) * SIZE_UNITS.get(unit.lower(), 1))
+
+def _make_tree(root: str, count: int) -> None:
+    """Write ``count`` empty files, one in ten a ``.log``, 100 per directory."""
+    for i in range(count):
+        directory = os.path.join(root, f'd{i // 10000:03d}', f'd{i // 100 % 100:02d}')
+        if i % 100 == 0:
+            os.makedirs(directory)
+        open(os.path.join(directory, f'f{i}.{"log" if i % 10 == 0 else "txt"}'), 'wb').close()
+
+def _bench(source: str) -> None:
+    """Compare find() with the find command: every entry, then a name predicate."""
+    with tempfile.TemporaryDirectory() as work:
+        if not os.path.isdir(source):
+            _make_tree(work, int(source))
+            source = work
+        print(f"Tree: {source}, {DEFAULT_WORKERS} worker(s)")
+
+        def report(label: str, run: Callable[[], int]) -> None:
+            started = time.perf_counter()
+            matches = run()
+            print(f"  {label:<28} {time.perf_counter() - started:7.2f} s  {matches:>9} matches")
+
+        def command(argv: List[str]) -> Callable[[], int]:
+            return lambda: subprocess.run(argv, check=True, capture_output=True).stdout.count(b'\n')
+
+        def ours(predicates: List[str]) -> Callable[[], int]:
+            query = FindQuery(source, predicates)
+            # find descends into .git and the like too
+            query.excludes = set()
+            return lambda: sum(1 for _ in find(query))
+
+        report('hcmd find (all files)', ours([]))
+        report('find -type f', command(['find', source, '-type', 'f']))
+        report('hcmd find ext=log', ours(['ext=log']))
+        report("find -name '*.log'", command(['find', source, '-name', '*.log']))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        _bench(sys.argv[2] if len(sys.argv) > 2 else '200000')
+    else:
+        print(__doc__.strip())
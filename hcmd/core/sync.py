@@ -0,0 +1,340 @@
+"""Incremental one-way directory sync driven by a persisted manifest."""
+import gc
+import hashlib
+import marshal
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .dedupe import full_hash
+from .detector import get_data_dir
+from .transfer import copy_file
+from .walker import DEFAULT_WORKERS, scan_tree
+
+MANIFEST_VERSION = 2
+
+# Minimum delay between two 'progress' events
+PROGRESS_INTERVAL = 0.1
+
+# Suffix of the temporary file a changed file is copied to before it
+# replaces the previous version
+TMP_SUFFIX = '.hcmd-sync'
+
+# Manifest record of a synced file: (size, mtime_ns, content hash or None)
+ManifestRecord = Tuple[int, int, Optional[bytes]]
+
+class SyncManifest:
+    """
+    What the last sync of a (source, destination) pair left in its target.
+
+    The target is the destination resolved with ``cp -r`` rules on the
+    first sync and reused by every later one, so creating the destination
+    on the first run does not make the second sync into a sub-directory.
+    Records are keyed by path relative to the source. The content hash is
+    filled in lazily, the first time a file's timestamp changes while its
+    size does not, so that a ``touch`` does not trigger a copy.
+    """
+
+    def __init__(self, src: str, dest: str, manifest_dir: Optional[str] = None):
+        self.src = src
+        self.dest = dest
+        self.target: Optional[str] = None
+        key = f"{src}\0{dest}".encode('utf-8', 'surrogateescape')
+        name = hashlib.sha1(key).hexdigest() + '.manifest'
+        self.path = os.path.join(manifest_dir or get_data_dir('sync'), name)
+        self.files: Dict[str, ManifestRecord] = {}
+        self.dirs: Set[str] = set()
+
+    def load(self) -> bool:
+        """Load the manifest. Returns True if a compatible one was found."""
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.path, 'rb') as fh:
+                version, src, dest, target, files, dirs = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if version != MANIFEST_VERSION or (src, dest) != (self.src, self.dest):
+            return False
+        self.target = target
+        self.files = files
+        self.dirs = dirs
+        return True
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as fh:
+            fh.write(marshal.dumps((MANIFEST_VERSION, self.src, self.dest, self.target,
+                                    self.files, self.dirs)))
+        os.replace(tmp, self.path)
+
+class TreeSync:
+    """
+    Makes a target directory mirror a source directory, copying only changes.
+
+    The source is walked with a parallel scandir and every file is compared
+    with the manifest of the previous sync by size and mtime alone, so an
+    unchanged tree costs one walk and no syscalls on the target. Files whose
+    mtime changed but whose size did not are compared by content hash
+    before being copied. Without a manifest (first sync, or a target
+    populated by other means) target files are stat'ed instead and adopted
+    when they already match.
+
+    Changed files are copied to a temporary name and renamed over the old
+    version, so the target never holds a partially written file.
+    """
+
+    def __init__(self, src: str, dest: str, delete: bool = False,
+                 workers: Optional[int] = None,
+                 progress: Optional[Callable[[Dict], None]] = None,
+                 manifest_dir: Optional[str] = None):
+        """
+        Initialize the sync.
+
+        Args:
+            src: Source directory
+            dest: Destination; with ``cp -r`` semantics the tree is synced to
+                ``dest/<name of src>`` when ``dest`` is an existing directory
+                on the first sync, and to the same place on later ones
+            delete: If True, remove files and directories from the target
+                that an earlier sync copied but are gone from the source
+            workers: Number of scanner and copy threads
+            progress: Optional callback receiving progress event dicts
+            manifest_dir: Directory holding the manifests (defaults to ~/.hcmd/sync)
+        """
+        self.src = os.path.abspath(os.path.expanduser(src))
+        self.dest = os.path.abspath(os.path.expanduser(dest))
+        self.delete = delete
+        self.workers = workers or DEFAULT_WORKERS
+        self.progress = progress
+        self.manifest_dir = manifest_dir
+        self._lock = threading.Lock()
+        self._last_emit = 0.0
+        self.stats = {
+            'source': self.src,
+            'target': None,
+            'files_total': 0,
+            'files_done': 0,
+            'files_unchanged': 0,
+            'files_deleted': 0,
+            'bytes_total': 0,
+            'bytes_done': 0,
+            'errors': [],
+            'elapsed': 0.0,
+        }
+
+    def _emit(self, event: str, force: bool = False) -> None:
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_emit < PROGRESS_INTERVAL:
+            return
+        self._last_emit = now
+        self.progress(dict(self.stats, event=event, errors=len(self.stats['errors'])))
+
+    def _resolve_target(self) -> str:
+        """Apply ``cp -r`` destination semantics."""
+        if os.path.isdir(self.dest):
+            return os.path.join(self.dest, os.path.basename(self.src.rstrip(os.sep)))
+        return self.dest
+
+    def _delta(self, target: str, manifest: SyncManifest, trusted: bool
+               ) -> Tuple[Set[str], Set[str], List[Tuple[str, os.stat_result]],
+                          List[Tuple[str, os.stat_result]]]:
+        """
+        Walk the source and compare it with the manifest.
+
+        Returns:
+            The source directories and files, the files to copy and the
+            files to compare by content (same size, new mtime)
+        """
+        dirs: Set[str] = set()
+        files: Set[str] = set()
+        changed: List[Tuple[str, os.stat_result]] = []
+        touched: List[Tuple[str, os.stat_result]] = []
+        known = manifest.files
+        prefix = len(self.src) + 1
+        for scanned in scan_tree(self.src, workers=self.workers, with_stat=True):
+            if scanned.error is not None:
+                self.stats['errors'].append(f"{scanned.path}: {scanned.error.strerror}")
+                continue
+            dirs.update(d.path[prefix:] for d in scanned.dirs)
+            for entry in scanned.files:
+                rel = entry.path[prefix:]
+                files.add(rel)
+                st = entry.stat(follow_symlinks=False)
+                record = known.get(rel) if trusted else self._adopt(rel, target, manifest)
+                if record is not None and record[0] == st.st_size:
+                    if record[1] == st.st_mtime_ns:
+                        self.stats['files_unchanged'] += 1
+                        continue
+                    touched.append((rel, st))
+                else:
+                    changed.append((rel, st))
+                self.stats['files_total'] += 1
+                self.stats['bytes_total'] += st.st_size
+            self._emit('scan')
+        return dirs, files, changed, touched
+
+    def _adopt(self, rel: str, target: str, manifest: SyncManifest) -> Optional[ManifestRecord]:
+        """Record a file already present in the target, when there is no manifest."""
+        try:
+            st = os.lstat(os.path.join(target, rel))
+        except OSError:
+            return None
+        record = manifest.files[rel] = (st.st_size, st.st_mtime_ns, None)
+        return record
+
+    def _copy_one(self, rel: str, st: os.stat_result, target: str,
+                  manifest: SyncManifest, digest: Optional[bytes] = None) -> None:
+        dst = os.path.join(target, rel)
+        tmp = dst + TMP_SUFFIX
+        try:
+            try:
+                copy_file(os.path.join(self.src, rel), tmp, st)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                copy_file(os.path.join(self.src, rel), tmp, st)
+            os.replace(tmp, dst)
+        except OSError as e:
+            with self._lock:
+                self.stats['errors'].append(f"{rel}: {e.strerror or e}")
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            return
+        with self._lock:
+            manifest.files[rel] = (st.st_size, st.st_mtime_ns, digest)
+            self.stats['files_done'] += 1
+            self.stats['bytes_done'] += st.st_size
+            self._emit('progress')
+
+    def _compare_one(self, rel: str, st: os.stat_result, target: str,
+                     manifest: SyncManifest) -> None:
+        """Copy a file whose mtime changed only if its contents changed too."""
+        dst = os.path.join(target, rel)
+        try:
+            if os.path.islink(dst) or os.path.islink(os.path.join(self.src, rel)):
+                raise OSError('symbolic link')
+            digest = full_hash(os.path.join(self.src, rel), st.st_size)
+            previous = manifest.files[rel][2] or full_hash(dst, st.st_size)
+        except OSError:
+            self._copy_one(rel, st, target, manifest)
+            return
+        if digest != previous:
+            self._copy_one(rel, st, target, manifest, digest)
+            return
+        try:
+            os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except OSError as e:
+            with self._lock:
+                self.stats['errors'].append(f"{rel}: {e.strerror or e}")
+            return
+        with self._lock:
+            manifest.files[rel] = (st.st_size, st.st_mtime_ns, digest)
+            self.stats['files_unchanged'] += 1
+            self.stats['files_total'] -= 1
+            self.stats['bytes_total'] -= st.st_size
+            self._emit('progress')
+
+    def _prune(self, target: str, manifest: SyncManifest, src_files: Set[str],
+               src_dirs: Set[str]) -> None:
+        """Remove what an earlier sync copied and the source no longer has."""
+        for rel in [rel for rel in manifest.files if rel not in src_files]:
+            try:
+                os.unlink(os.path.join(target, rel))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.stats['errors'].append(f"{rel}: {e.strerror or e}")
+                continue
+            del manifest.files[rel]
+            self.stats['files_deleted'] += 1
+        for rel in sorted(manifest.dirs - src_dirs, key=lambda d: -d.count(os.sep)):
+            try:
+                # Directories still holding files the sync does not own are kept
+                os.rmdir(os.path.join(target, rel))
+            except OSError:
+                pass
+
+    def run(self) -> Dict:
+        """
+        Run the sync.
+
+        Returns:
+            Dict: Sync statistics; ``errors`` lists the files that failed
+        """
+        started = time.monotonic()
+        if not os.path.isdir(self.src):
+            raise NotADirectoryError(f"Not a directory: {self.src}")
+        manifest = SyncManifest(self.src, self.dest, self.manifest_dir)
+        loaded = manifest.load()
+        target = manifest.target if loaded else self._resolve_target()
+        manifest.target = target
+        self.stats['target'] = target
+        if target == self.src or target.startswith(self.src + os.sep):
+            raise ValueError(f"Cannot sync '{self.src}' into itself")
+
+        # Without a manifest, or with a target that was removed since,
+        # the target itself is compared
+        trusted = loaded and os.path.isdir(target)
+        if not trusted:
+            manifest.files = {}
+            manifest.dirs = set()
+
+        src_dirs, src_files, changed, touched = self._delta(target, manifest, trusted)
+        # Files below an unreadable directory look deleted, so nothing is
+        # pruned after an incomplete walk
+        walked = not self.stats['errors']
+        self._emit('scan', force=True)
+
+        try:
+            os.makedirs(target, exist_ok=True)
+            for rel in sorted(src_dirs - manifest.dirs, key=lambda d: d.count(os.sep)):
+                try:
+                    os.makedirs(os.path.join(target, rel), exist_ok=True)
+                except OSError as e:
+                    self.stats['errors'].append(f"{rel}: {e.strerror or e}")
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hcmd-sync') as pool:
+                for rel, st in changed:
+                    pool.submit(self._copy_one, rel, st, target, manifest)
+                for rel, st in touched:
+                    pool.submit(self._compare_one, rel, st, target, manifest)
+
+            if self.delete and walked:
+                self._emit('cleanup', force=True)
+                self._prune(target, manifest, src_files, src_dirs)
+                manifest.dirs = src_dirs
+            else:
+                manifest.dirs = src_dirs | manifest.dirs
+        finally:
+            # Files copied before a failure are not copied again
+            manifest.save()
+
+        self.stats['elapsed'] = time.monotonic() - started
+        self._emit('done', force=True)
+        return self.stats
+
+def sync_tree(src: str, dest: str, delete: bool = False,
+              progress: Optional[Callable[[Dict], None]] = None,
+              workers: Optional[int] = None) -> Dict:
+    """
+    Make ``dest`` mirror ``src``, copying only new and changed files.
+
+    Args:
+        src: Source directory
+        dest: Destination path
+        delete: If True, also remove files deleted from the source
+        progress: Optional callback receiving progress event dicts
+        workers: Number of scanner and copy threads
+
+    Returns:
+        Dict: Sync statistics
+    """
+    return TreeSync(src, dest, delete=delete, workers=workers, progress=progress).run()
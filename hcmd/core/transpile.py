@@ -0,0 +1,189 @@
+"""
+Streaming translation of plain-English runbooks into shell scripts.
+
+A runbook is a text file with one step per line ("go to downloads",
+"zip the build folder"). Each step is interpreted once and rendered from
+the templates table for every requested platform, so one pass over the
+file produces the bash and PowerShell scripts together. Blank lines and
+``#`` comments are carried over; steps that cannot be translated, or whose
+command fails validation, are written as comments and reported.
+
+The input is read and the scripts are written line by line, and finished
+translations are remembered in a bounded memo (runbooks repeat the same
+steps a lot), so memory stays constant whatever the size of the file.
+"""
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from ..constants import CommandType, OS
+from .command import NATIVE_COMMAND_TYPES
+from .generator import CommandGenerator
+from .validator import is_command_safe, validate_command_type
+
+# Platform keys a runbook can be translated for, and the OS each one renders as
+TARGETS = ('linux', 'darwin', 'windows')
+TARGET_OS = {'linux': OS.LINUX, 'darwin': OS.MACOS, 'windows': OS.WINDOWS}
+
+# First lines of a generated script, by platform key
+SCRIPT_HEADERS = {
+    'linux': '#!/usr/bin/env bash\nset -euo pipefail\n',
+    'darwin': '#!/usr/bin/env bash\nset -euo pipefail\n',
+    'windows': "$ErrorActionPreference = 'Stop'\n",
+}
+
+# File name suffix of a generated script, by platform key
+SCRIPT_SUFFIXES = {'linux': '.sh', 'darwin': '.sh', 'windows': '.ps1'}
+
+# Translated steps remembered by their text
+MEMO_SIZE = 4096
+
+# Home directory references that only an interactive shell expands, and what
+# a script must say instead ('"~/x"' is not expanded by bash once quoted)
+_HOME_REFERENCES = {
+    'linux': (re.compile(r'(?<=")~(?=[/"])'), '$HOME'),
+    'darwin': (re.compile(r'(?<=")~(?=[/"])'), '$HOME'),
+    'windows': (re.compile(r'%USERPROFILE%|(?<=")~(?=[\\"])', re.IGNORECASE), '$env:USERPROFILE'),
+}
+
+# List markers in front of a step ("1. ", "2) ", "- ", "* ", "Step 3: ")
+_STEP_MARKER = re.compile(r'^(?:\d+[.)]|[-*•]|step\s+\d+\s*[:.)]?)\s+', re.IGNORECASE)
+
+class Step(NamedTuple):
+    """One translated line of a runbook."""
+    line: int
+    text: str                   # The step, without its list marker
+    command_type: CommandType
+    commands: Dict[str, str]    # Command line by platform key; empty if untranslated
+    error: Optional[str]        # Why the step was not translated
+
+class Transpiler:
+    """Translates runbook steps for one or more platforms at once."""
+
+    def __init__(self, targets: Iterable[str] = TARGETS, memo_size: int = MEMO_SIZE):
+        """
+        Prepare one generator per platform.
+
+        Args:
+            targets: Platform keys to render for
+            memo_size: Number of translated steps remembered
+
+        Raises:
+            ValueError: For an unknown platform key
+        """
+        self.targets = tuple(targets)
+        unknown = [target for target in self.targets if target not in TARGETS]
+        if unknown or not self.targets:
+            raise ValueError(f"Unknown target: {', '.join(unknown) or '(none)'}")
+        # Scripts run as other users, so "~" is left for them to expand
+        self._generators = {target: CommandGenerator(TARGET_OS[target], expand_home=False)
+                            for target in self.targets}
+        # Interpretation does not depend on the platform; rendering does. The
+        # validator checks paths the way this machine spells them, so native
+        # commands are validated with this machine's generator whatever the targets.
+        self._interpreter = CommandGenerator()
+        self._memo: 'OrderedDict[str, Tuple[CommandType, Dict[str, str], Optional[str]]]' = OrderedDict()
+        self._memo_size = memo_size
+
+    def translate(self, text: str) -> Tuple[CommandType, Dict[str, str], Optional[str]]:
+        """
+        Translate one step for every target.
+
+        Returns:
+            (command type, command line by platform key, error); the
+            commands are empty when the error is set
+        """
+        key = text.lower()
+        cached = self._memo.get(key)
+        if cached is not None:
+            self._memo.move_to_end(key)
+            return cached
+
+        command_type, args = self._interpreter.interpret_natural_language(text)
+        commands: Dict[str, str] = {}
+        error = None
+        if command_type == CommandType.UNKNOWN:
+            error = "not understood"
+        elif command_type in NATIVE_COMMAND_TYPES:
+            is_safe, reason = validate_command_type(
+                command_type, self._interpreter.resolve_args(command_type, args))
+            if not is_safe:
+                error = f"unsafe: {reason}"
+        if error is None:
+            for target, generator in self._generators.items():
+                display = generator.generate_command(command_type, args)
+                if not display:
+                    error = f"no {target} command for {command_type.name}"
+                    break
+                if command_type not in NATIVE_COMMAND_TYPES:
+                    is_safe, reason = is_command_safe(display)
+                    if not is_safe:
+                        error = f"unsafe: {reason}"
+                        break
+                pattern, home = _HOME_REFERENCES[target]
+                commands[target] = pattern.sub(home, display)
+        result = (command_type, {} if error else commands, error)
+
+        self._memo[key] = result
+        if len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+        return result
+
+    def steps(self, lines: Iterable[str]) -> Iterator[Step]:
+        """
+        Translate a runbook line by line.
+
+        Blank lines and ``#`` comments are yielded with UNKNOWN as their
+        type, no commands and no error.
+        """
+        for number, raw in enumerate(lines, 1):
+            text = raw.strip()
+            if not text or text.startswith('#'):
+                yield Step(number, text, CommandType.UNKNOWN, {}, None)
+                continue
+            text = _STEP_MARKER.sub('', text, count=1)
+            command_type, commands, error = self.translate(text)
+            yield Step(number, text, command_type, commands, error)
+
+def render_step(step: Step, target: str) -> str:
+    """The lines of a target script for one step."""
+    if not step.text:
+        return '\n'
+    if step.text.startswith('#'):
+        return step.text + '\n'
+    if step.error:
+        return f"# hcmd: line {step.line} not translated ({step.error}): {step.text}\n"
+    return f"# {step.text}\n{step.commands[target]}\n"
+
+def transpile(lines: Iterable[str], outputs: Dict[str, TextIO],
+              report: Optional[Callable[[Step], None]] = None) -> Dict:
+    """
+    Translate a runbook into one script per target, in a single pass.
+
+    Args:
+        lines: The runbook, line by line (an open file will do)
+        outputs: Writable text stream by platform key
+        report: Optional callback receiving every step that was not translated
+
+    Returns:
+        Dict: ``lines``, ``steps`` (lines holding a step), ``translated``
+        and ``untranslated`` counts
+    """
+    transpiler = Transpiler(outputs)
+    stats = {'lines': 0, 'steps': 0, 'translated': 0, 'untranslated': 0}
+    for target, out in outputs.items():
+        out.write(SCRIPT_HEADERS[target])
+    writers: List[Tuple[str, Callable[[str], int]]] = [(target, out.write) for target, out in outputs.items()]
+    for step in transpiler.steps(lines):
+        stats['lines'] += 1
+        if step.text and not step.text.startswith('#'):
+            stats['steps'] += 1
+            if step.error:
+                stats['untranslated'] += 1
+                if report is not None:
+                    report(step)
+            else:
+                stats['translated'] += 1
+        for target, write in writers:
+            write(render_step(step, target))
+    return stats
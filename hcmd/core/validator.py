@@ -1,8 +1,12 @@
 """Command validation module for the hcmd tool."""
+import os
 import re
-from typing import List, Optional, Tuple
+from typing import List, Optional, Set, Tuple
 
-from ..constants import DANGEROUS_PATTERNS, CommandType
+from ..constants import PROTECTED_PATHS, PROTECTED_PREFIXES, PROTECTED_PROCESSES, CommandType
+from .command import Command, MODE_NATIVE
+from .metrics import BLOCKED, STAGE_SECONDS
+from .rules import load_rules
 
 def is_command_safe(command: str) -> Tuple[bool, str]:
     """
@@ -14,30 +18,116 @@ def is_command_safe(command: str) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (is_safe, reason)
     """
+    with STAGE_SECONDS.time('validate'):
+        blocked = _blocking_rule(command)
+    if blocked is None:
+        return True, ""
+    rule, reason = blocked
+    BLOCKED.inc(rule)
+    return False, reason
+
+def _blocking_rule(command: str) -> Optional[Tuple[str, str]]:
+    """Return (rule, reason) for the first safety rule the command breaks, else None."""
     if not command or not command.strip():
-        return False, "Empty command"
+        return 'empty', "Empty command"
     
-    # Check against dangerous patterns
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, command, re.IGNORECASE):
-            return False, f"Matches dangerous pattern: {pattern}"
+    # Check against dangerous patterns (built-in and user rules, precompiled)
+    for pattern, regex in load_rules().dangerous:
+        if regex.search(command):
+            return pattern, f"Matches dangerous pattern: {pattern}"
     
     # Check for suspicious command sequences
     suspicious_sequences = ['&&', ';', '|', '`', '$(']
     for seq in suspicious_sequences:
         if seq in command:
-            return False, f"Contains suspicious sequence: {seq}"
+            return f'sequence:{seq}', f"Contains suspicious sequence: {seq}"
     
     # Additional safety checks
     if command.startswith('sudo'):
-        return False, "Sudo commands are not allowed"
+        return 'sudo', "Sudo commands are not allowed"
     
     if 'rm ' in command or 'del ' in command:
         # Only allow removing specific files, not patterns like *
         if any(char in command for char in ['*', '?', '{', '}', '..']):
-            return False, "Potentially dangerous file pattern"
+            return 'file_pattern', "Potentially dangerous file pattern"
     
-    return True, ""
+    return None
+
+def _is_below(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+def _candidates(path: str) -> Set[str]:
+    """A path as given and with symbolic links resolved, both absolute and normalised."""
+    expanded = os.path.expandvars(os.path.expanduser(path.strip()))
+    return {os.path.normcase(os.path.realpath(expanded)),
+            os.path.normcase(os.path.abspath(expanded))}
+
+def _below_system_directory(candidates: Set[str], home: str) -> bool:
+    prefixes = [os.path.normcase(os.path.normpath(p)) for p in PROTECTED_PREFIXES]
+    return any(_is_below(candidate, prefix) and not _is_below(candidate, home)
+               for candidate in candidates for prefix in prefixes)
+
+def is_path_protected(path: str) -> bool:
+    """
+    Check if a path is the root, the user's home, a system directory or
+    anything below a system directory.
+    
+    Both the path as given and the path with symbolic links resolved are
+    checked. Paths inside the user's home are never below a system
+    directory, even when the home itself is (``/var/lib/jenkins``).
+    
+    Args:
+        path: The path to check (``~`` and environment variables are expanded)
+        
+    Returns:
+        bool: True if the path must not be deleted
+    """
+    if not path or not path.strip():
+        return True
+    
+    candidates = _candidates(path)
+    home = os.path.normcase(os.path.realpath(os.path.expanduser('~')))
+    if home in candidates:
+        return True
+    
+    protected = {os.path.normcase(os.path.normpath(p)) for p in PROTECTED_PATHS}
+    return bool(candidates & protected) or _below_system_directory(candidates, home)
+
+def is_system_destination(path: str) -> bool:
+    """
+    Check if a path is the root or lies at or below a system directory,
+    where copies, moves, syncs, archives and extractions may not write.
+    
+    Args:
+        path: The destination to check (``~`` and environment variables are expanded)
+        
+    Returns:
+        bool: True if nothing may be written there
+    """
+    if not path or not path.strip():
+        return False
+    candidates = _candidates(path)
+    roots = {os.path.normcase(os.path.normpath(p)) for p in ('/', '\\', 'C:\\')}
+    home = os.path.normcase(os.path.realpath(os.path.expanduser('~')))
+    return bool(candidates & roots) or _below_system_directory(candidates, home)
+
+def is_process_protected(process: dict) -> bool:
+    """
+    Check if a process is init, a kernel thread, a system service or hcmd's own shell.
+    
+    Args:
+        process: A process dict with ``pid``, ``ppid`` and ``name``
+        
+    Returns:
+        bool: True if the process must not be signalled
+    """
+    pid = process['pid']
+    if pid <= 2 or process.get('ppid') == 2:
+        # init, kthreadd and the kernel threads it spawns
+        return True
+    if pid in (os.getpid(), os.getppid()):
+        return True
+    return process.get('name', '').lower() in PROTECTED_PROCESSES
 
 def validate_command_type(command_type: CommandType, args: List[str]) -> Tuple[bool, str]:
     """
@@ -61,15 +151,61 @@ def validate_command_type(command_type: CommandType, args: List[str]) -> Tuple[b
         # Additional safety for delete operations
         if any(arg.strip() in ('', '/', '/*', '\\', 'C:\\', 'C:/') for arg in args):
             return False, "Attempting to delete root or system directories is not allowed"
+        
+        if any(is_path_protected(arg) for arg in args):
+            return False, "Attempting to delete root or system directories is not allowed"
+        
+        # Only allow removing specific paths, not patterns or parent references
+        if any(char in arg for arg in args for char in ['*', '?', '{', '}', '..']):
+            return False, "Potentially dangerous file pattern"
     
     elif command_type in (CommandType.MOVE, CommandType.COPY):
         if len(args) < 2:
             return False, f"{command_type.name} requires source and destination"
         
         # Prevent moving/copying to system directories
-        dest = args[-1].lower()
-        if any(dest.startswith(d) for d in ['/system', '/usr', '/bin', 'c:\\windows']):
+        if is_system_destination(args[-1]):
             return False, f"{command_type.name} to system directory not allowed"
+        
+        # A move removes its source, so the source is held to the DELETE rules
+        if command_type == CommandType.MOVE and is_path_protected(args[0]):
+            return False, "Moving root or system directories is not allowed"
+    
+    elif command_type == CommandType.ARCHIVE:
+        if len(args) < 2 or not args[0] or not args[1]:
+            return False, "ARCHIVE requires a source and an archive name"
+        if is_system_destination(args[1]):
+            return False, "ARCHIVE to system directory not allowed"
+    
+    elif command_type == CommandType.EXTRACT:
+        if not args or not args[0]:
+            return False, "No archive specified"
+        if is_system_destination(args[1] if len(args) > 1 else '.'):
+            return False, "Extracting into the root or a system directory is not allowed"
+
+    elif command_type == CommandType.SYNC:
+        if len(args) < 2 or not args[0] or not args[1]:
+            return False, "SYNC requires source and destination"
+        if is_system_destination(args[1]):
+            return False, "SYNC to system directory not allowed"
+        if 'delete=1' in args[2:] and (args[1].strip() in ('/', '\\') or is_path_protected(args[1])):
+            return False, "Propagating deletions to a root or system directory is not allowed"
+
+    elif command_type == CommandType.KILL:
+        if len(args) < 2 or not args[1]:
+            return False, "KILL requires a process name, pid or port"
+        if args[0] in ('pid', 'port') and not args[1].isdigit():
+            return False, f"Invalid {args[0]}: {args[1]}"
+        if args[0] == 'pid' and int(args[1]) <= 2:
+            return False, "Signalling init or the kernel is not allowed"
+        if args[0] == 'name' and (args[1].lower() in PROTECTED_PROCESSES or any(c in args[1] for c in '*?')):
+            return False, f"Signalling '{args[1]}' is not allowed"
+
+    elif command_type == CommandType.LOG:
+        if len(args) < 2 or not args[0]:
+            return False, "No log file specified"
+        if args[1] not in ('tail', 'head', 'search', 'follow'):
+            return False, f"Unknown log mode: {args[1]}"
 
     elif command_type == CommandType.DOCKER:
         if not args:
@@ -81,6 +217,25 @@ def validate_command_type(command_type: CommandType, args: List[str]) -> Tuple[b
     
     return True, ""
 
+def validate_command(command: Command) -> Command:
+    """
+    Validate a typed command and stamp it with the verdict.
+    
+    Native commands never reach a shell, so their resolved arguments are
+    validated; every other command is checked as a command line.
+    
+    Args:
+        command: The command to validate
+        
+    Returns:
+        Command: A copy of the command carrying its (is_safe, reason) verdict
+    """
+    if command.mode == MODE_NATIVE:
+        is_valid, reason = validate_command_type(command.command_type, list(command.args))
+    else:
+        is_valid, reason = is_command_safe(command.display)
+    return command.with_verdict(is_valid, reason)
+
 def sanitize_input(input_str: str) -> str:
     """
     Sanitize user input to prevent command injection.
@@ -162,25 +317,33 @@ def extract_paths(text: str) -> List[str]:
             paths.append(path)
             return paths
     
+    # Patterns 1 and 2 only match where a path token starts, so the tail of
+    # a relative path ("/snlp" in "projects/snlp") is not read as an
+    # absolute path, nor the body of an absolute path as a relative one.
+    # Paths are returned in the order they were typed.
+    found = []
+    
     # Pattern 1: Absolute paths (starts with /, ~, or drive letter)
-    abs_path_pattern = r'(?:[a-zA-Z]:|~|/)[\w\\/.-]+'
+    abs_path_pattern = r'(?<![\w\\/.:~-])(?:[a-zA-Z]:|~|/)[\w\\/.-]+'
     abs_matches = re.finditer(abs_path_pattern, text)
     
     for match in abs_matches:
         path = match.group(0)
         if len(path) > 2 and not any(c in path for c in ['*', '?']):
-            paths.append(path)
+            found.append((match.start(), path))
     
     # Pattern 2: Relative paths (word characters with slashes/dots)
     # This will match things like "projects/snlp" or "../folder" or "./file"
-    rel_path_pattern = r'(?:\.\.?/)?[\w.-]+(?:/[\w.-]+)+'
+    rel_path_pattern = r'(?<![\w\\/.:~-])(?:\.\.?/)?[\w.-]+(?:/[\w.-]+)+'
     rel_matches = re.finditer(rel_path_pattern, text)
     
     for match in rel_matches:
         path = match.group(0)
         # Skip if it looks like a URL or email
         if not any(c in path for c in ['*', '?', '@']) and '://' not in path:
-            paths.append(path)
+            found.append((match.start(), path))
+    
+    paths.extend(path for _, path in sorted(found))
     
     # Pattern 3: Single directory/file names (as fallback)
     # Only if no other paths were found and it's not an excluded word
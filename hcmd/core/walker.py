@@ -0,0 +1,124 @@
+"""Parallel directory walker for the hcmd tool."""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+# Default number of scanner threads. Directory scans are dominated by
+# syscalls that release the GIL, so oversubscribing the CPUs pays off.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+class ScannedDir(NamedTuple):
+    """The result of scanning a single directory."""
+    path: str
+    files: List[os.DirEntry]
+    dirs: List[os.DirEntry]
+    error: Optional[OSError]
+
+_DONE = object()
+
+class _Failure(NamedTuple):
+    """An exception raised in a worker, re-raised by the caller."""
+    error: BaseException
+
+def scan_tree(root: str,
+              workers: Optional[int] = None,
+              prune: Optional[Callable[[os.DirEntry], bool]] = None,
+              with_stat: bool = False,
+              select: Optional[Callable[[os.DirEntry], bool]] = None) -> Iterator[ScannedDir]:
+    """
+    Walk a directory tree with a pool of ``os.scandir`` workers.
+
+    Directories are yielded as soon as they have been scanned, in no
+    particular order. Symbolic links are reported as files and never
+    followed. Stopping the iteration early cancels the outstanding scans.
+
+    Args:
+        root: Directory to walk
+        workers: Number of scanner threads (defaults to DEFAULT_WORKERS)
+        prune: Optional predicate; sub-directories for which it returns True
+            are reported but not descended into
+        with_stat: If True, ``entry.stat(follow_symlinks=False)`` is called
+            in the worker so the result is cached on every returned entry
+        select: Optional predicate evaluated in the worker; only entries for
+            which it returns True are reported. It does not affect which
+            directories are descended into.
+
+    Yields:
+        ScannedDir: One record per scanned directory
+
+    Raises:
+        Exception: Whatever ``prune`` or ``select`` raised, which also stops the walk
+    """
+    results: queue.Queue = queue.Queue(maxsize=1024)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    pending = [1]
+    pool = ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS,
+                              thread_name_prefix='hcmd-scan')
+
+    def put(item) -> None:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(path: str) -> None:
+        try:
+            scan_dir(path)
+        except Exception as e:
+            # Without this the directory is never counted as finished and
+            # the caller waits forever
+            put(_Failure(e))
+
+    def scan_dir(path: str) -> None:
+        files: List[os.DirEntry] = []
+        dirs: List[os.DirEntry] = []
+        error = None
+        if not stopped.is_set():
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            if with_stat:
+                                entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        (dirs if is_dir else files).append(entry)
+            except OSError as e:
+                error = e
+
+        descend = [d.path for d in dirs if not (prune and prune(d))]
+        if select is not None:
+            files = [f for f in files if select(f)]
+            dirs = [d for d in dirs if select(d)]
+        with lock:
+            pending[0] += len(descend)
+        for sub in descend:
+            if stopped.is_set():
+                break
+            pool.submit(scan, sub)
+
+        put(ScannedDir(path, files, dirs, error))
+        with lock:
+            pending[0] -= 1
+            finished = pending[0] == 0
+        if finished:
+            put(_DONE)
+
+    pool.submit(scan, root)
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False)
@@ -13,6 +13,9 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/yourusername/hcmd",
     packages=find_packages(),
+    package_data={
+        'hcmd': ['data/*', 'data/lang/*'],
+    },
     entry_points={
         'console_scripts': [
             'hcmd=hcmd.cli:run',
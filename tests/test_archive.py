@@ -0,0 +1,135 @@
+"""Tests for archive extraction staying inside its destination."""
+import io
+import os
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core import archive
+from hcmd.core.archive import extract_archive
+from hcmd.core.executor import CommandExecutor
+
+def _snapshot(work):
+    """Every path under ``work`` that is not in its destination directory."""
+    dest = str(work / 'dest')
+    return sorted(path for path in (os.path.join(top, name) for top, dirs, files in os.walk(work)
+                                    for name in dirs + files)
+                  if path != dest and not path.startswith(dest + os.sep))
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data, mode in members:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = mode << 16
+            zf.writestr(info, data)
+
+def _tar(path, members):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, kind, value in members:
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            if kind == tarfile.REGTYPE:
+                info.size = len(value)
+                tar.addfile(info, io.BytesIO(value))
+            else:
+                info.linkname = value
+                tar.addfile(info)
+
+@pytest.fixture
+def work(tmp_path):
+    (tmp_path / 'secret.txt').write_text('secret')
+    (tmp_path / 'dest').mkdir()
+    return tmp_path
+
+def _assert_contained(work, before):
+    assert _snapshot(work) == before
+    assert (work / 'secret.txt').read_text() == 'secret'
+    assert os.stat(work / 'secret.txt').st_nlink == 1
+
+@pytest.mark.parametrize('name', ['../evil.txt', 'sub/../../evil.txt', '/tmp/hcmd-test-evil.txt', 'C:/evil.txt'])
+def test_zip_member_outside_destination_is_refused(work, name):
+    _zip(work / 'a.zip', [(name, b'x', stat.S_IFREG | 0o644), ('ok.txt', b'ok', stat.S_IFREG | 0o644)])
+    before = _snapshot(work)
+    stats = extract_archive(str(work / 'a.zip'), str(work / 'dest'))
+    assert stats['errors'] == [f"{name}: unsafe member name"]
+    assert (work / 'dest' / 'ok.txt').read_text() == 'ok'
+    assert not os.path.exists('/tmp/hcmd-test-evil.txt')
+    _assert_contained(work, before)
+
+@pytest.mark.parametrize('link', ['../secret.txt', '/etc', 'sub/../../secret.txt'])
+def test_zip_symlink_leaving_destination_is_refused(work, link):
+    _zip(work / 'a.zip', [('link', link.encode(), stat.S_IFLNK | 0o777),
+                          ('link/escaped.txt', b'x', stat.S_IFREG | 0o644)])
+    before = _snapshot(work)
+    stats = extract_archive(str(work / 'a.zip'), str(work / 'dest'))
+    assert any(error.startswith('link:') for error in stats['errors'])
+    assert not os.path.islink(work / 'dest' / 'link')
+    _assert_contained(work, before)
+
+def test_zip_symlink_inside_destination_is_kept(work):
+    _zip(work / 'a.zip', [('a.txt', b'a', stat.S_IFREG | 0o644), ('link', b'a.txt', stat.S_IFLNK | 0o777),
+                          ('up', b'sub/..', stat.S_IFLNK | 0o777)])
+    stats = extract_archive(str(work / 'a.zip'), str(work / 'dest'))
+    assert stats['errors'] == []
+    assert os.readlink(work / 'dest' / 'link') == 'a.txt'
+    assert os.readlink(work / 'dest' / 'up') == 'sub/..'
+
+def test_zip_symlink_through_another_symlink_is_refused(work):
+    _zip(work / 'a.zip', [('here', b'.', stat.S_IFLNK | 0o777)])
+    extract_archive(str(work / 'a.zip'), str(work / 'dest'))
+    _zip(work / 'b.zip', [('link', b'here/..', stat.S_IFLNK | 0o777)])
+    before = _snapshot(work)
+    stats = extract_archive(str(work / 'b.zip'), str(work / 'dest'))
+    assert [error.split(':')[0] for error in stats['errors']] == ['link']
+    assert not os.path.lexists(work / 'dest' / 'link')
+    _assert_contained(work, before)
+
+@pytest.fixture(params=['filtered', 'unfiltered'])
+def tar_filter(request, monkeypatch):
+    # Pythons without tarfile.data_filter rely on hcmd's own checks alone
+    if request.param == 'unfiltered':
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    elif not hasattr(tarfile, 'data_filter'):
+        pytest.skip('tarfile has no extraction filters')
+    return request.param
+
+@pytest.mark.parametrize('members', [
+    [('../evil.txt', tarfile.REGTYPE, b'x')],
+    [('/tmp/hcmd-test-evil.txt', tarfile.REGTYPE, b'x')],
+    [('link', tarfile.SYMTYPE, '../secret.txt')],
+    [('link', tarfile.SYMTYPE, '/etc/passwd')],
+    [('here', tarfile.SYMTYPE, '.'), ('link', tarfile.SYMTYPE, 'here/..'), ('link/evil.txt', tarfile.REGTYPE, b'x')],
+    [('hard', tarfile.LNKTYPE, '../secret.txt')],
+    [('hard', tarfile.LNKTYPE, '/etc/passwd')],
+], ids=['dotdot', 'absolute', 'symlink-up', 'symlink-absolute', 'symlink-via-symlink', 'hardlink-up',
+        'hardlink-absolute'])
+def test_tar_member_leaving_destination_is_refused(work, tar_filter, members):
+    _tar(work / 'a.tar.gz', members + [('ok.txt', tarfile.REGTYPE, b'ok')])
+    before = _snapshot(work)
+    stats = extract_archive(str(work / 'a.tar.gz'), str(work / 'dest'))
+    assert stats['errors']
+    assert (work / 'dest' / 'ok.txt').read_text() == 'ok'
+    assert not os.path.exists('/tmp/hcmd-test-evil.txt')
+    assert not os.path.islink(work / 'dest' / 'link')
+    assert not os.path.lexists(work / 'dest' / 'hard')
+    _assert_contained(work, before)
+
+def test_tar_hardlink_to_a_member_is_kept(work, tar_filter):
+    _tar(work / 'a.tar.gz', [('a.txt', tarfile.REGTYPE, b'a'), ('hard', tarfile.LNKTYPE, 'a.txt')])
+    stats = extract_archive(str(work / 'a.tar.gz'), str(work / 'dest'))
+    assert stats['errors'] == []
+    assert (work / 'dest' / 'hard').read_text() == 'a'
+
+@pytest.mark.parametrize('dest', ['/etc', '/usr/local/bin', '/'])
+def test_extract_into_system_directory_is_refused_natively(work, monkeypatch, dest):
+    _zip(work / 'a.zip', [('ok.txt', b'ok', stat.S_IFREG | 0o644)])
+
+    def never(*args, **kwargs):
+        raise AssertionError('extracted into a system directory')
+    monkeypatch.setattr(archive, 'extract_archive', never)
+    success, message, _ = CommandExecutor().execute_native(CommandType.EXTRACT, [str(work / 'a.zip'), dest])
+    assert not success
+    assert 'system directory' in message
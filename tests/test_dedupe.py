@@ -0,0 +1,66 @@
+"""Tests for the duplicate file finder and its hash index."""
+import os
+
+import pytest
+
+from hcmd.core.dedupe import PARTIAL_BLOCK, find_duplicates
+
+BIG = 3 * PARTIAL_BLOCK
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'sub').mkdir(parents=True)
+    (tmp_path / 'index').mkdir()
+    return root
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+def _groups(root, **kwargs):
+    result = find_duplicates(str(root), workers=2, index_dir=str(root.parent / 'index'), **kwargs)
+    return result, sorted(group['paths'] for group in result['groups'])
+
+def test_identical_files_are_grouped(tree):
+    same = [_write(tree / 'a.txt', b'hello'), _write(tree / 'sub' / 'b.txt', b'hello')]
+    _write(tree / 'c.txt', b'world')
+    _write(tree / 'd.txt', b'unique size')
+    result, groups = _groups(tree)
+    assert groups == [sorted(same)]
+    assert result['wasted'] == 5
+
+def test_same_size_with_different_contents_is_not_grouped(tree):
+    head, tail = b'h' * PARTIAL_BLOCK, b't' * PARTIAL_BLOCK
+    # Same size, same first and last blocks: only the full hash tells them apart
+    _write(tree / 'x.bin', head + b'x' * PARTIAL_BLOCK + tail)
+    _write(tree / 'y.bin', head + b'y' * PARTIAL_BLOCK + tail)
+    big = [_write(tree / 'z1.bin', b'z' * BIG), _write(tree / 'sub' / 'z2.bin', b'z' * BIG)]
+    result, groups = _groups(tree)
+    assert groups == [sorted(big)]
+    assert result['full_hashed'] == 4
+
+def test_hard_links_and_empty_files_are_not_duplicates(tree):
+    _write(tree / 'a.txt', b'linked')
+    os.link(tree / 'a.txt', tree / 'b.txt')
+    _write(tree / 'e1', b'')
+    _write(tree / 'e2', b'')
+    assert _groups(tree)[1] == []
+
+def test_repeat_run_reuses_the_index(tree):
+    _write(tree / 'a.bin', b'a' * BIG)
+    _write(tree / 'b.bin', b'a' * BIG)
+    first, groups = _groups(tree)
+    assert (first['partial_hashed'], first['full_hashed'], first['reused']) == (2, 2, 0)
+
+    again, same = _groups(tree)
+    assert same == groups
+    assert (again['partial_hashed'], again['full_hashed'], again['reused']) == (0, 0, 4)
+
+    # A modified file gets a new index key and is hashed again
+    mtime = os.stat(tree / 'b.bin').st_mtime_ns
+    _write(tree / 'b.bin', b'b' * BIG)
+    os.utime(tree / 'b.bin', ns=(mtime + 10**9, mtime + 10**9))
+    changed, groups = _groups(tree)
+    assert groups == []
+    assert changed['partial_hashed'] == 1
@@ -0,0 +1,21 @@
+"""Tests for running typed and legacy string commands."""
+from hcmd.constants import CommandType
+from hcmd.core.command import MODE_SHELL, Command
+from hcmd.core.executor import CommandExecutor
+
+def test_typed_shell_command_is_not_rewritten(tmp_path, monkeypatch):
+    monkeypatch.setenv('SHELL', '/bin/sh')
+    command = Command(CommandType.LIST_FILES, MODE_SHELL, 'echo list file in nowhere', 'linux',
+                      verdict=(True, ''))
+    assert CommandExecutor().run(command, cwd=str(tmp_path))[:2] == (True, 'list file in nowhere')
+
+def test_shell_invocation_passes_the_command_through(monkeypatch):
+    monkeypatch.setenv('SHELL', '/bin/sh')
+    executor = CommandExecutor()
+    assert executor._get_shell_command('echo list files in x') == ('/bin/sh', ['-c', 'echo list files in x'])
+
+def test_legacy_strings_are_still_rewritten():
+    executor = CommandExecutor(dry_run=True)
+    assert executor.execute('list files in /tmp') == (True, '[DRY RUN] ls -la /tmp')
+    assert executor.execute('list files here') == (True, '[DRY RUN] ls -la .')
+    assert executor.execute('cd /tmp') == (True, 'cd /tmp')
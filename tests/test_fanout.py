@@ -0,0 +1,81 @@
+"""Tests for running one command across many directories."""
+import os
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.executor import CommandExecutor
+from hcmd.core.fanout import FanOut, expand_targets, parse_fan_out, plan_fan_out, run_fan_out, target_args
+from hcmd.core.generator import CommandGenerator
+
+@pytest.fixture(scope='module')
+def generator():
+    return CommandGenerator()
+
+@pytest.mark.parametrize('text, expected', [
+    ('list files in each of api, web and worker', FanOut('list files', ['api', 'web', 'worker'], '.', None)),
+    ('delete build.log in each of "my app" and web.', FanOut('delete build.log', ['my app', 'web'], '.', None)),
+    ('run tests for each of these projects: a b c', FanOut('run tests', ['a', 'b', 'c'], '.', None)),
+    ('show disk usage for every folder in ~/code', FanOut('show disk usage', None, '~/code', None)),
+    ('find txt files in every service folder under src', FanOut('find txt files', None, 'src', 'service')),
+    ('in every repo list files', FanOut('list files', None, '.', None)),
+])
+def test_parse_fan_out(text, expected):
+    assert parse_fan_out(text) == expected
+
+@pytest.mark.parametrize('text', ['list files', 'go to downloads', 'list files in each of', 'in each of a, b'])
+def test_single_place_is_not_a_fan_out(text):
+    assert parse_fan_out(text) is None
+
+@pytest.mark.parametrize('command_type, args, expected', [
+    (CommandType.MOVE, ['a.txt', 'old'], ['api/a.txt', 'api/old']),
+    (CommandType.COPY, ['/tmp/a.txt', 'b'], ['/tmp/a.txt', 'api/b']),
+    (CommandType.COPY, ['x', '~/y'], ['api/x', os.path.expanduser('~/y')]),
+    (CommandType.DELETE, ['.'], ['api']),
+    (CommandType.LIST_FILES, [], ['api']),
+    (CommandType.EXTRACT, ['a.zip'], ['api/a.zip', 'api']),
+    (CommandType.FIND, ['.', 'ext=txt'], ['api', 'ext=txt']),
+    (CommandType.CREATE, [], []),
+    (CommandType.KILL, ['name', 'node'], ['name', 'node']),
+])
+def test_target_args(generator, command_type, args, expected):
+    assert target_args(generator, command_type, args, 'api') == expected
+
+def test_listed_targets_keep_their_order(generator):
+    fan_out = FanOut('list files', ['web', 'api', '~/x'], '.', None)
+    assert expand_targets(fan_out, generator) == ['web', 'api', os.path.expanduser('~/x')]
+
+def test_directory_targets_are_sorted_and_filtered(generator, tmp_path):
+    for name in ('worker', 'api', 'api-service', '.git', 'web-service'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'service.txt').write_text('')
+    root = str(tmp_path)
+    assert expand_targets(FanOut('x', None, root, None), generator) == [
+        os.path.join(root, name) for name in ('api', 'api-service', 'web-service', 'worker')]
+    assert expand_targets(FanOut('x', None, root, 'SERVICE'), generator) == [
+        os.path.join(root, name) for name in ('api-service', 'web-service')]
+    with pytest.raises(OSError):
+        expand_targets(FanOut('x', None, str(tmp_path / 'missing'), None), generator)
+
+def test_plan_builds_one_command_per_target(generator):
+    plan = plan_fan_out(generator, parse_fan_out('list files in each of api, web and worker'))
+    assert plan.error is None
+    assert [(target, command.display) for target, command in plan.commands] == [
+        ('api', 'ls -la api'), ('web', 'ls -la web'), ('worker', 'ls -la worker')]
+
+def test_plan_refuses_commands_without_paths(generator):
+    plan = plan_fan_out(generator, parse_fan_out('go to downloads in each of api and web'))
+    assert plan.commands == []
+    assert 'NAVIGATION' in plan.error
+
+def test_run_reports_in_target_order(generator, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'build.log').write_text(name)
+    plan = plan_fan_out(generator, parse_fan_out('delete build.log in each of c, a and b'))
+    commands = plan.commands + [('/', None)]
+    results = list(run_fan_out(commands, CommandExecutor(), workers=3))
+    assert [target for target, _ in results] == ['c', 'a', 'b', '/']
+    assert [success for _, (success, _, _) in results] == [True, True, True, False]
+    assert not any((tmp_path / name / 'build.log').exists() for name in ('a', 'b', 'c'))
@@ -0,0 +1,51 @@
+"""Tests for typo-tolerant keyword and alias matching."""
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.fuzzy import SymSpellIndex, allowed_distance, edit_distance
+from hcmd.core.generator import CommandGenerator
+
+def test_lookup_finds_the_closest_word():
+    index = SymSpellIndex(['delete', 'deploy', 'list', 'move'], cache_dir='')
+    assert index.lookup('delte') == ('delete', 1)
+    assert index.lookup('dleete') == ('delete', 1)
+    assert index.lookup('list') == ('list', 0)
+    assert index.lookup('zzzzzz') is None
+    assert index.lookup('dpelte', max_distance=1) is None
+
+def test_ties_go_to_the_earlier_word():
+    assert SymSpellIndex(['cat', 'car'], cache_dir='').lookup('caz') == ('cat', 1)
+
+def test_edit_distance_counts_transpositions_once():
+    assert edit_distance('form', 'from') == 1
+    assert edit_distance('kitten', 'sitting', limit=5) == 3
+    assert edit_distance('a', 'abcdef') == 3
+
+def test_short_words_are_never_corrected():
+    assert allowed_distance('cp') == 0
+    assert allowed_distance('move') == 1
+    assert allowed_distance('downloads') == 2
+
+def test_misspelt_keywords_are_corrected_but_not_paths():
+    generator = CommandGenerator()
+    assert generator.correct_typos('delte old.txt') == 'delete old.txt'
+    assert generator.correct_typos('lsit files') == 'list files'
+    assert generator.correct_typos('move notes/draft.txt to x') == 'move notes/draft.txt to x'
+
+@pytest.mark.parametrize('command_type, fuzzy', [
+    (CommandType.NAVIGATION, True), (CommandType.LIST_FILES, True), (CommandType.DELETE, False),
+    (CommandType.MOVE, False), (CommandType.COPY, False), (CommandType.CREATE, False), (CommandType.OPEN, False),
+])
+def test_aliases_are_corrected_only_for_navigation_and_listing(tmp_path, monkeypatch, command_type, fuzzy):
+    monkeypatch.chdir(tmp_path)
+    generator = CommandGenerator()
+    downloads = generator.resolve_path('downloads')
+    [resolved] = generator.resolve_args(command_type, ['downlaods'])
+    assert (resolved == downloads) == fuzzy
+    if not fuzzy:
+        assert resolved == 'downlaods'
+
+def test_existing_name_is_not_corrected_to_an_alias(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'downlaods').mkdir()
+    assert CommandGenerator().resolve_args(CommandType.NAVIGATION, ['downlaods']) == ['downlaods']
@@ -0,0 +1,82 @@
+"""Tests for natural language interpretation."""
+from hcmd.constants import CommandType
+from hcmd.core.generator import MIN_CONFIDENCE, CommandGenerator
+
+def _best(text):
+    candidates = CommandGenerator().candidates(text, 1)
+    return (candidates[0].command_type, candidates[0].args) if candidates else None
+
+def test_delete_keeps_the_case_of_its_path():
+    assert _best('delete Foo.txt') == (CommandType.DELETE, ['Foo.txt'])
+
+def test_delete_of_system_directory_is_unsafe():
+    candidate = CommandGenerator().candidates('delete /usr/lib', 1)[0]
+    assert not candidate.command.is_safe
+
+def test_search_roots_keep_their_case():
+    assert _best('find txt files in MyProj') == (CommandType.FIND, ['MyProj', 'ext=txt'])
+    assert _best('files containing TODO in SrcDir') == (CommandType.CONTENT_SEARCH, ['SrcDir', 'TODO'])
+    assert _best('find duplicate files in Photos2020') == (CommandType.DEDUPE, ['Photos2020'])
+
+def test_transfer_keeps_absolute_destination():
+    assert _best('copy src to /tmp/rv/dst') == (CommandType.COPY, ['src', '/tmp/rv/dst'])
+    assert _best('move Report.pdf into ~/Documents') == (CommandType.MOVE, ['Report.pdf', '~/Documents'])
+    assert _best('copy "my file.txt" to Backup') == (CommandType.COPY, ['my file.txt', 'Backup'])
+
+def test_misspelt_alias_is_not_corrected_for_delete():
+    for text, name in (('delete docz', 'docz'), ('delete musik', 'musik'), ('remove vidoes', 'vidoes')):
+        candidate = CommandGenerator().candidates(text, 1)[0]
+        assert candidate.command_type == CommandType.DELETE
+        assert list(candidate.command.args) == [name]
+
+def test_misspelt_alias_is_corrected_for_navigation():
+    candidate = CommandGenerator().candidates('cd docz', 1)[0]
+    assert candidate.command_type == CommandType.NAVIGATION
+    assert candidate.command.display.endswith('Documents')
+
+def test_typo_correction_keeps_the_case_of_paths():
+    assert _best('delte Foo.txt') == (CommandType.DELETE, ['Foo.txt'])
+
+def test_unexplained_path_is_offered_but_not_confident():
+    candidate = CommandGenerator().candidates('get rid of src', 1)[0]
+    assert candidate.command_type == CommandType.NAVIGATION
+    assert candidate.score < MIN_CONFIDENCE
+
+def test_bare_path_still_navigates():
+    candidate = CommandGenerator().candidates('~/projects', 1)[0]
+    assert candidate.command_type == CommandType.NAVIGATION
+    assert candidate.score >= MIN_CONFIDENCE
+
+def test_sync_keeps_the_case_of_its_paths():
+    assert _best('sync Docs to /mnt/Backup') == (CommandType.SYNC, ['Docs', '/mnt/Backup'])
+    assert _best('sync Projects to /mnt/USB and delete removed files') == (
+        CommandType.SYNC, ['Projects', '/mnt/USB', 'delete=1'])
+
+def test_sync_paths_that_look_like_the_delete_modifier_are_kept():
+    assert _best('sync Deleted_Items to /mnt/Backup') == (CommandType.SYNC, ['Deleted_Items', '/mnt/Backup'])
+    assert _best('sync removals/ to usb') == (CommandType.SYNC, ['removals/', 'usb'])
+    assert _best('sync Deleted to usb') == (CommandType.SYNC, ['Deleted', 'usb'])
+
+def test_process_names_keep_their_case():
+    assert _best('kill NetworkManager') == (CommandType.KILL, ['name', 'NetworkManager'])
+    assert _best('force kill the Xorg process') == (CommandType.KILL, ['name', 'Xorg', 'signal=KILL'])
+    assert _best('is Dropbox running') == (CommandType.PROCESS, ['name', 'Dropbox'])
+
+def test_generic_verb_is_not_a_confident_open(tmp_path, monkeypatch):
+    (tmp_path / 'tests').mkdir()
+    monkeypatch.chdir(tmp_path)
+    candidates = CommandGenerator().candidates('run the tests', 3)
+    assert candidates
+    assert all(candidate.score < MIN_CONFIDENCE for candidate in candidates)
+    assert CommandType.NAVIGATION not in [candidate.command_type for candidate in candidates]
+    assert _best('launch firefox') == (CommandType.OPEN, ['firefox'])
+
+def test_cd_to_a_path_still_navigates():
+    candidate = CommandGenerator().candidates('cd ~/projects', 1)[0]
+    assert candidate.command_type == CommandType.NAVIGATION
+    assert candidate.score >= MIN_CONFIDENCE
+
+def test_candidates_are_best_first_and_bounded():
+    candidates = CommandGenerator().candidates('~/projects', 2)
+    assert len(candidates) == 2
+    assert candidates[0].score >= candidates[1].score
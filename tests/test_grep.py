@@ -0,0 +1,34 @@
+"""Tests for the content search engine."""
+import os
+import threading
+
+from hcmd.core.grep import GrepQuery, grep, required_literal
+
+def _search(root, pattern, predicates=()):
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(
+        matches=list(grep(GrepQuery(str(root), pattern, list(predicates))))), daemon=True)
+    worker.start()
+    worker.join(10.0)
+    assert not worker.is_alive(), 'search blocked'
+    return result['matches']
+
+def test_required_literal():
+    assert required_literal('foo.*bar') in (b'foo', b'bar')
+    assert required_literal('foo|bar') == b''
+    assert required_literal('(?i)error') == b''
+
+def test_inline_ignore_case_is_not_prefiltered_away(tmp_path):
+    (tmp_path / 'log.txt').write_text('ok\nERROR: disk full\n')
+    matches = _search(tmp_path, '(?i)error', ['regex=1'])
+    assert [(m['line'], m['text']) for m in matches] == [(2, 'ERROR: disk full')]
+
+def test_named_pipe_is_skipped(tmp_path):
+    (tmp_path / 'notes.txt').write_text('TODO: write tests\n')
+    os.mkfifo(tmp_path / 'pipe')
+    matches = _search(tmp_path, 'TODO')
+    assert [os.path.basename(m['path']) for m in matches] == ['notes.txt']
+
+def test_named_pipe_given_as_root_is_skipped(tmp_path):
+    os.mkfifo(tmp_path / 'pipe')
+    assert _search(tmp_path / 'pipe', 'TODO') == []
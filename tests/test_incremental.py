@@ -0,0 +1,62 @@
+"""Tests for the as-you-type translation API."""
+import io
+import os
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.incremental import IncrementalTranslator, serve
+
+@pytest.fixture(scope='module')
+def translator():
+    return IncrementalTranslator(budget=10.0)
+
+@pytest.mark.parametrize('text', ['list files', 'delete old.txt', 'find txt files in src', 'go to downloads',
+                                  'delte old.txt', 'copy a.txt to b.txt', 'show disk usage', 'kill firefox'])
+def test_result_matches_the_generator(translator, text):
+    preview = translator.update(text)
+    assert (preview.command_type, preview.args) == CommandGenerator().interpret_natural_language(text)
+    assert preview.complete
+
+def test_typing_a_line_ends_at_the_full_translation(translator):
+    line = 'delete build.log'
+    previews = [translator.update(line[:i]) for i in range(1, len(line) + 1)]
+    assert (previews[-1].command_type, previews[-1].args) == (CommandType.DELETE, ['build.log'])
+    assert 'build.log' in previews[-1].command
+    assert [p.seq for p in previews] == sorted(p.seq for p in previews)
+
+def test_backspacing_returns_the_memoised_translation(translator):
+    first = translator.update('list files in src')
+    translator.update('list files in src/x')
+    again = translator.update('list  files in src ')
+    assert (again.command_type, again.args, again.command) == (first.command_type, first.args, first.command)
+
+def test_newer_requests_make_older_ones_stale(translator):
+    preview = translator.update('list files')
+    translator.update('list files in', seq=preview.seq + 5)
+    assert translator.is_stale(preview.seq)
+    assert not translator.is_stale(preview.seq + 5)
+
+def test_a_result_cut_short_is_not_memoised():
+    translator = IncrementalTranslator(budget=10.0)
+    translator.budget = -1.0
+    preview = translator.update('zorp the blarg quux')
+    assert not preview.complete
+    translator.budget = 10.0
+    assert translator.update('zorp the blarg quux').complete
+
+def test_empty_line_has_no_command(translator):
+    preview = translator.update('   ')
+    assert (preview.command_type, preview.command) == (CommandType.UNKNOWN, '')
+
+def test_server_answers_only_the_newest_request(translator):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'1\tlist fi\n2\tlist files\n')
+    os.close(write_fd)
+    out = io.BytesIO()
+    with os.fdopen(read_fd, 'rb') as infile:
+        assert serve(infile, out, translator) == 0
+    seq, status, command = out.getvalue().decode().rstrip('\n').split('\t')
+    assert (seq, status) == ('2', 'ok')
+    assert command.startswith('ls')
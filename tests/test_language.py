@@ -0,0 +1,100 @@
+"""Tests for phrase packs: commands typed in other languages."""
+import pytest
+
+from hcmd.core import language
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.language import PhrasePack, get_pack, installed_languages, select_language, to_english
+
+# (language, input, the same command in English)
+EQUIVALENTS = [
+    ('es', 've a descargas', 'go to downloads'),
+    ('es', 'borra notas.txt', 'delete notas.txt'),
+    ('es', 'crea una carpeta llamada build', 'create a folder named build'),
+    ('es', 'copia a.txt a respaldo', 'copy a.txt to respaldo'),
+    ('es', 'busca archivos mayores de 10mb en descargas', 'find files larger than 10mb in downloads'),
+    ('es', 'mata el proceso firefox', 'kill firefox'),
+    ('es', 'qué usa el puerto 8080', 'what is using port 8080'),
+    ('es', 'últimas 20 líneas de app.log', 'last 20 lines of app.log'),
+    ('de', 'gehe zu dokumente', 'go to documents'),
+    ('de', 'lösche notizen.txt', 'delete notizen.txt'),
+    ('de', 'die datei notizen.txt löschen', 'delete the file notizen.txt'),
+    ('de', 'erstelle einen ordner namens build', 'create a folder named build'),
+    ('de', 'kopiere a.txt nach sicherung', 'copy a.txt to sicherung'),
+    ('de', 'entpacke bilder.zip', 'extract bilder.zip'),
+    ('de', 'doppelte dateien im schreibtisch', 'duplicate files in desktop'),
+    ('hi', 'डाउनलोड्स में जाओ', 'go to downloads'),
+    ('hi', 'notes.txt हटाओ', 'delete notes.txt'),
+    ('hi', 'build नाम का फ़ोल्डर बनाओ', 'create a folder named build'),
+    ('hi', 'डिस्क उपयोग दिखाओ', 'show disk usage'),
+    ('hi', 'firefox को बंद करो', 'kill firefox'),
+    ('hi', 'photos.zip को अनज़िप करो', 'extract photos.zip'),
+]
+
+@pytest.fixture
+def environment(monkeypatch):
+    """No configured language and an English locale, restored afterwards."""
+    monkeypatch.delenv('HCMD_LANG', raising=False)
+    for variable in ('LC_ALL', 'LC_MESSAGES'):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setenv('LANG', 'en_US.UTF-8')
+    language.locale_language.cache_clear()
+    yield monkeypatch
+    language.locale_language.cache_clear()
+
+@pytest.fixture(scope='module')
+def generator():
+    return CommandGenerator()
+
+def _interpret(generator, environment, lang, text):
+    environment.setenv('HCMD_LANG', lang)
+    return generator.interpret_natural_language(text)
+
+@pytest.mark.parametrize('lang, text, english', EQUIVALENTS)
+def test_pack_input_resolves_like_english(generator, environment, lang, text, english):
+    if text.isascii():
+        # Without $HCMD_LANG, ASCII input in an English locale is taken as English
+        assert to_english(text) is text
+    assert _interpret(generator, environment, lang, text) == _interpret(generator, environment, 'en', english)
+
+@pytest.mark.parametrize('lang, text, english', [
+    ('hi', 'डाउनलोड्स में जाओ', 'go to downloads'),
+    ('hi', 'firefox को बंद करो', 'kill firefox'),
+    ('es', '¿qué hay en descargas?', 'what is in downloads?'),
+    ('de', 'lösche notizen.txt', 'delete notizen.txt'),
+    ('de', 'die datei notizen.txt löschen', 'delete the file notizen.txt'),
+])
+def test_script_selects_the_pack(generator, environment, lang, text, english):
+    assert select_language(text) == lang
+    assert generator.interpret_natural_language(text) == _interpret(generator, environment, 'en', english)
+
+def test_locale_selects_the_pack(environment):
+    environment.setenv('LANG', 'es_ES.UTF-8')
+    language.locale_language.cache_clear()
+    assert select_language('borra notas.txt') == 'es'
+    assert to_english('borra notas.txt') == 'delete notas.txt'
+    environment.setenv('HCMD_LANG', 'DE')
+    assert select_language('borra notas.txt') == 'de'
+
+@pytest.mark.parametrize('text', ['delete a.txt', 'go to en', 'copy a to b', 'list the files in documents'])
+def test_english_input_is_unchanged(environment, text):
+    assert select_language(text) == 'en'
+    assert to_english(text) is text
+
+def test_missing_pack_leaves_input_alone(environment, tmp_path):
+    assert get_pack('xx') is None
+    assert get_pack('es', str(tmp_path)) is None
+    environment.setenv('HCMD_LANG', 'xx')
+    assert to_english('borra notas.txt') == 'borra notas.txt'
+    assert installed_languages() == ['de', 'es', 'hi']
+    assert installed_languages(str(tmp_path / 'missing')) == []
+
+def test_longest_phrase_wins_and_verb_last_moves_the_rest():
+    pack = PhrasePack('xx', [('ve a', 'go to'), ('ve a la carpeta', 'go to folder'),
+                             ('{} borrar', 'delete {}'), ('a', 'to')])
+    assert len(pack) == 4
+    assert pack.translate('ve a la carpeta src') == 'go to folder src'
+    assert pack.translate('Ve   A src') == 'go to src'
+    assert pack.translate('a.txt borrar.') == 'delete a.txt'
+    assert pack.translate('copia a.txt a b') == 'copia a.txt to b'
+    with pytest.raises(ValueError):
+        PhrasePack('xx', [('borrar {}', 'delete {}')])
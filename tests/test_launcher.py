@@ -0,0 +1,53 @@
+"""Tests for the posix_spawn launcher and the zygote helper."""
+import os
+import sys
+import threading
+
+import pytest
+
+from hcmd.core.launcher import HAS_POSIX_SPAWN, Limits, Zygote, launch, spawn
+
+pytestmark = pytest.mark.skipif(not HAS_POSIX_SPAWN, reason='needs posix_spawn')
+
+def _in_thread(run):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(run()), daemon=True)
+    thread.start()
+    thread.join(10.0)
+    assert result, 'launch did not return'
+    return result[0]
+
+def test_spawn_captures_output_and_status():
+    assert spawn([sys.executable, '-c', 'import sys; print("out"); sys.stderr.write("err"); sys.exit(3)']) == (
+        3, 'out\n', 'err')
+
+def test_spawn_reports_a_missing_command():
+    assert spawn(['hcmd-no-such-command'])[0] == 127
+
+def test_spawn_runs_in_another_directory(tmp_path):
+    assert spawn(['pwd'], cwd=str(tmp_path)) == (0, f"{os.path.realpath(tmp_path)}\n", '')
+
+def test_spawn_kills_at_the_deadline():
+    returncode, _, stderr = _in_thread(lambda: spawn([sys.executable, '-c', 'import time; time.sleep(30)'],
+                                                     limits=Limits(deadline=0.2)))
+    assert returncode != 0
+    assert 'Timed out' in stderr
+
+def test_spawn_applies_rlimits(tmp_path):
+    returncode, _, _ = spawn([sys.executable, '-c', 'open("big", "wb").write(b"x" * 100000)'],
+                             cwd=str(tmp_path), limits=Limits(file_size_bytes=1000))
+    assert returncode != 0
+    assert os.path.getsize(tmp_path / 'big') <= 1000
+
+def test_zygote_runs_commands_in_turn(tmp_path):
+    zygote = Zygote()
+    try:
+        assert zygote.run(['echo', 'one']) == (0, 'one\n', '')
+        assert zygote.run(['pwd'], cwd=str(tmp_path)) == (0, f"{os.path.realpath(tmp_path)}\n", '')
+        assert zygote.run(['hcmd-no-such-command'])[0] == 127
+    finally:
+        zygote.close()
+    assert not zygote.alive
+
+def test_launch_through_the_zygote():
+    assert launch(['echo', 'hi'], use_zygote=True) == (0, 'hi\n', '')
@@ -0,0 +1,149 @@
+"""Tests for constant-memory log reading."""
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from hcmd.core import logs
+from hcmd.core.logs import TAIL_BLOCK, LogQuery, read_log
+
+def _log(tmp_path, data, name='app.log'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def _read(path, mode='tail', *options):
+    return list(read_log(LogQuery(path, mode, list(options))))
+
+def _texts(path, mode='tail', *options):
+    return [line['text'] for line in _read(path, mode, *options)]
+
+@pytest.mark.parametrize('data', [b'a\nb\nc\nd\n', b'a\nb\nc\nd'], ids=['newline', 'no-newline'])
+def test_tail_returns_exactly_the_last_lines(tmp_path, data):
+    path = _log(tmp_path, data)
+    assert _texts(path, 'tail', 'count=2') == ['c', 'd']
+    assert _texts(path, 'tail', 'count=4') == ['a', 'b', 'c', 'd']
+    assert _texts(path, 'tail', 'count=10') == ['a', 'b', 'c', 'd']
+    assert _texts(path, 'tail', 'count=0') == []
+    assert [line['offset'] for line in _read(path, 'tail', 'count=2')] == [4, 6]
+
+def test_tail_keeps_blank_lines_and_strips_carriage_returns(tmp_path):
+    path = _log(tmp_path, b'a\r\n\r\nb\r\n\n')
+    assert _texts(path, 'tail', 'count=3') == ['', 'b', '']
+    assert _texts(_log(tmp_path, b'', 'empty.log')) == []
+
+def test_tail_of_a_large_file_reads_only_its_end(tmp_path, monkeypatch):
+    lines = [f"line {i:07d}".encode() for i in range(100000)]
+    path = _log(tmp_path, b'\n'.join(lines) + b'\n')
+    read = []
+    pread = os.pread
+
+    def counting(fd, length, offset):
+        read.append(length)
+        return pread(fd, length, offset)
+    monkeypatch.setattr(os, 'pread', counting)
+    assert _texts(path, 'tail', 'count=3') == ['line 0099997', 'line 0099998', 'line 0099999']
+    assert sum(read) <= TAIL_BLOCK + 1
+
+    # Lines spanning several blocks come back whole and in order
+    read.clear()
+    count = 3 * TAIL_BLOCK // len(lines[0])
+    assert _texts(path, 'tail', f'count={count}') == [line.decode() for line in lines[-count:]]
+    assert sum(read) <= 5 * TAIL_BLOCK
+
+def test_tail_filters_by_pattern(tmp_path):
+    path = _log(tmp_path, b'INFO a\nERROR b\nINFO c\nERROR d\nINFO e\n')
+    assert _texts(path, 'tail', 'count=1', 'pattern=ERROR') == ['ERROR d']
+    assert _texts(path, 'tail', 'count=5', 'pattern=error', 'ignore_case=1') == ['ERROR b', 'ERROR d']
+
+def test_head_returns_the_first_lines_with_numbers(tmp_path):
+    path = _log(tmp_path, b'a\nb\nc')
+    assert _read(path, 'head', 'count=2') == [{'offset': 0, 'text': 'a', 'line': 1},
+                                              {'offset': 2, 'text': 'b', 'line': 2}]
+    assert _texts(path, 'head', 'count=9') == ['a', 'b', 'c']
+    assert _texts(path, 'head', 'count=0') == []
+    assert _texts(path, 'head', 'pattern=c') == ['c']
+
+def test_search_finds_every_match_in_order(tmp_path):
+    path = _log(tmp_path, b'x\nfoo 1\ny\nbar foo 2\nFOO 3\n')
+    assert _read(path, 'search', 'pattern=foo') == [{'offset': 2, 'text': 'foo 1', 'line': 2},
+                                                    {'offset': 10, 'text': 'bar foo 2', 'line': 4}]
+    assert _texts(path, 'search', 'pattern=foo', 'ignore_case=1') == ['foo 1', 'bar foo 2', 'FOO 3']
+    assert _texts(path, 'search', 'pattern=^foo [0-9]$', 'regex=1') == ['foo 1']
+    assert _texts(path, 'search', 'pattern=foo', 'count=1') == ['foo 1']
+    assert _texts(path, 'search', 'pattern=foo', 'count=0') == []
+
+def test_search_by_age_uses_timestamps(tmp_path):
+    now = time.time()
+    stamp = lambda age: time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now - age)).encode()
+    path = _log(tmp_path, b''.join(stamp(age) + b' event %d\n' % age for age in (7200, 3600, 60, 5)))
+    assert [text.split()[-1] for text in _texts(path, 'search', 'max_age=600')] == ['60', '5']
+    assert [text.split()[-1] for text in _texts(path, 'search', 'min_age=600')] == ['7200', '3600']
+    assert [text.split()[-1] for text in _texts(path, 'tail', 'max_age=600', 'count=10')] == ['60', '5']
+
+def test_unknown_mode_or_option_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        LogQuery(str(tmp_path / 'x.log'), 'watch')
+    with pytest.raises(ValueError):
+        LogQuery(str(tmp_path / 'x.log'), 'tail', ['lines=3'])
+
+@pytest.fixture(params=['inotify', 'polling'])
+def following(request, monkeypatch):
+    monkeypatch.setattr(logs, 'FOLLOW_POLL', 0.02)
+    if request.param == 'polling':
+        monkeypatch.setattr(logs, '_inotify', lambda: None)
+    return request.param
+
+def _follow(path, *options):
+    """Follow a log on a daemon thread; its lines arrive on a queue."""
+    stop = threading.Event()
+    lines = queue.Queue()
+    query = LogQuery(path, 'follow', list(options))
+
+    def run():
+        for line in read_log(query, stop):
+            lines.put(line['text'])
+        lines.put(None)
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    return stop, lines, worker
+
+def _take(lines, count):
+    return [lines.get(timeout=10.0) for _ in range(count)]
+
+def test_follow_yields_the_tail_then_new_lines_until_stopped(tmp_path, following):
+    path = _log(tmp_path, b'old 1\nold 2\nold 3\n')
+    stop, lines, worker = _follow(path, 'count=2', 'pattern=[0-9]', 'regex=1')
+    assert _take(lines, 2) == ['old 2', 'old 3']
+    time.sleep(0.1)
+    with open(path, 'ab') as fh:
+        fh.write(b'new 1\nskip\nnew')
+        fh.flush()
+        time.sleep(0.1)
+        fh.write(b' 2\n')
+    assert _take(lines, 2) == ['new 1', 'new 2']
+
+    stop.set()
+    worker.join(10.0)
+    assert not worker.is_alive()
+    assert lines.get_nowait() is None
+
+def test_follow_restarts_after_truncation_and_rotation(tmp_path, following):
+    path = _log(tmp_path, b'first\n')
+    stop, lines, worker = _follow(path, 'count=1')
+    assert _take(lines, 1) == ['first']
+    time.sleep(0.1)
+    # Shorter than before, so polling sees the truncation too
+    with open(path, 'wb') as fh:
+        fh.write(b'two\n')
+    assert _take(lines, 1) == ['two']
+
+    os.rename(path, path + '.1')
+    with open(path, 'wb') as fh:
+        fh.write(b'three\n')
+    assert _take(lines, 1) == ['three']
+    stop.set()
+    worker.join(10.0)
+    assert not worker.is_alive()
@@ -0,0 +1,79 @@
+"""Tests for the metrics registry and its exporters."""
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.metrics import INTENTS, MetricsRegistry
+
+def test_counters_sum_the_shards_of_every_thread():
+    registry = MetricsRegistry()
+    counter = registry.counter('jobs_total', 'Jobs', ('kind',))
+
+    def work():
+        for _ in range(1000):
+            counter.inc('a')
+        counter.inc('b', amount=2)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.values() == {('a',): 8000, ('b',): 16}
+
+def test_histogram_buckets_are_cumulative_in_the_exposition():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, 'run')
+    assert registry.render_prometheus().splitlines() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{stage="run",le="0.1"} 1',
+        'latency_seconds_bucket{stage="run",le="1.0"} 3',
+        'latency_seconds_bucket{stage="run",le="+Inf"} 4',
+        'latency_seconds_sum{stage="run"} 6.05',
+        'latency_seconds_count{stage="run"} 4',
+    ]
+    [series] = registry.snapshot()['metrics']['latency_seconds']['series']
+    assert series['count'] == 4 and series['buckets'] == {'0.1': 1, '1.0': 2, '+Inf': 1}
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter('blocked_total', 'Blocked', ('rule',)).inc('a "quoted"\\rule')
+    assert 'blocked_total{rule="a \\"quoted\\"\\\\rule"} 1' in registry.render_prometheus()
+
+def test_conflicting_registration_is_refused():
+    registry = MetricsRegistry()
+    counter = registry.counter('x_total', 'X', ('a',))
+    assert registry.counter('x_total', 'X', ('a',)) is counter
+    with pytest.raises(ValueError):
+        registry.histogram('x_total', 'X', ('a',))
+
+def test_snapshot_file_and_reset(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter('x_total', 'X').inc()
+    registry.write_snapshot(str(tmp_path / 'metrics.json'))
+    data = json.loads((tmp_path / 'metrics.json').read_text())
+    assert data['metrics']['x_total']['series'] == [{'labels': {}, 'value': 1}]
+    registry.reset()
+    assert registry.snapshot()['metrics']['x_total']['series'] == []
+
+def test_http_endpoint_serves_both_formats():
+    registry = MetricsRegistry()
+    registry.counter('x_total', 'X').inc()
+    host, port = registry.serve(port=0)
+    try:
+        with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=10) as response:
+            assert 'x_total 1' in response.read().decode()
+        with urllib.request.urlopen(f'http://{host}:{port}/metrics.json', timeout=10) as response:
+            assert json.loads(response.read())['metrics']['x_total']['type'] == 'counter'
+    finally:
+        registry.stop_serving()
+
+def test_interpreting_counts_the_intent():
+    before = INTENTS.values().get(('LIST_FILES',), 0)
+    CommandGenerator().candidates('list files', 1)
+    assert INTENTS.values().get(('LIST_FILES',), 0) == before + 1
@@ -0,0 +1,33 @@
+"""Tests for the delete engine."""
+import os
+
+from hcmd.core.remover import delete_tree, plan_delete
+
+def test_delete_tree_removes_everything(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'a' / 'b' / 'f.txt').write_text('x')
+    (root / 'g.txt').write_text('y')
+    os.symlink('/etc', root / 'link')
+
+    stats = delete_tree(str(root))
+    assert stats['errors'] == []
+    assert not root.exists()
+    assert os.path.isdir('/etc')
+
+def test_directory_swapped_for_link_is_not_followed(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'sub' / 'keep.txt').write_text('inside')
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'keep.txt').write_text('outside')
+
+    plan = plan_delete(str(root))
+    # Swap the directory for a link after the walk, before the delete
+    os.rename(root / 'sub', tmp_path / 'moved')
+    os.symlink(outside, root / 'sub')
+
+    stats = delete_tree(str(root), plan=plan)
+    assert stats['errors']
+    assert (outside / 'keep.txt').read_text() == 'outside'
@@ -0,0 +1,78 @@
+"""Tests for the result cache of read-only commands."""
+import time
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.command import CACHE_TTL, CACHE_WATCH, MODE_ARGV, Command
+from hcmd.core.executor import CommandExecutor
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.resultcache import ResultCache
+
+def _listing(watch='.', policy=CACHE_WATCH, argv=('ls', '-1')):
+    return Command(CommandType.LIST_FILES, MODE_ARGV, ' '.join(argv), 'linux', argv=argv,
+                   cache_policy=policy, watch_paths=(watch,) if policy == CACHE_WATCH else ())
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'stamps'])
+def cache(request):
+    cache = ResultCache(use_inotify=request.param)
+    yield cache
+    cache.close()
+
+def test_write_in_a_watched_directory_invalidates(tmp_path, cache):
+    command = _listing()
+    assert cache.put(command, (0, 'a\n', ''), cwd=str(tmp_path))
+    assert cache.get(command, cwd=str(tmp_path)) == (0, 'a\n', '')
+    (tmp_path / 'b').write_text('b')
+    assert cache.get(command, cwd=str(tmp_path)) is None
+
+def test_delete_and_rename_invalidate(tmp_path, cache):
+    (tmp_path / 'a').write_text('a')
+    command = _listing()
+    cache.put(command, (0, 'a\n', ''), cwd=str(tmp_path))
+    (tmp_path / 'a').rename(tmp_path / 'c')
+    assert cache.get(command, cwd=str(tmp_path)) is None
+    cache.put(command, (0, 'c\n', ''), cwd=str(tmp_path))
+    (tmp_path / 'c').unlink()
+    assert cache.get(command, cwd=str(tmp_path)) is None
+
+def test_writes_elsewhere_keep_the_result(tmp_path, cache):
+    (tmp_path / 'watched').mkdir()
+    command = _listing('watched')
+    cache.put(command, (0, 'x\n', ''), cwd=str(tmp_path))
+    (tmp_path / 'other.txt').write_text('x')
+    assert cache.get(command, cwd=str(tmp_path)) == (0, 'x\n', '')
+
+def test_ttl_results_expire(tmp_path):
+    cache = ResultCache(ttl=0.05, use_inotify=False)
+    command = _listing(policy=CACHE_TTL, argv=('docker', 'ps'))
+    cache.put(command, (0, 'ids', ''), cwd=str(tmp_path))
+    assert cache.get(command, cwd=str(tmp_path)) == (0, 'ids', '')
+    time.sleep(0.1)
+    assert cache.get(command, cwd=str(tmp_path)) is None
+
+def test_failures_and_uncacheable_commands_are_not_stored(tmp_path):
+    cache = ResultCache(use_inotify=False)
+    assert not cache.put(_listing(), (2, '', 'No such file'), cwd=str(tmp_path))
+    assert not cache.put(_listing(policy=None), (0, 'x', ''), cwd=str(tmp_path))
+    assert cache.stats()['entries'] == 0
+
+def test_cache_is_bounded(tmp_path):
+    cache = ResultCache(max_entries=2, use_inotify=False)
+    for name in ('a', 'b', 'c'):
+        cache.put(_listing(argv=('ls', name)), (0, name, ''), cwd=str(tmp_path))
+    assert cache.get(_listing(argv=('ls', 'a')), cwd=str(tmp_path)) is None
+    assert cache.get(_listing(argv=('ls', 'c')), cwd=str(tmp_path)) == (0, 'c', '')
+
+def test_executor_serves_listings_until_a_write(tmp_path):
+    cache = ResultCache()
+    executor = CommandExecutor(cache=cache)
+    command = CommandGenerator().build_command(CommandType.LIST_FILES, [str(tmp_path)])
+    assert command.is_cacheable
+    executor.run(command, cwd=str(tmp_path))
+    assert executor.run(command, cwd=str(tmp_path))[2]['cached']
+    (tmp_path / 'new.txt').write_text('x')
+    success, output, details = executor.run(command, cwd=str(tmp_path))
+    assert success and not details['cached']
+    assert 'new.txt' in output
+    cache.close()
@@ -0,0 +1,73 @@
+"""Tests for the precompiled rule snapshot."""
+import json
+import os
+import re
+
+import pytest
+
+from hcmd.core import rules
+from hcmd.core.rules import PATTERN_FLAGS, build_snapshot, compile_rules, load_rules, snapshot_path
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    monkeypatch.setenv('HCMD_HOME', str(tmp_path / 'home'))
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({
+        'templates': {'list_files': {'linux': 'ls -lah {path}'}, 'custom': 'echo {path}'},
+        'aliases': {'Proj': '~/code/project'},
+        'phrases': {'list_files': ['Show Me The Files In']},
+        'dangerous_patterns': [r'git\s+push\s+--force', '(unclosed'],
+    }))
+    return str(path)
+
+def _plain(rule_set):
+    """A RuleSet as plain data, patterns by their source and flags."""
+    return ({key: dict(platforms) for key, platforms in rule_set.templates.items()}, dict(rule_set.aliases),
+            {intent: tuple(phrases) for intent, phrases in rule_set.phrases.items()},
+            [(source, regex.pattern, regex.flags) for source, regex in rule_set.dangerous])
+
+def test_snapshot_load_equals_the_source_rules(rules_file):
+    build_snapshot(rules_file)
+    loaded = rules._materialize(rules._load_snapshot(rules_file))
+    source = compile_rules(rules_file)
+    assert _plain(loaded) == (
+        source['templates'], source['aliases'],
+        {intent: tuple(phrases) for intent, phrases in source['phrases'].items()},
+        [(pattern, pattern, re.compile(pattern, PATTERN_FLAGS).flags) for pattern, _ in source['dangerous']])
+    assert loaded.templates['list_files']['linux'] == 'ls -lah {path}'
+    assert loaded.templates['custom']['windows'] == 'echo {path}'
+    assert loaded.aliases['proj'] == '~/code/project'
+    assert 'show me the files in' in loaded.phrases['list_files']
+
+def test_precompiled_patterns_match_like_re(rules_file):
+    build_snapshot(rules_file)
+    loaded = rules._materialize(rules._load_snapshot(rules_file))
+    samples = ['rm -rf /', 'GIT PUSH --force origin', 'ls -la', 'dd if=/dev/zero of=/dev/sda', 'echo hi']
+    for source, regex in loaded.dangerous:
+        expected = re.compile(source, PATTERN_FLAGS)
+        assert [bool(regex.search(s)) for s in samples] == [bool(expected.search(s)) for s in samples]
+    assert '(unclosed' not in [source for source, _ in loaded.dangerous]
+
+def test_snapshot_is_rebuilt_when_the_rules_file_changes(rules_file):
+    build_snapshot(rules_file)
+    assert rules._load_snapshot(rules_file) is not None
+    with open(rules_file, 'w') as fh:
+        json.dump({'aliases': {'work': '~/work/stuff'}}, fh)
+    assert rules._load_snapshot(rules_file) is None
+    assert load_rules(rules_file, refresh=True).aliases['work'] == '~/work/stuff'
+    assert rules._load_snapshot(rules_file)['aliases']['work'] == '~/work/stuff'
+
+def test_corrupt_or_foreign_snapshot_is_ignored(rules_file):
+    build_snapshot(rules_file)
+    with open(snapshot_path(rules_file), 'wb') as fh:
+        fh.write(b'not marshal data')
+    assert rules._load_snapshot(rules_file) is None
+    assert load_rules(rules_file, refresh=True).aliases['proj'] == '~/code/project'
+    assert os.path.getsize(snapshot_path(rules_file)) > 100
+
+def test_rules_are_read_only(rules_file):
+    rule_set = load_rules(rules_file, refresh=True)
+    with pytest.raises(TypeError):
+        rule_set.aliases['x'] = 'y'
+    with pytest.raises(TypeError):
+        rule_set.templates['list_files']['linux'] = 'rm -rf {path}'
@@ -0,0 +1,102 @@
+"""Tests for the priority scheduler and its per-type caps."""
+import threading
+import time
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.command import MODE_NATIVE, Command
+from hcmd.core.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Scheduler
+
+class _BlockingExecutor:
+    """Runs nothing; each command waits for its gate and records how many ran at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+        self.started = []
+        self.gates = {}
+        self.released = False
+
+    def gate(self, label):
+        with self.lock:
+            gate = self.gates.setdefault(label, threading.Event())
+            if self.released:
+                gate.set()
+            return gate
+
+    def release_all(self):
+        with self.lock:
+            self.released = True
+            for gate in self.gates.values():
+                gate.set()
+
+    def run(self, command, cwd=None, progress=None, limits=None):
+        label = command.display
+        with self.lock:
+            kind = command.command_type
+            self.running[kind] = self.running.get(kind, 0) + 1
+            self.peak[kind] = max(self.peak.get(kind, 0), self.running[kind])
+            self.started.append(label)
+        self.gate(label).wait(10.0)
+        with self.lock:
+            self.running[kind] -= 1
+        return True, label, {}
+
+def _command(command_type, label):
+    return Command(command_type, MODE_NATIVE, label, 'linux', verdict=(True, ''))
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 10.0
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+@pytest.fixture
+def executor():
+    executor = _BlockingExecutor()
+    yield executor
+    executor.release_all()
+
+def test_capped_type_runs_one_at_a_time(executor):
+    scheduler = Scheduler(executor, workers=4, reserved=0, caps={CommandType.COPY: 1})
+    copies = [scheduler.submit(_command(CommandType.COPY, f'copy{i}')) for i in range(3)]
+    lists = [scheduler.submit(_command(CommandType.LIST_FILES, f'list{i}')) for i in range(2)]
+
+    _wait_for(lambda: {'copy0', 'list0', 'list1'} <= set(executor.started))
+    assert 'copy1' not in executor.started
+    assert scheduler.stats()['running_by_type'] == {'COPY': 1, 'LIST_FILES': 2}
+    for label in ('list0', 'list1'):
+        executor.gate(label).set()
+    assert [future.result(10.0)[1] for future in lists] == ['list0', 'list1']
+    assert 'copy1' not in executor.started
+
+    for i in range(3):
+        executor.gate(f'copy{i}').set()
+    assert [future.result(10.0)[1] for future in copies] == ['copy0', 'copy1', 'copy2']
+    assert executor.peak[CommandType.COPY] == 1
+    assert executor.started.index('copy1') < executor.started.index('copy2')
+    scheduler.shutdown()
+
+def test_batch_jobs_leave_the_reserved_worker_to_interactive_ones(executor):
+    scheduler = Scheduler(executor, workers=2, reserved=1, caps={})
+    batch = [scheduler.submit(_command(CommandType.FIND, f'b{i}'), PRIORITY_BATCH) for i in range(2)]
+    _wait_for(lambda: 'b0' in executor.started)
+    interactive = scheduler.submit(_command(CommandType.FIND, 'i0'), PRIORITY_INTERACTIVE)
+    _wait_for(lambda: 'i0' in executor.started)
+    assert 'b1' not in executor.started
+    executor.gate('i0').set()
+    success, output, details = interactive.result(10.0)
+    assert (success, output, details['priority']) == (True, 'i0', 'interactive')
+
+    executor.gate('b0').set()
+    executor.gate('b1').set()
+    assert [future.result(10.0)[1] for future in batch] == ['b0', 'b1']
+    stats = scheduler.stats()
+    assert stats['batch']['completed'] == 2 and stats['interactive']['completed'] == 1
+    scheduler.shutdown()
+
+def test_invalid_configuration_is_refused():
+    with pytest.raises(ValueError):
+        Scheduler(_BlockingExecutor(), workers=2, reserved=2)
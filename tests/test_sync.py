@@ -0,0 +1,39 @@
+"""Tests for the incremental sync engine."""
+from hcmd.core.sync import TreeSync
+
+def _sync(src, dest, manifests, **kwargs):
+    return TreeSync(str(src), str(dest), manifest_dir=str(manifests), **kwargs).run()
+
+def test_repeated_sync_keeps_its_first_target(tmp_path):
+    src = tmp_path / 'docs'
+    src.mkdir()
+    (src / 'a.txt').write_text('a')
+    dest = tmp_path / 'backup'
+    manifests = tmp_path / 'manifests'
+    manifests.mkdir()
+
+    first = _sync(src, dest, manifests)
+    assert first['target'] == str(dest)
+    assert first['files_done'] == 1
+
+    second = _sync(src, dest, manifests)
+    assert second['target'] == str(dest)
+    assert second['files_done'] == 0
+    assert second['files_unchanged'] == 1
+    assert not (dest / 'docs').exists()
+
+def test_sync_into_existing_directory_uses_cp_rules(tmp_path):
+    src = tmp_path / 'docs'
+    src.mkdir()
+    (src / 'a.txt').write_text('a')
+    dest = tmp_path / 'backup'
+    dest.mkdir()
+    manifests = tmp_path / 'manifests'
+    manifests.mkdir()
+
+    assert _sync(src, dest, manifests)['target'] == str(dest / 'docs')
+    (src / 'b.txt').write_text('b')
+    stats = _sync(src, dest, manifests)
+    assert stats['target'] == str(dest / 'docs')
+    assert stats['files_done'] == 1
+    assert (dest / 'docs' / 'b.txt').read_text() == 'b'
@@ -0,0 +1,65 @@
+"""Tests for sharing the generator and its process-wide caches between threads."""
+import threading
+
+from hcmd.core import scaling
+from hcmd.core.fuzzy import get_index
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.language import PACK_DIR, get_pack
+
+THREADS = 8
+
+def _together(work):
+    """Run ``work(slot)`` on THREADS threads released at once; their results by slot."""
+    start = threading.Barrier(THREADS)
+    results = [None] * THREADS
+    errors = []
+
+    def run(slot):
+        start.wait()
+        try:
+            results[slot] = work(slot)
+        except BaseException as error:
+            errors.append(error)
+    workers = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10.0)
+    assert not any(worker.is_alive() for worker in workers)
+    assert errors == []
+    return results
+
+def _ranked(generator, text):
+    return [(c.command_type, c.args, c.command.display, c.score) for c in generator.candidates(text)]
+
+def test_shared_generator_matches_a_single_thread():
+    reference = CommandGenerator()
+    expected = [(reference.interpret_natural_language(text), _ranked(reference, text))
+                for text in scaling.SAMPLE_INPUTS]
+    # A fresh generator, so its lazy caches are first filled concurrently
+    shared = CommandGenerator()
+    results = _together(lambda slot: [(shared.interpret_natural_language(text), _ranked(shared, text))
+                                      for text in scaling.SAMPLE_INPUTS[slot:] + scaling.SAMPLE_INPUTS[:slot]])
+    for slot, result in enumerate(results):
+        assert result == expected[slot:] + expected[:slot]
+
+def test_whole_pipeline_has_no_mismatches_under_threads():
+    generator = CommandGenerator()
+    expected = [scaling.translate(generator, text) for text in scaling.SAMPLE_INPUTS]
+    done, wrong = scaling.measure(CommandGenerator(), 4, 0.2, expected)
+    assert done > 0
+    assert wrong == 0
+
+def test_spelling_index_is_built_once_per_vocabulary():
+    vocabulary = ('threadsafe', 'vocabulary', 'index', 'built', 'once')
+    indexes = _together(lambda slot: get_index(vocabulary))
+    assert all(index is indexes[0] for index in indexes)
+    assert indexes[0] is get_index(list(vocabulary))
+
+def test_phrase_pack_is_loaded_once(tmp_path):
+    (tmp_path / 'es.tsv').write_text('ve a\tgo to\n', encoding='utf-8')
+    packs = _together(lambda slot: get_pack('es', str(tmp_path)))
+    assert packs[0] is not None
+    assert all(pack is packs[0] for pack in packs)
+    assert packs[0] is not get_pack('es', PACK_DIR)
+    assert _together(lambda slot: get_pack('xx', str(tmp_path))) == [None] * THREADS
@@ -0,0 +1,95 @@
+"""Tests for the tree copy/move engine."""
+import os
+import shutil
+import threading
+
+from hcmd.core import transfer
+from hcmd.core.transfer import TreeTransfer
+
+_copy_file = transfer.copy_file
+
+def _make_tree(root, names=('a.txt', 'b.txt', 'sub/c.txt')):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return root
+
+def _fail_on(monkeypatch, failing):
+    """Make copy_file fail for one file, as an interrupted transfer would."""
+    def copy_file(src, dst, st=None):
+        if src.endswith(failing):
+            raise OSError(5, 'Input/output error')
+        return _copy_file(src, dst, st)
+    monkeypatch.setattr(transfer, 'copy_file', copy_file)
+
+def test_resume_recopies_files_removed_from_target(tmp_path, monkeypatch):
+    src = _make_tree(tmp_path / 'src')
+    dest = tmp_path / 'dest'
+    journals = tmp_path / 'journals'
+    journals.mkdir()
+
+    _fail_on(monkeypatch, 'c.txt')
+    first = TreeTransfer(str(src), str(dest), journal_dir=str(journals)).run()
+    assert first['errors']
+    monkeypatch.undo()
+
+    shutil.rmtree(dest)
+    second = TreeTransfer(str(src), str(dest), journal_dir=str(journals)).run()
+    assert second['errors'] == []
+    assert second['files_skipped'] == 0
+    assert sorted(os.listdir(dest)) == ['a.txt', 'b.txt', 'sub']
+    assert (dest / 'sub' / 'c.txt').read_text() == 'sub/c.txt'
+
+def test_resume_skips_files_still_in_target(tmp_path, monkeypatch):
+    src = _make_tree(tmp_path / 'src')
+    dest = tmp_path / 'dest'
+    journals = tmp_path / 'journals'
+    journals.mkdir()
+
+    _fail_on(monkeypatch, 'c.txt')
+    TreeTransfer(str(src), str(dest), journal_dir=str(journals)).run()
+    monkeypatch.undo()
+
+    (dest / 'b.txt').write_text('changed in the target')
+    stats = TreeTransfer(str(src), str(dest), journal_dir=str(journals)).run()
+    assert stats['files_skipped'] == 1
+    assert (dest / 'b.txt').read_text() == 'b.txt'
+
+def test_resumed_move_keeps_source_until_target_is_complete(tmp_path, monkeypatch):
+    src = _make_tree(tmp_path / 'src')
+    dest = tmp_path / 'dest'
+    journals = tmp_path / 'journals'
+    journals.mkdir()
+    # As across filesystems: no single rename
+    monkeypatch.setattr(TreeTransfer, '_try_rename', lambda self, target: False)
+
+    _fail_on(monkeypatch, 'c.txt')
+    TreeTransfer(str(src), str(dest), move=True, journal_dir=str(journals)).run()
+    monkeypatch.setattr(transfer, 'copy_file', _copy_file)
+
+    shutil.rmtree(dest)
+    stats = TreeTransfer(str(src), str(dest), move=True, journal_dir=str(journals)).run()
+    assert stats['errors'] == []
+    assert not src.exists()
+    assert (dest / 'a.txt').read_text() == 'a.txt'
+    assert (dest / 'sub' / 'c.txt').read_text() == 'sub/c.txt'
+
+def _run_with_timeout(func, timeout=10.0):
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(value=func()), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), 'transfer blocked'
+    return result['value']
+
+def test_fifo_is_recreated_not_opened(tmp_path):
+    src = _make_tree(tmp_path / 'src', ('a.txt',))
+    os.mkfifo(src / 'pipe')
+    dest = tmp_path / 'dest'
+
+    stats = _run_with_timeout(lambda: TreeTransfer(str(src), str(dest),
+                                                   journal_dir=str(tmp_path)).run())
+    assert stats['errors'] == []
+    assert (dest / 'pipe').is_fifo()
+    assert (dest / 'a.txt').read_text() == 'a.txt'
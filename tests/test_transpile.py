@@ -0,0 +1,109 @@
+"""Tests for translating runbooks into per-platform scripts."""
+import io
+import os
+
+import pytest
+
+from hcmd import cli
+from hcmd.constants import CommandType
+from hcmd.core import transpile as transpile_module
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.transpile import TARGETS, Transpiler, transpile
+
+RUNBOOK = """# Build notes
+1. create a folder named build
+
+- list files
+Step 2: delete build.log
+???
+delete /etc
+"""
+
+EXPECTED = {
+    'linux': """#!/usr/bin/env bash
+set -euo pipefail
+# Build notes
+# create a folder named build
+mkdir -p "build"
+
+# list files
+ls -la .
+# delete build.log
+rm -f "build.log"
+# hcmd: line 6 not translated (not understood): ???
+# hcmd: line 7 not translated (unsafe: Attempting to delete root or system directories is not allowed): delete /etc
+""",
+    'windows': """$ErrorActionPreference = 'Stop'
+# Build notes
+# create a folder named build
+New-Item -ItemType Directory -Path "build"
+
+# list files
+Get-ChildItem -Force "."
+# delete build.log
+Remove-Item -Path "build.log" -Force
+# hcmd: line 6 not translated (not understood): ???
+# hcmd: line 7 not translated (unsafe: Attempting to delete root or system directories is not allowed): delete /etc
+""",
+}
+EXPECTED['darwin'] = EXPECTED['linux']
+
+def _run(text, targets=TARGETS):
+    outputs = {target: io.StringIO() for target in targets}
+    reported = []
+    stats = transpile(io.StringIO(text), outputs, reported.append)
+    return stats, {target: out.getvalue() for target, out in outputs.items()}, reported
+
+@pytest.mark.parametrize('target', TARGETS)
+def test_single_target_script(target):
+    stats, scripts, reported = _run(RUNBOOK, (target,))
+    assert scripts == {target: EXPECTED[target]}
+    assert stats == {'lines': 7, 'steps': 5, 'translated': 3, 'untranslated': 2}
+    assert [(step.line, step.text) for step in reported] == [(6, '???'), (7, 'delete /etc')]
+
+def test_all_targets_are_written_in_one_pass(monkeypatch):
+    calls = []
+    interpret = CommandGenerator.interpret_natural_language
+    monkeypatch.setattr(CommandGenerator, 'interpret_natural_language',
+                        lambda self, text: calls.append(text) or interpret(self, text))
+    stats, scripts, _ = _run(RUNBOOK + RUNBOOK)
+    for target in TARGETS:
+        assert scripts[target].startswith(EXPECTED[target])
+        assert scripts[target].endswith('# hcmd: line 13 not translated (not understood): ???\n'
+                                        '# hcmd: line 14 not translated (unsafe: Attempting to delete root or '
+                                        'system directories is not allowed): delete /etc\n')
+    assert stats['steps'] == 10
+    # Every distinct step is interpreted once, whatever the number of targets and repeats
+    assert sorted(calls) == sorted(['create a folder named build', 'list files', 'delete build.log', '???',
+                                    'delete /etc'])
+
+def test_home_directory_is_left_to_the_script():
+    _, scripts, _ = _run("copy notes.txt to ~/backup/notes.txt\ngo to downloads\n")
+    home = os.path.expanduser('~')
+    assert all(home not in script for script in scripts.values())
+    assert 'cp -r "notes.txt" "$HOME/backup/notes.txt"\n' in scripts['linux']
+    assert 'cd ~/Downloads\n' in scripts['darwin']
+    assert '-Destination "$env:USERPROFILE\\backup\\notes.txt"' in scripts['windows']
+    assert 'cd $env:USERPROFILE\\Downloads\n' in scripts['windows']
+
+def test_memo_is_bounded():
+    transpiler = Transpiler(('linux',), memo_size=2)
+    for text in ('list files', 'delete a.txt', 'delete b.txt', 'list files'):
+        transpiler.translate(text)
+    assert list(transpiler._memo) == ['delete b.txt', 'list files']
+    assert transpiler.translate('DELETE B.TXT')[0] == CommandType.DELETE
+
+@pytest.mark.parametrize('targets', [('bash',), ()])
+def test_unknown_target_is_refused(targets):
+    with pytest.raises(ValueError):
+        Transpiler(targets)
+
+def test_cli_writes_one_script_per_platform(tmp_path, capsys):
+    runbook = tmp_path / 'deploy.txt'
+    runbook.write_text(RUNBOOK)
+    assert cli.transpile_file(str(runbook), 'all', None, as_json=False) == 1
+    for target in TARGETS:
+        script = tmp_path / f"deploy.{target}{transpile_module.SCRIPT_SUFFIXES[target]}"
+        assert script.read_text() == EXPECTED[target]
+        assert bool(os.stat(script).st_mode & 0o111) == (target != 'windows')
+    assert '3/5 step(s) translated' in capsys.readouterr().err
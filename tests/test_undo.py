@@ -0,0 +1,75 @@
+"""Tests for the undo journal and the commands that record into it."""
+import errno
+import os
+
+from hcmd.constants import CommandType
+from hcmd.core import transfer
+from hcmd.core.executor import CommandExecutor
+from hcmd.core.generator import CommandGenerator
+from hcmd.core.undo import UndoJournal
+
+def _journal(tmp_path):
+    (tmp_path / 'undo').mkdir()
+    return UndoJournal(journal_dir=str(tmp_path / 'undo'))
+
+def test_failed_staging_voids_its_record(tmp_path, monkeypatch):
+    journal = _journal(tmp_path)
+    victim = tmp_path / 'notes.txt'
+    victim.write_text('x')
+
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+    monkeypatch.setattr(os, 'rename', cross_device)
+    txid = journal.begin(f"delete {victim}")
+    assert journal.stage(txid, str(victim)) is None
+    journal.end(txid)
+    monkeypatch.undo()
+
+    assert [tx.ops for tx in journal.transactions()] == [[]]
+
+def test_failed_staging_reports_a_permanent_delete(tmp_path, monkeypatch):
+    victim = tmp_path / 'old'
+    victim.mkdir()
+    (victim / 'a.txt').write_text('a')
+    executor = CommandExecutor(journal=_journal(tmp_path))
+    monkeypatch.setattr(UndoJournal, 'stage', lambda self, txid, path, overwrite=False: None)
+
+    success, message, _ = executor.execute_native(CommandType.DELETE, [str(victim)])
+    assert success
+    assert 'permanent' in message
+    assert not victim.exists()
+
+def test_undo_removes_every_directory_mkdir_created(tmp_path):
+    journal = _journal(tmp_path)
+    (tmp_path / 'a').mkdir()
+    command = CommandGenerator().build_command(CommandType.CREATE, ['a/b/c/d'])
+    success, _, _ = CommandExecutor(journal=journal).run(command, cwd=str(tmp_path))
+    assert success
+    assert (tmp_path / 'a' / 'b' / 'c' / 'd').is_dir()
+
+    [tx] = journal.transactions()
+    assert [op[1] for op in tx.ops] == [str(tmp_path / 'a' / 'b'), str(tmp_path / 'a' / 'b' / 'c'),
+                                       str(tmp_path / 'a' / 'b' / 'c' / 'd')]
+    journal.undo()
+    assert not (tmp_path / 'a' / 'b').exists()
+    assert (tmp_path / 'a').is_dir()
+
+def test_failed_transfer_puts_back_the_overwritten_file(tmp_path, monkeypatch):
+    journal = _journal(tmp_path)
+    (tmp_path / 'new.txt').write_text('new')
+    target = tmp_path / 'out.txt'
+    target.write_text('old')
+
+    def disk_full(src, dest, move=False, progress=None):
+        with open(dest, 'w') as fh:
+            fh.write('ne')
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(transfer, 'transfer_tree', disk_full)
+
+    success, message, _ = CommandExecutor(journal=journal).execute_native(
+        CommandType.COPY, [str(tmp_path / 'new.txt'), str(target)])
+    assert not success
+    assert target.read_text() == 'old'
+    [tx] = journal.transactions()
+    assert tx.ended and tx.undone
+    assert journal.undo()['transaction'] is None
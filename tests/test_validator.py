@@ -0,0 +1,79 @@
+"""Tests for command validation."""
+import os
+
+import pytest
+
+from hcmd.constants import CommandType
+from hcmd.core.executor import CommandExecutor
+from hcmd.core.validator import (extract_paths, is_path_protected, is_process_protected, is_system_destination,
+                                 validate_command_type)
+
+@pytest.mark.parametrize('path', ['/usr/lib', '/etc/ssh', '/etc', '/var/log', '/boot/efi',
+                                  '/lib/modules', '/sbin/init', '/opt/app', '/', '/home', '~'])
+def test_delete_below_system_directory_is_refused(path):
+    assert is_path_protected(path)
+    assert not validate_command_type(CommandType.DELETE, [path])[0]
+
+@pytest.mark.parametrize('path', ['/tmp/scratch', '~/Documents/old.txt', '/etcetera', 'build'])
+def test_delete_elsewhere_is_allowed(path):
+    assert not is_path_protected(path)
+    assert validate_command_type(CommandType.DELETE, [path])[0]
+
+def test_home_below_system_directory_stays_usable(monkeypatch):
+    monkeypatch.setenv('HOME', '/var/lib/service')
+    assert is_path_protected('/var/lib/service')
+    assert not is_path_protected('/var/lib/service/cache')
+    assert is_path_protected('/var/lib/other')
+
+@pytest.mark.parametrize('text, paths', [
+    ('projects/snlp', ['projects/snlp']),
+    ('move a/b /tmp/c', ['a/b', '/tmp/c']),
+    ('copy src/x.txt /tmp/rv/dst', ['src/x.txt', '/tmp/rv/dst']),
+    ('open ./docs/readme.md', ['./docs/readme.md']),
+])
+def test_extract_paths_in_typed_order_without_fragments(text, paths):
+    assert extract_paths(text) == paths
+
+@pytest.mark.parametrize('dest', ['/etc', '/etc/cron.d', '/var/lib', '/usr/local/bin', '/boot', '/'])
+def test_extract_into_system_directory_is_refused(dest):
+    assert is_system_destination(dest)
+    assert not validate_command_type(CommandType.EXTRACT, ['x.tar.gz', dest])[0]
+    assert not validate_command_type(CommandType.COPY, ['x.txt', dest])[0]
+
+@pytest.mark.parametrize('dest', ['.', '~', '~/Downloads', '/tmp/out'])
+def test_extract_elsewhere_is_allowed(dest):
+    assert validate_command_type(CommandType.EXTRACT, ['x.tar.gz', dest])[0]
+
+@pytest.mark.parametrize('src', ['/etc', '/usr/lib', '~', '/'])
+def test_move_of_protected_source_is_refused(src):
+    assert not validate_command_type(CommandType.MOVE, [src, '/tmp/x'])[0]
+    assert validate_command_type(CommandType.COPY, [src, '/tmp/x'])[0]
+
+def test_move_of_protected_source_is_refused_natively(tmp_path):
+    success, message, _ = CommandExecutor().execute_native(CommandType.MOVE, ['/etc', str(tmp_path / 'x')])
+    assert not success
+    assert not (tmp_path / 'x').exists()
+
+@pytest.mark.parametrize('process', [
+    {'pid': 1, 'ppid': 0, 'name': 'bash'},
+    {'pid': 2, 'ppid': 0, 'name': 'kthreadd'},
+    {'pid': 812, 'ppid': 2, 'name': 'kworker/0:1'},
+    {'pid': 700, 'ppid': 1, 'name': 'init'},
+    {'pid': 701, 'ppid': 1, 'name': 'systemd'},
+    {'pid': 702, 'ppid': 1, 'name': 'sshd'},
+    {'pid': 703, 'ppid': 1, 'name': 'SSHD'},
+])
+def test_system_processes_are_protected(process):
+    assert is_process_protected(process)
+
+def test_own_shell_is_protected():
+    assert is_process_protected({'pid': os.getpid(), 'ppid': 1, 'name': 'python'})
+    assert is_process_protected({'pid': os.getppid(), 'ppid': 1, 'name': 'bash'})
+
+def test_user_process_is_not_protected():
+    assert not is_process_protected({'pid': 4242424, 'ppid': 1, 'name': 'firefox'})
+
+@pytest.mark.parametrize('args', [['pid', '1'], ['name', 'systemd'], ['name', 'sshd'], ['name', 'Init'],
+                                  ['name', 'fire*']])
+def test_kill_of_system_process_is_refused(args):
+    assert not validate_command_type(CommandType.KILL, args)[0]
@@ -0,0 +1,31 @@
+"""Tests for the parallel directory walker."""
+import threading
+
+from hcmd.core.walker import scan_tree
+
+def test_callback_exception_reaches_the_caller(tmp_path):
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).mkdir()
+
+    def prune(entry):
+        raise RuntimeError(f"bad entry {entry.name}")
+
+    result = {}
+
+    def walk():
+        try:
+            list(scan_tree(str(tmp_path), workers=2, prune=prune))
+        except RuntimeError as e:
+            result['error'] = e
+
+    worker = threading.Thread(target=walk, daemon=True)
+    worker.start()
+    worker.join(10.0)
+    assert not worker.is_alive(), 'walk blocked'
+    assert 'bad entry' in str(result['error'])
+
+def test_walk_reports_every_directory(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    (tmp_path / 'a' / 'f.txt').write_text('x')
+    paths = sorted(scanned.path for scanned in scan_tree(str(tmp_path)))
+    assert paths == sorted([str(tmp_path), str(tmp_path / 'a'), str(tmp_path / 'a' / 'b')])